@@ -1,14 +1,31 @@
 from flask import Flask, request, Response
 import xmltodict
 import os
+import hashlib
+from datetime import datetime, timedelta
+from itertools import chain, islice
 from flask_cors import CORS
-from datetime import datetime
-from modelos.factura import Factura
 
 
 # Importamos nuestros módulos
-from utilidades.manejador_xml import XMLManager 
+from utilidades.manejador_xml import XMLManager
+from utilidades.manejador_sqlite import SQLiteManager
+from utilidades.almacenamiento import TIPOS_DATOS, ELEMENTOS_DATOS, crear_manejador, filtrar_items
+from config import RUTA_SQLITE, LOTE_CARGA
 from utilidades.validadores import valida_fecha, valida_nit 
+from utilidades.fechas import (parsear_fecha, parsear_periodo, datetime_a_timestamp, timestamp_a_datetime,
+                               normalizar_fecha, timestamp_de)
+from utilidades.facturacion import MotorFacturacion, MarcasFacturacion
+from modelos.consumo import ConsumosColumnar
+from utilidades.resumen_diario import ResumenDiario
+from utilidades.version import versiones, firma_versiones
+from utilidades.cache import cache_previsualizaciones
+from utilidades.archivo_configuraciones import leer_archivo_configuraciones
+from utilidades.consumos_xml import iterar_consumos
+from utilidades.tarifas import actualizar_tarifas
+from utilidades.vigencia import indice_vigencia
+from utilidades.cargas import cola_cargas, estado_carga, guardar_cuerpo
+from utilidades.formatos import formato_respuesta, serializar, serializar_en_bloques
 
 app = Flask(__name__)
 CORS(app)  # Habilitamos CORS para permitir peticiones desde el frontend
@@ -16,43 +33,106 @@ CORS(app)  # Habilitamos CORS para permitir peticiones desde el frontend
 # Aseguramos que exista la carpeta de datos
 os.makedirs('datos', exist_ok=True)
 
-# Función para convertir a XML
+# Funciones para armar las respuestas. XML es el formato por omisión; con
+# Accept: application/json o application/msgpack se responde en ese formato
 def to_xml(data):
-    return Response(
-        xmltodict.unparse({"respuesta": data}, pretty=True),
-        mimetype="application/xml"
-    )
+    formato = formato_respuesta(request.accept_mimetypes)
+    return Response(serializar(data, formato), mimetype=formato)
+
+# Igual que to_xml, pero la respuesta se envía mientras se serializa; los iteradores
+# dentro de data se recorren item por item (ver xml_en_bloques). El primer bloque se arma
+# antes de responder: un error al empezar a leer los datos llega al try/except de la ruta
+# y se responde como error, en lugar de enviar una respuesta 200 cortada
+def to_xml_stream(data):
+    formato = formato_respuesta(request.accept_mimetypes)
+    bloques = serializar_en_bloques(data, formato)
+    primero = next(bloques)
+    return Response(chain([primero], bloques), mimetype=formato)
+
+# Consultas condicionales: el ETag de una consulta depende de la versión de los datos
+# que lee, de la URL y del formato, así se responde 304 sin abrir ningún archivo de datos
+def etag_consulta(*tipos):
+    firma = "|".join((firma_versiones(*tipos), request.full_path,
+                      formato_respuesta(request.accept_mimetypes)))
+    return hashlib.sha1(firma.encode('utf-8')).hexdigest()
+
+def con_etag(respuesta, etag):
+    respuesta.set_etag(etag)
+    # El cliente puede guardar la respuesta, pero debe revalidarla en cada uso
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    return respuesta
+
+def no_modificado(etag):
+    return con_etag(Response(status=304), etag)
 
 # Endpoint inicial para verificar que la API está funcionando
 @app.route('/', methods=['GET'])
 def index():
     return to_xml({"estado": "API en funcionamiento", "version": "1.0"})
 
+# Parámetros de /consultarDatos que no son filtros sobre los campos
+PARAMETROS_CONSULTA = ('tipo', 'desde', 'hasta', 'offset', 'limit', 'campos')
+
 # GET: Consultar datos (recursos, categorías, clientes, etc.)
 @app.route('/consultarDatos', methods=['GET'])
 def consultar_datos():
     try:
         tipo = request.args.get('tipo', 'recursos')  # Por defecto consulta recursos
         
-        # Mapeo de tipos a archivos XML
-        tipo_archivo = {
-            'recursos': 'recursos.xml',
-            'categorias': 'categorias.xml',
-            'clientes': 'clientes.xml',
-            'instancias': 'instancias.xml',
-            'consumos': 'consumos.xml',
-            'facturas': 'facturas.xml'
-        }
-        
-        if tipo not in tipo_archivo:
+        if tipo not in TIPOS_DATOS:
             return to_xml({"error": f"Tipo de datos '{tipo}' no válido"})
         
-        xml_manager = XMLManager(f'datos/{tipo_archivo[tipo]}')
-        datos = xml_manager.obtener_todos()
-        
-        # Construir respuesta según el tipo
-        respuesta = {tipo: {tipo[:-1]: datos if datos else []}}
-        return to_xml(respuesta)
+        # Paginación y proyección: ?offset=20&limit=10&campos=id,nombre. Cualquier otro
+        # parámetro es un filtro por igualdad sobre ese campo, por ejemplo ?id_cliente=3
+        try:
+            offset = int(request.args.get('offset', 0))
+            limite = int(request.args['limit']) if 'limit' in request.args else None
+        except ValueError:
+            return to_xml({"error": "offset y limit deben ser números enteros"})
+        if offset < 0 or (limite is not None and limite < 0):
+            return to_xml({"error": "offset y limit no pueden ser negativos"})
+        campos = [campo for campo in request.args.get('campos', '').split(',') if campo] or None
+        filtros = {clave: valor for clave, valor in request.args.items()
+                   if clave not in PARAMETROS_CONSULTA}
+        # Se pide un item de más para saber si hay otra página
+        limite_consulta = None if limite is None else limite + 1
+        
+        # Consulta por rango de fechas: ?tipo=consumos&desde=dd/mm/yyyy&hasta=dd/mm/yyyy
+        desde = request.args.get('desde')
+        hasta = request.args.get('hasta')
+        por_fecha = tipo == 'consumos' and (desde or hasta)
+        if por_fecha and (not desde or not hasta or not valida_fecha(desde) or not valida_fecha(hasta)):
+            return to_xml({"error": "Debe indicar desde y hasta con formato dd/mm/yyyy [hh:mm]"})
+        
+        # Si el cliente ya tiene esta misma respuesta no se lee nada más
+        etag = etag_consulta(tipo)
+        if request.if_none_match.contains(etag):
+            return no_modificado(etag)
+        
+        manejador = crear_manejador(tipo)
+        elemento = ELEMENTOS_DATOS[tipo]
+        if por_fecha:
+            fecha_inicio, fecha_fin = parsear_periodo(desde, hasta)
+            datos = filtrar_items(manejador.iterar_periodo(fecha_inicio, fecha_fin),
+                                  filtros, campos, offset, limite_consulta)
+        else:
+            datos = manejador.consultar(filtros, campos, offset, limite_consulta)
+        
+        # Sin límite los items se leen a medida que se envían; con límite solo se
+        # materializa la página pedida
+        if limite is None:
+            return con_etag(to_xml_stream({tipo: {elemento: datos}}), etag)
+        
+        pagina = list(datos)
+        return con_etag(to_xml_stream({
+            tipo: {elemento: pagina[:limite]},
+            "paginacion": {
+                "offset": offset,
+                "limit": limite,
+                "total_pagina": len(pagina[:limite]),
+                "hay_mas": len(pagina) > limite
+            }
+        }), etag)
     except Exception as e:
         return to_xml({"error": str(e)})
 
@@ -63,8 +143,9 @@ def crear_recurso():
         data = xmltodict.parse(request.data)
         nuevo_recurso = data["recurso"]
         
-        xml_manager = XMLManager('datos/recursos.xml')
-        xml_manager.agregar(nuevo_recurso)
+        manejador = crear_manejador('recursos')
+        manejador.agregar(nuevo_recurso)
+        actualizar_tarifas()
         
         return to_xml({"mensaje": "Recurso creado con éxito", "recurso": nuevo_recurso})
     except Exception as e:
@@ -77,8 +158,8 @@ def crear_categoria():
         data = xmltodict.parse(request.data)
         nueva_categoria = data["categoria"]
         
-        xml_manager = XMLManager('datos/categorias.xml')
-        xml_manager.agregar(nueva_categoria)
+        manejador = crear_manejador('categorias')
+        manejador.agregar(nueva_categoria)
         
         return to_xml({"mensaje": "Categoría creada con éxito", "categoria": nueva_categoria})
     except Exception as e:
@@ -95,8 +176,8 @@ def crear_cliente():
         if not valida_nit(nuevo_cliente.get("nit", "")):
             return to_xml({"error": "NIT inválido"})
         
-        xml_manager = XMLManager('datos/clientes.xml')
-        xml_manager.agregar(nuevo_cliente)
+        manejador = crear_manejador('clientes')
+        manejador.agregar(nuevo_cliente)
         
         return to_xml({"mensaje": "Cliente creado con éxito", "cliente": nuevo_cliente})
     except Exception as e:
@@ -109,8 +190,8 @@ def crear_instancia():
         data = xmltodict.parse(request.data)
         nueva_instancia = data["instancia"]
         
-        xml_manager = XMLManager('datos/instancias.xml')
-        xml_manager.agregar(nueva_instancia)
+        manejador = crear_manejador('instancias')
+        manejador.agregar(nueva_instancia)
         
         return to_xml({"mensaje": "Instancia creada con éxito", "instancia": nueva_instancia})
     except Exception as e:
@@ -120,92 +201,320 @@ def crear_instancia():
 @app.route('/crearConfiguracion', methods=['POST'])
 def crear_configuracion():
     try:
-        data = xmltodict.parse(request.data)
-        
-        if "configuracion" not in data:
-            return to_xml({"error": "Formato XML incorrecto"})
-        
-        config = data["configuracion"]
-        resultado = {
-            "recursos_creados": 0,
-            "categorias_creadas": 0,
-            "clientes_creados": 0,
-            "instancias_creadas": 0
-        }
-        
-        # Procesar recursos
-        if "recursos" in config and "recurso" in config["recursos"]:
-            recursos = config["recursos"]["recurso"]
-            recursos = [recursos] if not isinstance(recursos, list) else recursos
-            
-            xml_manager = XMLManager('datos/recursos.xml')
-            for recurso in recursos:
-                xml_manager.agregar(recurso)
-                resultado["recursos_creados"] += 1
-        
-        # Procesar categorías
-        if "categorias" in config and "categoria" in config["categorias"]:
-            categorias = config["categorias"]["categoria"]
-            categorias = [categorias] if not isinstance(categorias, list) else categorias
-            
-            xml_manager = XMLManager('datos/categorias.xml')
-            for categoria in categorias:
-                xml_manager.agregar(categoria)
-                resultado["categorias_creadas"] += 1
-        
-        # Procesar clientes
-        if "clientes" in config and "cliente" in config["clientes"]:
-            clientes = config["clientes"]["cliente"]
-            clientes = [clientes] if not isinstance(clientes, list) else clientes
-            
-            xml_manager = XMLManager('datos/clientes.xml')
-            for cliente in clientes:
-                if valida_nit(cliente.get("nit", "")):
-                    xml_manager.agregar(cliente)
-                    resultado["clientes_creados"] += 1
-        
-        # Procesar instancias
-        if "instancias" in config and "instancia" in config["instancias"]:
-            instancias = config["instancias"]["instancia"]
-            instancias = [instancias] if not isinstance(instancias, list) else instancias
-            
-            xml_manager = XMLManager('datos/instancias.xml')
-            for instancia in instancias:
-                xml_manager.agregar(instancia)
-                resultado["instancias_creadas"] += 1
-        
-        return to_xml({"mensaje": "Configuración cargada con éxito", "resultado": resultado})
+        # Con ?asincrono=1 se responde de inmediato con el id de la carga (ver /estadoCarga)
+        if request.args.get('asincrono') == '1':
+            return carga_encolada(cola_cargas.enviar('configuracion', procesar_configuracion, request.data))
+        return to_xml(procesar_configuracion(request.data))
     except Exception as e:
         return to_xml({"error": str(e)})
 
+def _como_lista(contenedor, clave):
+    """Elementos <clave> de una sección del XML, siempre como lista"""
+    if not contenedor or clave not in contenedor:
+        return []
+    elementos = contenedor[clave]
+    return [elementos] if not isinstance(elementos, list) else elementos
+
+def procesar_configuracion(contenido, progreso=None):
+    """
+    Guarda una configuración (el XML recibido) y retorna la respuesta de la carga;
+    ValueError si el formato no es válido. progreso es el RegistroCarga de una carga
+    asíncrona, que se actualiza por cada tipo de datos guardado.
+    """
+    data = xmltodict.parse(contenido)
+    
+    if "archivoConfiguraciones" in data:
+        return procesar_archivo_configuraciones(data["archivoConfiguraciones"] or {}, progreso)
+    if "configuracion" not in data:
+        raise ValueError("Formato XML incorrecto")
+    
+    config = data["configuracion"] or {}
+    recursos = _como_lista(config.get("recursos"), "recurso")
+    categorias = _como_lista(config.get("categorias"), "categoria")
+    clientes = _como_lista(config.get("clientes"), "cliente")
+    instancias = _como_lista(config.get("instancias"), "instancia")
+    if progreso:
+        progreso.iniciar(len(recursos) + len(categorias) + len(clientes) + len(instancias))
+    
+    resultado = {
+        "recursos_creados": 0,
+        "categorias_creadas": 0,
+        "clientes_creados": 0,
+        "instancias_creadas": 0
+    }
+    
+    # Procesar recursos
+    if recursos:
+        resultado["recursos_creados"] = crear_manejador('recursos').agregar_lote(recursos)
+        actualizar_tarifas()
+        if progreso:
+            progreso.avanzar(len(recursos))
+    
+    # Procesar categorías
+    if categorias:
+        resultado["categorias_creadas"] = crear_manejador('categorias').agregar_lote(categorias)
+        if progreso:
+            progreso.avanzar(len(categorias))
+    
+    # Procesar clientes
+    if clientes:
+        clientes_validos = [cliente for cliente in clientes if valida_nit(cliente.get("nit", ""))]
+        resultado["clientes_creados"] = crear_manejador('clientes').agregar_lote(clientes_validos)
+        if progreso:
+            progreso.avanzar(len(clientes_validos), len(clientes) - len(clientes_validos))
+    
+    # Procesar instancias
+    if instancias:
+        resultado["instancias_creadas"] = crear_manejador('instancias').agregar_lote(instancias)
+        if progreso:
+            progreso.avanzar(len(instancias))
+    
+    return {"mensaje": "Configuración cargada con éxito", "resultado": resultado}
+
+def procesar_archivo_configuraciones(archivo, progreso=None):
+    """Guarda los datos de un <archivoConfiguraciones> y recalcula las tarifas"""
+    registros = leer_archivo_configuraciones(archivo)
+    if progreso:
+        progreso.iniciar(sum(len(items) for items in registros.values()))
+    
+    clientes = registros["clientes"]
+    registros["clientes"] = [cliente for cliente in clientes if valida_nit(cliente["nit"])]
+    
+    resultado = {"guardados": {}}
+    for tipo, items in registros.items():
+        resultado["guardados"][tipo] = crear_manejador(tipo).agregar_lote(items)
+        if progreso:
+            rechazados = len(clientes) - len(items) if tipo == "clientes" else 0
+            progreso.avanzar(len(items), rechazados)
+    # Las tarifas dependen de los recursos y de las configuraciones
+    if registros["recursos"] or registros["configuraciones"]:
+        resultado["tarifas_calculadas"] = actualizar_tarifas()
+    
+    return {"mensaje": "Configuración cargada con éxito", "resultado": resultado}
+
 # POST: Cargar consumos
 @app.route('/cargarConsumos', methods=['POST'])
 def cargar_consumos():
     try:
-        data = xmltodict.parse(request.data)
-        
-        if "consumos" not in data or "consumo" not in data["consumos"]:
-            return to_xml({"error": "Formato XML incorrecto"})
-        
-        consumos = data["consumos"]["consumo"]
-        consumos = [consumos] if not isinstance(consumos, list) else consumos
-        
-        xml_manager = XMLManager('datos/consumos.xml')
-        consumos_procesados = 0
-        
-        for consumo in consumos:
-            # Validar fecha
-            if "fecha" in consumo and valida_fecha(consumo["fecha"]):
-                xml_manager.agregar(consumo)
-                consumos_procesados += 1
-        
-        return to_xml({
-            "mensaje": "Consumos cargados con éxito", 
-            "total_procesados": consumos_procesados
-        })
+        # El cuerpo se lee de a poco (request.stream), sin cargarlo completo en memoria
+        if request.args.get('asincrono') == '1':
+            # La carga termina después de responder: el cuerpo se copia antes a disco
+            ruta = guardar_cuerpo(request.stream)
+            try:
+                return carga_encolada(cola_cargas.enviar('consumos', procesar_archivo_consumos, ruta))
+            except Exception:
+                os.remove(ruta)
+                raise
+        return to_xml(procesar_consumos(request.stream))
     except Exception as e:
         return to_xml({"error": str(e)})
 
+def procesar_archivo_consumos(ruta, progreso):
+    """Carga asíncrona de los consumos guardados en ruta; el archivo se borra al terminar"""
+    try:
+        with open(ruta, 'rb') as archivo:
+            return procesar_consumos(archivo, progreso, os.path.getsize(ruta))
+    finally:
+        os.remove(ruta)
+
+def procesar_consumos(flujo, progreso=None, tamano=0):
+    """
+    Guarda los consumos del XML que se lee de flujo y retorna la respuesta de la carga.
+    Los <consumo> se leen de a uno y se guardan por lotes de LOTE_CARGA, así la memoria
+    no depende del tamaño del archivo; el resumen diario se agrupa en memoria (una fila
+    por instancia, recurso y día) y se guarda una vez al final. ValueError si el formato no es válido; si el XML
+    se corta a la mitad, los lotes anteriores ya quedaron guardados y el error lo indica.
+    progreso es el RegistroCarga de una carga asíncrona y tamano los bytes del archivo.
+    """
+    consumos = iterar_consumos(flujo)
+    manejador = crear_manejador('consumos')
+    resumen = ResumenDiario()
+    if progreso:
+        progreso.iniciar(bytes_total=tamano)
+    
+    consumos_procesados = 0
+    filas_resumen = {}
+    try:
+        while True:
+            lote = list(islice(consumos, LOTE_CARGA))
+            if not lote:
+                break
+            
+            # Validar la fecha y guardarla también normalizada (fecha_ts): la facturación y
+            # los índices comparan ese entero sin volver a interpretar el texto. Los
+            # consumos válidos del lote se guardan en una sola escritura
+            consumos_validos = []
+            for consumo in lote:
+                fecha_ts = normalizar_fecha(consumo.get("fecha"))
+                if fecha_ts is not None:
+                    consumo["fecha_ts"] = fecha_ts
+                    consumos_validos.append(consumo)
+            consumos_procesados += manejador.agregar_lote(consumos_validos)
+            resumen.agrupar(consumos_validos, filas_resumen)
+            if progreso:
+                progreso.avanzar(len(consumos_validos), len(lote) - len(consumos_validos),
+                                 flujo.tell())
+    except ValueError as e:
+        if consumos_procesados:
+            raise ValueError(f"{e} (ya se guardaron {consumos_procesados} consumos)")
+        raise
+    finally:
+        # Los consumos guardados entran al resumen aunque la carga se haya cortado
+        resumen.acumular_filas(filas_resumen)
+    
+    return {
+        "mensaje": "Consumos cargados con éxito", 
+        "total_procesados": consumos_procesados
+    }
+
+def carga_encolada(id_carga):
+    """Respuesta 202 de una carga asíncrona recién encolada"""
+    respuesta = to_xml({
+        "mensaje": "Carga en proceso",
+        "id_carga": id_carga,
+        "estado": f"/estadoCarga/{id_carga}"
+    })
+    respuesta.status_code = 202
+    return respuesta
+
+# GET: Avance de una carga asíncrona
+@app.route('/estadoCarga/<id_carga>', methods=['GET'])
+def estado_de_carga(id_carga):
+    try:
+        estado = estado_carga(id_carga)
+        if estado is None:
+            return to_xml({"error": "La carga no existe"})
+        return to_xml({"carga": estado})
+    except Exception as e:
+        return to_xml({"error": str(e)})
+
+def completar_periodo(periodo):
+    """
+    Valida el periodo de facturación y completa los valores por defecto. Retorna
+    (periodo, incremental, usar_resumen); lanza ValueError si el periodo no es válido.
+    """
+    periodo = dict(periodo or {})
+    # Sin fecha de inicio se factura todo lo consumido desde la última facturación de
+    # cada cliente; sin fecha de fin, hasta el momento actual
+    incremental = "fecha_inicio" not in periodo
+    # Con <origen>resumen</origen> se factura desde el resumen diario de consumos: lee
+    # muchas menos filas, pero solo admite periodos de días completos
+    usar_resumen = periodo.get("origen") == "resumen"
+    if not incremental and "fecha_fin" not in periodo:
+        raise ValueError("El periodo debe incluir fecha de inicio y fin")
+    if "fecha_fin" not in periodo:
+        if usar_resumen:
+            # El día actual aún no termina: se factura hasta ayer
+            periodo["fecha_fin"] = (datetime.now() - timedelta(days=1)).strftime("%d/%m/%Y")
+        else:
+            periodo["fecha_fin"] = datetime.now().strftime("%d/%m/%Y %H:%M")
+    if incremental:
+        periodo["fecha_inicio"] = "01/01/1970"
+    
+    # Validar fechas
+    if not valida_fecha(periodo["fecha_inicio"]) or not valida_fecha(periodo["fecha_fin"]):
+        raise ValueError("Formato de fecha inválido")
+    if usar_resumen and (len(periodo["fecha_inicio"]) > 10 or len(periodo["fecha_fin"]) > 10):
+        raise ValueError("Con el resumen diario las fechas del periodo no deben tener hora")
+    return periodo, incremental, usar_resumen
+
+def calcular_facturacion(periodo, incremental, usar_resumen):
+    """
+    Calcula, sin guardar nada, las facturas de un periodo ya completado por
+    completar_periodo. Retorna un diccionario con las facturas [(Factura, cliente)] (None si
+    no hay consumos sin facturar), los consumos ya facturados que se recortaron, los que
+    caen fuera del periodo de actividad de su instancia, el inicio del periodo y el último
+    consumo facturado por cliente (el intervalo que se registra como facturado), las
+    marcas de facturación y las fechas efectivas.
+    """
+    # Convertir fechas de string a datetime para comparación
+    fecha_inicio, fecha_fin = parsear_periodo(periodo["fecha_inicio"], periodo["fecha_fin"])
+    
+    if not fecha_inicio or not fecha_fin:
+        raise ValueError("Error al procesar las fechas")
+    
+    # Cargar datos necesarios; la firma de las instancias se lee antes que ellas (ver indice_vigencia)
+    version_instancias = firma_versiones('instancias')
+    instancias_totales = crear_manejador('instancias').obtener_todos()
+    recursos_totales = crear_manejador('recursos').obtener_todos()
+    clientes_totales = crear_manejador('clientes').obtener_todos()
+    tarifas = crear_manejador('tarifas_configuracion').obtener_todos()
+    motor = MotorFacturacion(instancias_totales, recursos_totales, clientes_totales, tarifas)
+    
+    # Los consumos dentro de los intervalos ya facturados a cada cliente se recortan
+    marcas = MarcasFacturacion(crear_manejador('marcas_facturacion'))
+    marcas_vigentes = marcas.vigentes()
+    if incremental and all(str(cliente.get("id")) in marcas_vigentes for cliente in clientes_totales):
+        # Si todos los clientes tienen marca basta con leer desde el último consumo
+        # facturado más antiguo entre todos ellos
+        if marcas_vigentes:
+            fecha_inicio = timestamp_a_datetime(min(
+                marcas.ultima(intervalos) for intervalos in marcas_vigentes.values()))
+    
+    # Filtrar consumos dentro del periodo; solo se leen los meses que cubre el periodo.
+    # Una fila del resumen cubre el día completo: su marca es el final del día
+    if usar_resumen:
+        fuente = ResumenDiario().iterar_periodo(fecha_inicio, fecha_fin)
+        duracion = 24 * 60 * 60 - 1
+    else:
+        fuente = crear_manejador('consumos').iterar_periodo(fecha_inicio, fecha_fin)
+        duracion = 0
+    
+    desde_ts = datetime_a_timestamp(fecha_inicio)
+    hasta_ts = datetime_a_timestamp(fecha_fin)
+    
+    # Solo se cobran los consumos de instancias activas en ese momento; el índice de
+    # vigencia da de una vez las instancias activas en algún momento del periodo
+    vigencia = indice_vigencia(instancias_totales, version_instancias)
+    activas = set(vigencia.activas_durante(desde_ts, hasta_ts))
+    
+    # Los consumos a facturar se guardan por columnas: el periodo puede tener millones
+    consumos_filtrados = ConsumosColumnar()
+    ultimos = {}
+    ya_facturados = 0
+    fuera_de_vigencia = 0
+    for consumo in fuente:
+        fecha_ts = timestamp_de(consumo)
+        if fecha_ts is None or not desde_ts <= fecha_ts <= hasta_ts:
+            continue
+        
+        # Las instancias que no existen se dejan al motor, que omite sus consumos
+        id_instancia = str(consumo.get("id_instancia"))
+        if id_instancia in vigencia.ventanas and (
+                id_instancia not in activas or
+                not vigencia.activa(id_instancia, fecha_ts, fecha_ts + duracion)):
+            fuera_de_vigencia += 1
+            continue
+        
+        id_cliente = motor.cliente_de(consumo)
+        if id_cliente in marcas_vigentes and marcas.facturado(marcas_vigentes[id_cliente], fecha_ts):
+            # Se recorta la parte del periodo que ya se facturó
+            ya_facturados += 1
+            continue
+        consumos_filtrados.agregar(consumo.get("id_instancia"), consumo.get("id_recurso"),
+                                   fecha_ts, consumo.get("tiempo", 0))
+        if id_cliente is not None:
+            fecha_ts += duracion
+            ultimos[id_cliente] = max(fecha_ts, ultimos.get(id_cliente, fecha_ts))
+    
+    # Agrupar consumos por cliente e instancia y armar una factura por cliente
+    facturas = None
+    if len(consumos_filtrados):
+        facturas = motor.facturar(consumos_filtrados, fecha_fin.strftime("%d/%m/%Y"))
+    
+    return {
+        "facturas": facturas,
+        "ya_facturados": ya_facturados,
+        "fuera_de_vigencia": fuera_de_vigencia,
+        "desde_ts": desde_ts,
+        "ultimos": ultimos,
+        "marcas": marcas,
+        "periodo": {
+            "fecha_inicio": fecha_inicio.strftime("%d/%m/%Y %H:%M") if incremental else periodo["fecha_inicio"],
+            "fecha_fin": periodo["fecha_fin"]
+        }
+    }
+
 # POST: Generar factura
 @app.route('/generarFactura', methods=['POST'])
 def generar_factura():
@@ -215,167 +524,194 @@ def generar_factura():
         if "periodo" not in data:
             return to_xml({"error": "Debe especificar un periodo"})
         
-        periodo = data["periodo"]
-        if "fecha_inicio" not in periodo or "fecha_fin" not in periodo:
-            return to_xml({"error": "El periodo debe incluir fecha de inicio y fin"})
-        
-        # Validar fechas
-        if not valida_fecha(periodo["fecha_inicio"]) or not valida_fecha(periodo["fecha_fin"]):
-            return to_xml({"error": "Formato de fecha inválido"})
-        
-        # Convertir fechas de string a datetime para comparación
-        def parsear_fecha(fecha_str):
-            """Convierte string en formato dd/mm/yyyy o dd/mm/yyyy hh:mm a datetime"""
-            try:
-                # Intentar con hora
-                if len(fecha_str) > 10:
-                    return datetime.strptime(fecha_str, "%d/%m/%Y %H:%M")
-                else:
-                    return datetime.strptime(fecha_str, "%d/%m/%Y")
-            except ValueError:
-                return None
-        
-        fecha_inicio = parsear_fecha(periodo["fecha_inicio"])
-        fecha_fin = parsear_fecha(periodo["fecha_fin"])
-        
-        if not fecha_inicio or not fecha_fin:
-            return to_xml({"error": "Error al procesar las fechas"})
-        
-        # Si fecha_fin no tiene hora, establecer al final del día (23:59)
-        if fecha_fin.hour == 0 and fecha_fin.minute == 0 and len(periodo["fecha_fin"]) <= 10:
-            fecha_fin = fecha_fin.replace(hour=23, minute=59, second=59)
-        
-        # Cargar datos necesarios
-        mgr_consumos = XMLManager('datos/consumos.xml')
-        mgr_instancias = XMLManager('datos/instancias.xml')
-        mgr_recursos = XMLManager('datos/recursos.xml')
-        mgr_clientes = XMLManager('datos/clientes.xml')
-        mgr_facturas = XMLManager('datos/facturas.xml')
-        
-        consumos_totales = mgr_consumos.obtener_todos()
-        instancias_totales = mgr_instancias.obtener_todos()
-        recursos_totales = mgr_recursos.obtener_todos()
-        clientes_totales = mgr_clientes.obtener_todos()
-        
-        # Filtrar consumos dentro del periodo
-        consumos_filtrados = []
-        for consumo in consumos_totales:
-            fecha_consumo = parsear_fecha(consumo.get("fecha", ""))
-            if fecha_consumo and fecha_inicio <= fecha_consumo <= fecha_fin:
-                consumos_filtrados.append(consumo)
-        
-        if not consumos_filtrados:
-            return to_xml({"mensaje": "No hay consumos en el periodo especificado", "facturas_generadas": 0})
-        
-        # Agrupar consumos por cliente
-        consumos_por_cliente = {}
-        
-        for consumo in consumos_filtrados:
-            id_instancia = consumo.get("id_instancia")
-            
-            # Buscar la instancia asociada
-            instancia = None
-            for inst in instancias_totales:
-                if str(inst.get("id")) == str(id_instancia):
-                    instancia = inst
-                    break
-            
-            if not instancia:
-                continue  # Saltar si no se encuentra la instancia
+        # Las marcas se leen, se calculan las facturas y se registran bajo el bloqueo de
+        # las marcas: dos generaciones simultáneas no facturan dos veces los mismos consumos
+        periodo = completar_periodo(data["periodo"])
+        with MarcasFacturacion(crear_manejador('marcas_facturacion')).bloqueo():
+            calculo = calcular_facturacion(*periodo)
+            if calculo["facturas"] is None:
+                return to_xml({
+                    "mensaje": "No hay consumos sin facturar en el periodo especificado",
+                    "facturas_generadas": 0,
+                    "consumos_ya_facturados": calculo["ya_facturados"],
+                    "consumos_fuera_de_vigencia": calculo["fuera_de_vigencia"]
+                })
             
-            id_cliente = instancia.get("id_cliente")
+            facturas_guardar = []
+            for factura, cliente in calculo["facturas"]:
+                factura_dict = factura.to_dict()
+                factura_dict["nit_cliente"] = cliente.get("nit")
+                factura_dict["nombre_cliente"] = cliente.get("nombre")
+                facturas_guardar.append(factura_dict)
             
-            # Inicializar estructura para el cliente si no existe
-            if id_cliente not in consumos_por_cliente:
-                consumos_por_cliente[id_cliente] = {
-                    "instancias": {}
-                }
-            
-            # Inicializar estructura para la instancia si no existe
-            if id_instancia not in consumos_por_cliente[id_cliente]["instancias"]:
-                consumos_por_cliente[id_cliente]["instancias"][id_instancia] = {
-                    "nombre": instancia.get("nombre", "Sin nombre"),
-                    "consumos": []
-                }
-            
-            # Buscar el recurso asociado al consumo
-            id_recurso = consumo.get("id_recurso")
-            recurso = None
-            for rec in recursos_totales:
-                if str(rec.get("id")) == str(id_recurso):
-                    recurso = rec
-                    break
-            
-            if not recurso:
-                continue  # Saltar si no se encuentra el recurso
-            
-            # Calcular el monto del consumo
-            tiempo = float(consumo.get("tiempo", 0))
-            precio_hora = float(recurso.get("precio_hora", 0))
-            monto = tiempo * precio_hora
-            
-            # Agregar consumo detallado
-            consumos_por_cliente[id_cliente]["instancias"][id_instancia]["consumos"].append({
-                "id_recurso": id_recurso,
-                "nombre_recurso": recurso.get("nombre", ""),
-                "abreviatura": recurso.get("abreviatura", ""),
-                "tiempo": str(tiempo),
-                "precio_hora": str(precio_hora),
-                "monto": str(round(monto, 2))
-            })
+            # Guardar todas las facturas con una sola escritura
+            crear_manejador('facturas').agregar_lote(facturas_guardar)
+            calculo["marcas"].registrar(calculo["desde_ts"], calculo["ultimos"], calculo["facturas"])
+        
+        # El resumen de cada factura se serializa a medida que se envía la respuesta
+        facturas_generadas = ({
+            "id_factura": factura.id,
+            "cliente": cliente.get("nombre"),
+            "nit": cliente.get("nit"),
+            "monto_total": str(factura.monto_total)
+        } for factura, cliente in calculo["facturas"])
+        
+        return to_xml_stream({
+            "mensaje": "Facturas generadas con éxito",
+            "periodo": calculo["periodo"],
+            "facturas_generadas": len(calculo["facturas"]),
+            "consumos_ya_facturados": calculo["ya_facturados"],
+            "consumos_fuera_de_vigencia": calculo["fuera_de_vigencia"],
+            "facturas": {"factura": facturas_generadas}
+        })
+    except Exception as e:
+        return to_xml({"error": str(e)})
+
+# Datos de los que depende una previsualización: si ninguno cambia, el resultado tampoco
+TIPOS_PREVISUALIZACION = ('consumos', 'consumos_diarios', 'instancias', 'recursos', 'clientes',
+                          'marcas_facturacion', 'tarifas_configuracion')
+
+# POST: Previsualizar las facturas de un periodo sin guardarlas
+@app.route('/previsualizarFactura', methods=['POST'])
+def previsualizar_factura():
+    try:
+        data = xmltodict.parse(request.data)
         
-        # Generar facturas por cliente
-        facturas_generadas = []
-        fecha_emision = fecha_fin.strftime("%d/%m/%Y")
-        
-        for id_cliente, datos_cliente in consumos_por_cliente.items():
-            # Buscar información del cliente
-            cliente = None
-            for cli in clientes_totales:
-                if str(cli.get("id")) == str(id_cliente):
-                    cliente = cli
-                    break
-            
-            if not cliente:
-                continue
-            
-            # Crear objeto Factura
-            factura = Factura(
-                id_cliente=id_cliente,
-                fecha_emision=fecha_emision,
-                monto_total=0
-            )
-            
-            # Agregar items (instancias con sus consumos)
-            for id_instancia, datos_instancia in datos_cliente["instancias"].items():
-                factura.agregar_item(
-                    id_instancia=id_instancia,
-                    nombre_instancia=datos_instancia["nombre"],
-                    consumos=datos_instancia["consumos"]
-                )
-            
-            # Guardar factura en XML
+        if "periodo" not in data:
+            return to_xml({"error": "Debe especificar un periodo"})
+        
+        periodo, incremental, usar_resumen = completar_periodo(data["periodo"])
+        
+        # La versión se lee antes de calcular: si los datos cambian mientras tanto, el
+        # resultado queda guardado con una versión que ya no es la vigente
+        # Se guarda una respuesta por formato
+        formato = formato_respuesta(request.accept_mimetypes)
+        clave = "|".join((periodo["fecha_inicio"], periodo["fecha_fin"], str(usar_resumen), formato))
+        version = versiones(*TIPOS_PREVISUALIZACION)
+        guardada = cache_previsualizaciones.obtener(clave, version)
+        if guardada is not None:
+            return Response(guardada, mimetype=formato)
+        
+        calculo = calcular_facturacion(periodo, incremental, usar_resumen)
+        facturas = []
+        for factura, cliente in calculo["facturas"] or []:
             factura_dict = factura.to_dict()
+            # Una previsualización no es una factura emitida: no tiene número
+            del factura_dict["id"]
             factura_dict["nit_cliente"] = cliente.get("nit")
             factura_dict["nombre_cliente"] = cliente.get("nombre")
-            
-            mgr_facturas.agregar(factura_dict)
-            facturas_generadas.append({
-                "id_factura": factura.id,
-                "cliente": cliente.get("nombre"),
-                "nit": cliente.get("nit"),
-                "monto_total": str(factura.monto_total)
+            facturas.append(factura_dict)
+        
+        respuesta = to_xml({
+            "mensaje": "Previsualización de facturas (no se guardó ninguna)",
+            "periodo": calculo["periodo"],
+            "facturas_generadas": len(facturas),
+            "consumos_ya_facturados": calculo["ya_facturados"],
+            "consumos_fuera_de_vigencia": calculo["fuera_de_vigencia"],
+            # Con dos decimales, como /reporteVentas: la suma en float arrastra ruido (1789.1299999999999)
+            "monto_total": f"{sum(float(factura['monto_total']) for factura in facturas):.2f}",
+            "facturas": {"factura": facturas}
+        })
+        contenido = respuesta.get_data()
+        cache_previsualizaciones.guardar(clave, version, contenido, len(contenido))
+        return respuesta
+    except Exception as e:
+        return to_xml({"error": str(e)})
+
+# GET: Reporte de ventas de un periodo, calculado desde el resumen diario de consumos
+@app.route('/reporteVentas', methods=['GET'])
+def reporte_ventas():
+    try:
+        fecha_inicio_str = request.args.get('fecha_inicio', '')
+        fecha_fin_str = request.args.get('fecha_fin', '')
+        if not valida_fecha(fecha_inicio_str) or not valida_fecha(fecha_fin_str):
+            return to_xml({"error": "Debe indicar fecha_inicio y fecha_fin válidas (dd/mm/yyyy)"})
+        
+        fecha_inicio, fecha_fin = parsear_periodo(fecha_inicio_str, fecha_fin_str)
+        
+        etag = etag_consulta('consumos_diarios', 'recursos', 'facturas')
+        if request.if_none_match.contains(etag):
+            return no_modificado(etag)
+        
+        recursos = {str(recurso.get("id")): recurso for recurso in crear_manejador('recursos').iterar()}
+        
+        # Tiempo e ingresos por recurso
+        por_recurso = {}
+        for fila in ResumenDiario().iterar_periodo(fecha_inicio, fecha_fin):
+            recurso = recursos.get(str(fila.get("id_recurso")))
+            if not recurso:
+                continue
+            tiempo = float(fila.get("tiempo", 0))
+            total = por_recurso.setdefault(str(recurso.get("id")), {"tiempo": 0.0, "ingresos": 0.0})
+            total["tiempo"] += tiempo
+            total["ingresos"] += round(tiempo * float(recurso.get("precio_hora", 0)), 2)
+        
+        top_recursos = []
+        for id_recurso, total in sorted(por_recurso.items(), key=lambda par: -par[1]["ingresos"]):
+            top_recursos.append({
+                "nombre": recursos[id_recurso].get("nombre", ""),
+                "abreviatura": recursos[id_recurso].get("abreviatura", ""),
+                "total_tiempo": str(round(total["tiempo"], 2)),
+                "ingresos": f"{total['ingresos']:.2f}"
             })
         
-        return to_xml({
-            "mensaje": "Facturas generadas con éxito",
-            "periodo": {
-                "fecha_inicio": periodo["fecha_inicio"],
-                "fecha_fin": periodo["fecha_fin"]
+        # Facturas emitidas en el periodo
+        total_facturas = 0
+        ingresos_totales = 0.0
+        for factura in crear_manejador('facturas').iterar():
+            fecha_emision = parsear_fecha(factura.get("fecha_emision"))
+            if fecha_emision and fecha_inicio <= fecha_emision <= fecha_fin:
+                total_facturas += 1
+                ingresos_totales += float(factura.get("monto_total", 0))
+        
+        return con_etag(to_xml({
+            "periodo": {"fecha_inicio": fecha_inicio_str, "fecha_fin": fecha_fin_str},
+            "resumen": {
+                "total_facturas": total_facturas,
+                "ingresos_totales": f"{ingresos_totales:.2f}"
             },
-            "facturas_generadas": len(facturas_generadas),
-            "facturas": {"factura": facturas_generadas if facturas_generadas else []}
-        })
+            "top_recursos": {"recurso": top_recursos}
+        }), etag)
+    except Exception as e:
+        return to_xml({"error": str(e)})
+
+# GET: Instancias activas en un instante (?fecha=) o en algún momento de un periodo
+# (?fecha_inicio=&fecha_fin=), según sus fechas de inicio y de cancelación
+@app.route('/instanciasActivas', methods=['GET'])
+def instancias_activas():
+    try:
+        fecha_str = request.args.get('fecha')
+        if fecha_str is not None:
+            instante = normalizar_fecha(fecha_str)
+            if instante is None:
+                return to_xml({"error": "Formato de fecha inválido"})
+            periodo = {"fecha": fecha_str}
+        else:
+            fecha_inicio_str = request.args.get('fecha_inicio', '')
+            fecha_fin_str = request.args.get('fecha_fin', '')
+            if not valida_fecha(fecha_inicio_str) or not valida_fecha(fecha_fin_str):
+                return to_xml({"error": "Debe indicar fecha o fecha_inicio y fecha_fin válidas"})
+            fecha_inicio, fecha_fin = parsear_periodo(fecha_inicio_str, fecha_fin_str)
+            periodo = {"fecha_inicio": fecha_inicio_str, "fecha_fin": fecha_fin_str}
+        
+        etag = etag_consulta('instancias')
+        if request.if_none_match.contains(etag):
+            return no_modificado(etag)
+        
+        vigencia = indice_vigencia()
+        if fecha_str is not None:
+            ids = vigencia.activas_en(instante)
+        else:
+            ids = vigencia.activas_durante(datetime_a_timestamp(fecha_inicio), datetime_a_timestamp(fecha_fin))
+        
+        # Cada instancia se lee por su id, sin recorrer las demás
+        manejador = crear_manejador('instancias')
+        instancias = [instancia for instancia in map(manejador.obtener_por_id, ids) if instancia]
+        return con_etag(to_xml({
+            "periodo": periodo,
+            "total": len(instancias),
+            "instancias": {"instancia": instancias}
+        }), etag)
     except Exception as e:
         return to_xml({"error": str(e)})
 
@@ -383,15 +719,75 @@ def generar_factura():
 @app.route('/reiniciarSistema', methods=['POST'])
 def reiniciar_sistema():
     try:
-        # Eliminar todos los archivos XML
-        for archivo in ['recursos.xml', 'categorias.xml', 'clientes.xml', 
-                        'instancias.xml', 'consumos.xml', 'facturas.xml']:
-            if os.path.exists(f'datos/{archivo}'):
-                os.remove(f'datos/{archivo}')
+        # Eliminar todos los datos del backend configurado
+        for tipo in TIPOS_DATOS:
+            crear_manejador(tipo).limpiar()
         
         return to_xml({"mensaje": "Sistema reiniciado con éxito"})
     except Exception as e:
         return to_xml({"error": str(e)})
 
+# Comando: flask --app app migrar-xml
+@app.cli.command('migrar-xml')
+def migrar_xml():
+    """Importa los archivos datos/*.xml existentes a la base de datos SQLite"""
+    for tipo in TIPOS_DATOS:
+        destino = SQLiteManager(RUTA_SQLITE, tipo)
+        if not destino.esta_vacio():
+            print(f"{tipo}: la tabla ya tiene datos, no se importó")
+            continue
+        
+        items = crear_manejador(tipo, backend='xml').obtener_todos()
+        try:
+            importados = destino.agregar_lote(items)
+            print(f"{tipo}: {importados} registros importados")
+        except ValueError as e:
+            print(f"{tipo}: no se importó ({e})")
+
+# Comando: flask --app app particionar-consumos
+@app.cli.command('particionar-consumos')
+def particionar_consumos():
+    """Reparte el archivo datos/consumos.xml anterior en las particiones mensuales"""
+    if not os.path.exists('datos/consumos.xml'):
+        print("No existe datos/consumos.xml, no hay nada que particionar")
+        return
+    
+    consumos = XMLManager('datos/consumos.xml', modo='xml').obtener_todos()
+    validos = []
+    for consumo in consumos:
+        fecha_ts = normalizar_fecha(consumo.get("fecha"))
+        if fecha_ts is not None:
+            consumo["fecha_ts"] = fecha_ts
+            validos.append(consumo)
+    importados = crear_manejador('consumos', backend='xml').agregar_lote(validos)
+    os.replace('datos/consumos.xml', 'datos/consumos.xml.particionado')
+    print(f"{importados} consumos particionados, {len(consumos) - importados} sin fecha válida")
+
+# Comando: flask --app app normalizar-fechas
+@app.cli.command('normalizar-fechas')
+def normalizar_fechas():
+    """Agrega fecha_ts a los consumos guardados antes de que se normalizara al cargarlos"""
+    # En SQLite fecha_ts siempre fue una columna; solo los archivos XML necesitan completarse
+    actualizados = crear_manejador('consumos', backend='xml').normalizar_fechas()
+    print(f"{actualizados} consumos con fecha_ts agregada")
+    
+    filas = ResumenDiario().reconstruir(crear_manejador('consumos').iterar())
+    print(f"Resumen diario reconstruido: {filas} filas")
+
+# Comando: flask --app app recalcular-tarifas
+@app.cli.command('recalcular-tarifas')
+def recalcular_tarifas():
+    """Vuelve a calcular el precio por hora de cada configuración"""
+    print(f"Tarifas calculadas: {actualizar_tarifas()} configuraciones")
+
+# Comando: flask --app app reconstruir-resumen
+@app.cli.command('reconstruir-resumen')
+def reconstruir_resumen():
+    """Vuelve a generar el resumen diario de consumos a partir de todos los consumos"""
+    filas = ResumenDiario().reconstruir(crear_manejador('consumos').iterar())
+    print(f"Resumen diario reconstruido: {filas} filas")
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    # Los archivos de datos se protegen con bloqueos entre procesos, así que también se
+    # puede servir con varios workers, por ejemplo: gunicorn -w 4 -b :5000 app:app
+    app.run(debug=True, port=5000)
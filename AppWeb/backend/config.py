@@ -0,0 +1,38 @@
+import os
+
+# Modo de escritura de los archivos XML de datos:
+#   'xml'     reescribe el documento completo en cada escritura
+#   'journal' agrega cada escritura a una bitácora y la compacta en el XML periódicamente
+MODO_XML = os.environ.get('MODO_XML', 'xml')
+
+# Tamaño mínimo (en bytes) que debe alcanzar la bitácora antes de compactarse.
+# Si el XML base es más grande se espera a que la bitácora lo iguale.
+LIMITE_JOURNAL = int(os.environ.get('LIMITE_JOURNAL', 1024 * 1024))
+
+# Límite de la cache de datos parseados, medido como el tamaño en disco de los archivos cacheados
+LIMITE_CACHE = int(os.environ.get('LIMITE_CACHE', 64 * 1024 * 1024))
+
+# Backend de almacenamiento de los datos: 'xml' (un archivo por tipo en datos/) o 'sqlite'
+BACKEND_ALMACENAMIENTO = os.environ.get('BACKEND_ALMACENAMIENTO', 'xml')
+
+# Base de datos usada por el backend 'sqlite'
+RUTA_SQLITE = os.environ.get('RUTA_SQLITE', 'datos/datos.sqlite3')
+
+# Cálculo de las facturas: 'escalar' (Python puro) o 'numpy' (vectorizado, requiere numpy;
+# si no está instalado se usa el cálculo escalar)
+MODO_FACTURACION = os.environ.get('MODO_FACTURACION', 'escalar')
+
+# Procesos usados para armar las facturas de un periodo, repartiendo los clientes entre
+# ellos; con 1 (o 0) se arman en el mismo proceso de la petición. El pool se crea con la
+# primera facturación en paralelo y se reutiliza en las siguientes
+PROCESOS_FACTURACION = int(os.environ.get('PROCESOS_FACTURACION', 1))
+
+# Cargas asíncronas (?asincrono=1 en /cargarConsumos y /crearConfiguracion): cuántas se
+# procesan a la vez en cada proceso y cuántas pueden esperar turno antes de rechazar otra
+CARGAS_SIMULTANEAS = int(os.environ.get('CARGAS_SIMULTANEAS', 2))
+CARGAS_EN_ESPERA = int(os.environ.get('CARGAS_EN_ESPERA', 8))
+
+# Consumos que se guardan por escritura al cargar un archivo (el progreso de una carga
+# asíncrona se informa por lote). Acota la memoria de la carga; cada lote solo se agrega
+# a lo ya guardado (las particiones de consumos usan bitácora aun con MODO_XML 'xml')
+LOTE_CARGA = int(os.environ.get('LOTE_CARGA', 20000))
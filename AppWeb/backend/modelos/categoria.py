@@ -1,4 +1,6 @@
 class Categoria:
+    __slots__ = ("id", "nombre", "descripcion", "carga_trabajo")
+    
     def __init__(self, id, nombre, descripcion, carga_trabajo):
         self.id = id
         self.nombre = nombre
@@ -1,4 +1,6 @@
 class Cliente:
+    __slots__ = ("id", "nit", "nombre", "direccion", "correo", "telefono")
+    
     def __init__(self, id, nit, nombre, direccion, correo=None, telefono=None):
         self.id = id
         self.nit = nit
@@ -1,4 +1,12 @@
+from array import array
+from datetime import datetime, timezone
+
+from utilidades.fechas import timestamp_de
+
 class Consumo:
+    # __slots__ evita un __dict__ por objeto: importa cuando se crean millones de consumos
+    __slots__ = ("id", "id_instancia", "id_recurso", "fecha", "tiempo")
+    
     def __init__(self, id, id_instancia, id_recurso, fecha, tiempo):
         self.id = id
         self.id_instancia = id_instancia
@@ -25,4 +33,74 @@ class Consumo:
             id_recurso=data.get("id_recurso"),
             fecha=data.get("fecha"),
             tiempo=data.get("tiempo")
-        )
\ No newline at end of file
+        )
+
+
+class ConsumosColumnar:
+    """
+    Contenedor compacto de muchos consumos guardados por columnas: tiempo y fecha (epoch)
+    en arreglos tipados y los ids de instancia y recurso codificados como enteros.
+    Ocupa una fracción de la memoria de una lista de diccionarios con strings.
+    """
+    __slots__ = ("tiempos", "fechas_ts", "instancias", "recursos",
+                 "ids_instancia", "ids_recurso", "_codigos_instancia", "_codigos_recurso")
+    
+    def __init__(self):
+        self.tiempos = array('d')
+        self.fechas_ts = array('q')
+        self.instancias = array('i')  # código de id_instancia por consumo
+        self.recursos = array('i')  # código de id_recurso por consumo
+        self.ids_instancia = []  # código -> id_instancia
+        self.ids_recurso = []  # código -> id_recurso
+        self._codigos_instancia = {}
+        self._codigos_recurso = {}
+    
+    @staticmethod
+    def _codificar(valor, codigos, valores):
+        """Retorna el código entero de valor, asignándole uno nuevo si no lo tenía"""
+        codigo = codigos.get(valor)
+        if codigo is None:
+            codigo = codigos[valor] = len(valores)
+            valores.append(valor)
+        return codigo
+    
+    def agregar(self, id_instancia, id_recurso, fecha_ts, tiempo):
+        """Agrega un consumo; fecha_ts son los segundos desde epoch"""
+        self.instancias.append(self._codificar(id_instancia, self._codigos_instancia, self.ids_instancia))
+        self.recursos.append(self._codificar(id_recurso, self._codigos_recurso, self.ids_recurso))
+        self.fechas_ts.append(fecha_ts)
+        self.tiempos.append(float(tiempo))
+    
+    @classmethod
+    def from_items(cls, items):
+        """Crea el contenedor desde diccionarios de consumos (omite los de fecha inválida)"""
+        columnar = cls()
+        for item in items:
+            fecha_ts = timestamp_de(item)
+            if fecha_ts is not None:
+                columnar.agregar(item.get("id_instancia"), item.get("id_recurso"),
+                                 fecha_ts, item.get("tiempo", 0))
+        return columnar
+    
+    def __len__(self):
+        return len(self.tiempos)
+    
+    def filas(self):
+        """Produce (id_instancia, id_recurso, tiempo) de cada consumo, sin crear objetos Consumo"""
+        ids_instancia, ids_recurso = self.ids_instancia, self.ids_recurso
+        for instancia, recurso, tiempo in zip(self.instancias, self.recursos, self.tiempos):
+            yield ids_instancia[instancia], ids_recurso[recurso], tiempo
+    
+    def __getitem__(self, posicion):
+        """Reconstruye el consumo de una posición como objeto Consumo"""
+        return Consumo(
+            id=None,
+            id_instancia=self.ids_instancia[self.instancias[posicion]],
+            id_recurso=self.ids_recurso[self.recursos[posicion]],
+            fecha=datetime.fromtimestamp(self.fechas_ts[posicion], timezone.utc).strftime("%d/%m/%Y %H:%M"),
+            tiempo=self.tiempos[posicion]
+        )
+    
+    def __iter__(self):
+        for posicion in range(len(self)):
+            yield self[posicion]
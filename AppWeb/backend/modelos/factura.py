@@ -2,6 +2,8 @@ import uuid
 from datetime import datetime
 
 class Factura:
+    __slots__ = ("id", "id_cliente", "fecha_emision", "monto_total", "items")
+    
     def __init__(self, id_cliente, fecha_emision, monto_total, items=None, id=None):
         self.id = id if id else str(uuid.uuid4())  # Generar ID único si no se proporciona
         self.id_cliente = id_cliente
@@ -9,13 +11,15 @@ class Factura:
         self.monto_total = float(monto_total)
         self.items = items if items else []
     
-    def agregar_item(self, id_instancia, nombre_instancia, consumos):
-        """Agrega un item a la factura"""
+    def agregar_item(self, id_instancia, nombre_instancia, consumos, subtotal=None):
+        """Agrega un item a la factura; si no se indica el subtotal se suman los montos"""
+        if subtotal is None:
+            subtotal = sum(float(c.get("monto", 0)) for c in consumos)
         item = {
             "id_instancia": id_instancia,
             "nombre_instancia": nombre_instancia,
             "consumos": consumos,
-            "subtotal": sum(float(c.get("monto", 0)) for c in consumos)
+            "subtotal": subtotal
         }
         self.items.append(item)
         # Recalcular monto total
@@ -1,4 +1,6 @@
 class Instancia:
+    __slots__ = ("id", "id_cliente", "id_configuracion", "nombre", "fecha_inicio", "estado", "fecha_final")
+    
     def __init__(self, id, id_cliente, id_configuracion, nombre, fecha_inicio):
         self.id = id
         self.id_cliente = id_cliente
@@ -6,10 +8,11 @@ class Instancia:
         self.nombre = nombre
         self.fecha_inicio = fecha_inicio
         self.estado = "activa"  # Por defecto, la instancia está activa
+        self.fecha_final = None  # Fecha de cancelación
     
     def to_dict(self):
         """Convierte el objeto a un diccionario para almacenamiento XML"""
-        return {
+        instancia_dict = {
             "id": self.id,
             "id_cliente": self.id_cliente,
             "id_configuracion": self.id_configuracion,
@@ -17,6 +20,9 @@ class Instancia:
             "fecha_inicio": self.fecha_inicio,
             "estado": self.estado
         }
+        if self.fecha_final:
+            instancia_dict["fecha_final"] = self.fecha_final
+        return instancia_dict
     
     @classmethod
     def from_dict(cls, data):
@@ -30,4 +36,5 @@ class Instancia:
         )
         if "estado" in data:
             instancia.estado = data["estado"]
+        instancia.fecha_final = data.get("fecha_final")
         return instancia
\ No newline at end of file
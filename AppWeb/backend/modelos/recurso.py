@@ -1,4 +1,6 @@
 class Recurso:
+    __slots__ = ("id", "nombre", "abreviatura", "metrica", "precio_hora")
+    
     def __init__(self, id, nombre, abreviatura, metrica, precio_hora):
         self.id = id
         self.nombre = nombre
@@ -0,0 +1,121 @@
+"""
+Tiempo de POST /cargarConsumos (cliente de pruebas de Flask) según la cantidad de
+consumos, partiendo de un almacenamiento vacío. La carga es lineal: las filas por segundo
+adicionales se mantienen al crecer el archivo. Además carga la cantidad mayor en 40 lotes
+y termina con error si los últimos lotes tardan más de CRECIMIENTO_MAXIMO veces lo que
+tardan los primeros (una escritura que reescribe lo ya guardado).
+
+    python pruebas/benchmark_ingesta.py [cantidades...]    (por defecto 10000 50000 100000 200000)
+
+Usa el backend y MODO_XML de las variables de entorno, como el servidor. Los datos se
+guardan en un directorio temporal.
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+from statistics import median
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CANTIDADES = (10000, 50000, 100000, 200000)
+
+# Cuántas veces más puede tardar un lote del último cuarto de una carga que uno del primero
+CRECIMIENTO_MAXIMO = 2
+
+def xml_consumos(cantidad):
+    """<consumos> con cantidad filas repartidas en 50 instancias, 5 recursos y un año"""
+    filas = ''.join(
+        f'<consumo><id_instancia>{i % 50}</id_instancia><id_recurso>{i % 5}</id_recurso>'
+        f'<fecha>{1 + i % 28:02d}/{1 + i % 12:02d}/2024 10:00</fecha><tiempo>1.5</tiempo></consumo>'
+        for i in range(cantidad)
+    )
+    return f'<consumos>{filas}</consumos>'
+
+def medir(cliente, cantidades, repeticiones=1):
+    """
+    Lista de (cantidad, segundos) de cargar cada cantidad de consumos en un almacenamiento
+    vacío; con varias repeticiones se toma el mejor tiempo de cada cantidad
+    """
+    # Primera carga sin medir: crea los archivos y la base de datos
+    cliente.post('/reiniciarSistema')
+    cliente.post('/cargarConsumos', data=xml_consumos(100))
+
+    medidas = []
+    for cantidad in cantidades:
+        cuerpo = xml_consumos(cantidad)
+        tiempos = []
+        for _ in range(repeticiones):
+            cliente.post('/reiniciarSistema')
+            inicio = time.perf_counter()
+            respuesta = cliente.post('/cargarConsumos', data=cuerpo)
+            tiempos.append(time.perf_counter() - inicio)
+            texto = respuesta.get_data(as_text=True)
+            if f'<total_procesados>{cantidad}</total_procesados>' not in texto:
+                raise RuntimeError(f"La carga de {cantidad} consumos falló: {texto}")
+        medidas.append((cantidad, min(tiempos)))
+    return medidas
+
+def marginales(medidas):
+    """
+    Filas por segundo adicionales entre cada cantidad y la siguiente. Con una carga lineal
+    cada fila adicional cuesta lo mismo sin importar el tamaño del archivo (el costo fijo
+    de cada carga, como abrir la base de datos, no cuenta)
+    """
+    return [(anterior, cantidad, (cantidad - anterior) / max(t_cantidad - t_anterior, 1e-9))
+            for (anterior, t_anterior), (cantidad, t_cantidad) in zip(medidas, medidas[1:])]
+
+class CronometroLotes:
+    """Hace las veces del RegistroCarga de procesar_consumos y anota cuándo termina cada lote"""
+
+    def __init__(self):
+        self.marcas = []
+
+    def iniciar(self, total=0, bytes_total=0):
+        self.marcas.append(time.perf_counter())
+
+    def avanzar(self, aceptadas, rechazadas=0, bytes_leidos=None):
+        self.marcas.append(time.perf_counter())
+
+def crecimiento_por_lote(cantidad, lote):
+    """
+    Carga cantidad consumos en lotes de lote filas y retorna cuánto más tarda un lote del
+    último cuarto que uno del primero (medianas). Con una carga lineal cada lote cuesta lo
+    mismo (≈1); si cada escritura reescribe lo ya guardado, los últimos lotes tardan más.
+    """
+    import app
+    lote_anterior, app.LOTE_CARGA = app.LOTE_CARGA, lote
+    try:
+        cronometro = CronometroLotes()
+        app.procesar_consumos(io.BytesIO(xml_consumos(cantidad).encode()), cronometro)
+    finally:
+        app.LOTE_CARGA = lote_anterior
+    duraciones = [fin - inicio for inicio, fin in zip(cronometro.marcas, cronometro.marcas[1:])]
+    cuarto = max(len(duraciones) // 4, 1)
+    return median(duraciones[-cuarto:]) / median(duraciones[:cuarto])
+
+def main(cantidades):
+    os.chdir(tempfile.mkdtemp(prefix='benchmark_ingesta_'))
+    # Importación diferida: el almacenamiento usa rutas relativas al directorio actual
+    from app import app
+
+    try:
+        medidas = medir(app.test_client(), cantidades)
+    except RuntimeError as e:
+        sys.exit(str(e))
+    for cantidad, segundos in medidas:
+        print(f"{cantidad:>8} consumos: {segundos:7.3f} s  ({cantidad / segundos:,.0f} filas/s)")
+    for anterior, cantidad, velocidad in marginales(medidas):
+        print(f"{anterior:>8} -> {cantidad:<8} {velocidad:,.0f} filas/s adicionales")
+
+    # Lotes chicos: muchas escrituras, como una carga mucho más grande con LOTE_CARGA
+    app.test_client().post('/reiniciarSistema')
+    crecimiento = crecimiento_por_lote(max(cantidades), max(max(cantidades) // 40, 1))
+    print(f"Último cuarto de lotes / primer cuarto: {crecimiento:.2f}")
+    if crecimiento > CRECIMIENTO_MAXIMO:
+        sys.exit(f"La carga no escala linealmente: los últimos lotes tardan {crecimiento:.2f} "
+                 f"veces lo que los primeros (máximo {CRECIMIENTO_MAXIMO})")
+
+if __name__ == '__main__':
+    main([int(cantidad) for cantidad in sys.argv[1:]] or CANTIDADES)
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos del backend se importan como en app.py (utilidades.*, modelos.*)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def directorio_datos(tmp_path, monkeypatch):
+    """
+    Directorio de trabajo vacío para cada prueba: los datos se guardan en rutas relativas
+    (datos/...), así que cada prueba empieza sin datos y sin nada en las caches.
+    """
+    from utilidades import manejador_sqlite
+    from utilidades.cache import cache_datos, cache_previsualizaciones
+
+    monkeypatch.chdir(tmp_path)
+    # La base SQLite tiene la misma ruta relativa en cada prueba: su esquema se vuelve a crear
+    manejador_sqlite._esquemas_creados.clear()
+    cache_datos.limpiar()
+    cache_previsualizaciones.limpiar()
+    yield tmp_path
+    cache_datos.limpiar()
+    cache_previsualizaciones.limpiar()
+
+# Configuración mínima para las pruebas de la API: el recurso 1 (RAM, a 1 por hora) y la
+# instancia 10 del cliente 1
+CONFIGURACION = '''<configuracion>
+<recursos><recurso><id>1</id><nombre>RAM</nombre><abreviatura>RAM</abreviatura><metrica>Gb</metrica>
+<precio_hora>1</precio_hora></recurso></recursos>
+<clientes><cliente><id>1</id><nit>123-K</nit><nombre>Ana</nombre><direccion>z1</direccion></cliente></clientes>
+<instancias><instancia><id>10</id><id_cliente>1</id_cliente><id_configuracion>1</id_configuracion>
+<nombre>web</nombre><fecha_inicio>01/01/2024</fecha_inicio></instancia></instancias>
+</configuracion>'''
+
+@pytest.fixture
+def cliente(directorio_datos):
+    """Cliente de prueba de la API con el sistema reiniciado y CONFIGURACION cargada"""
+    # Importación diferida: el almacenamiento usa rutas relativas al directorio de la prueba
+    from app import app
+    cliente = app.test_client()
+    cliente.post('/reiniciarSistema')
+    cliente.post('/crearConfiguracion', data=CONFIGURACION)
+    return cliente
@@ -0,0 +1,74 @@
+"""
+Memoria (tracemalloc) de los consumos de una facturación según cómo se guardan: lista de
+diccionarios como los entrega el almacenamiento, objetos Consumo o ConsumosColumnar, y el
+pico de MotorFacturacion.facturar con diccionarios o con ConsumosColumnar.
+Cada representación se arma leyendo de nuevo el mismo XML de consumos y se mide desde la
+lectura hasta el contenedor terminado: ninguna comparte strings con otra ya construida,
+como pasaría si los objetos se armaran a partir de los diccionarios medidos antes.
+
+    python pruebas/medir_memoria_consumos.py [cantidad]    (por defecto 200000)
+"""
+import io
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelos.consumo import Consumo, ConsumosColumnar
+from utilidades.consumos_xml import iterar_consumos
+from utilidades.facturacion import MotorFacturacion
+
+CANTIDAD = 200000
+
+def documento(cantidad):
+    """XML de consumos como el que recibe /cargarConsumos"""
+    return ''.join(['<consumos>'] + [
+        f'<consumo><id>{i}</id><id_instancia>{i % 500}</id_instancia><id_recurso>{i % 5}</id_recurso>'
+        f'<fecha>{1 + i % 28:02d}/{1 + i % 12:02d}/2024 10:00</fecha><tiempo>{1 + i % 7}.5</tiempo></consumo>'
+        for i in range(cantidad)
+    ] + ['</consumos>']).encode('utf-8')
+
+def leer(contenido):
+    """Diccionarios de strings recién leídos del XML, uno por consumo"""
+    return iterar_consumos(io.BytesIO(contenido))
+
+def medir(funcion):
+    """Retorna (resultado, bytes retenidos por el resultado, pico durante la llamada)"""
+    tracemalloc.start()
+    resultado = funcion()
+    retenidos, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, retenidos, pico
+
+def motor():
+    instancias = [{"id": str(i), "id_cliente": str(i % 50), "nombre": f"vm{i}", "id_configuracion": "1"}
+                  for i in range(500)]
+    recursos = [{"id": str(i), "nombre": f"r{i}", "abreviatura": "u", "precio_hora": "0.25"}
+                for i in range(5)]
+    clientes = [{"id": str(i), "nombre": f"c{i}"} for i in range(50)]
+    return MotorFacturacion(instancias, recursos, clientes, modo='numpy', procesos=1)
+
+def main(cantidad):
+    contenido = documento(cantidad)
+    mb = 1024 * 1024
+
+    representaciones = (
+        ("diccionarios", lambda: list(leer(contenido))),
+        ("objetos Consumo", lambda: [Consumo.from_dict(item) for item in leer(contenido)]),
+        ("ConsumosColumnar", lambda: ConsumosColumnar.from_items(leer(contenido))),
+    )
+    resultados = {}
+    for nombre, construir in representaciones:
+        resultados[nombre], retenidos, pico = medir(construir)
+        print(f"{nombre:<18} {retenidos / mb:8.1f} MB   (pico al leer {pico / mb:8.1f} MB)")
+
+    # Pico de la facturación sin contar los consumos de entrada, que ya estaban en memoria
+    motor_facturacion = motor()
+    for nombre in ("diccionarios", "ConsumosColumnar"):
+        consumos = resultados[nombre]
+        _, _, pico = medir(lambda: motor_facturacion.facturar(consumos, "31/12/2024"))
+        print(f"facturar con {nombre:<18} pico {pico / mb:8.1f} MB")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else CANTIDAD)
@@ -0,0 +1,141 @@
+"""
+Facturación de referencia: el cálculo que hacía generarFactura antes de MotorFacturacion,
+buscando la instancia, el recurso y el cliente de cada consumo con un recorrido de las
+listas completas (O(consumos × (instancias + recursos))). Se conserva para comprobar que
+el motor factura lo mismo. Las adiciones son el cobro por configuración de los consumos
+sin recurso, que se busca en las tarifas de la misma forma, y el detalle agrupado por
+cargo (detalle_por_cargo) que entrega el motor en lugar de una línea por consumo.
+"""
+from modelos.factura import Factura
+
+def detalle_por_cargo(consumos):
+    """Suma el detalle de cada consumo por recurso o configuración, en orden de aparición"""
+    lineas = {}
+    for consumo in consumos:
+        clave = (consumo.get("id_recurso"), consumo.get("id_configuracion"))
+        if clave not in lineas:
+            datos_cargo = {k: v for k, v in consumo.items() if k not in ("tiempo", "precio_hora", "monto")}
+            lineas[clave] = [datos_cargo, consumo["precio_hora"], 0, 0.0, 0.0]
+        linea = lineas[clave]
+        linea[2] += 1
+        linea[3] += float(consumo["tiempo"])
+        linea[4] += float(consumo["monto"])
+    return [{**datos_cargo, "cantidad": str(cantidad), "tiempo": str(tiempo),
+             "precio_hora": precio_hora, "monto": str(round(monto, 2))}
+            for datos_cargo, precio_hora, cantidad, tiempo, monto in lineas.values()]
+
+def facturar_referencia(consumos_filtrados, instancias_totales, recursos_totales, clientes_totales,
+                        fecha_emision, tarifas=()):
+    """Lista de (Factura, cliente), como MotorFacturacion.facturar"""
+    # Agrupar consumos por cliente
+    consumos_por_cliente = {}
+
+    for consumo in consumos_filtrados:
+        id_instancia = consumo.get("id_instancia")
+
+        # Buscar la instancia asociada
+        instancia = None
+        for inst in instancias_totales:
+            if str(inst.get("id")) == str(id_instancia):
+                instancia = inst
+                break
+
+        if not instancia:
+            continue  # Saltar si no se encuentra la instancia
+
+        id_cliente = instancia.get("id_cliente")
+
+        # Inicializar estructura para el cliente si no existe
+        if id_cliente not in consumos_por_cliente:
+            consumos_por_cliente[id_cliente] = {
+                "instancias": {}
+            }
+
+        # Inicializar estructura para la instancia si no existe
+        if id_instancia not in consumos_por_cliente[id_cliente]["instancias"]:
+            consumos_por_cliente[id_cliente]["instancias"][id_instancia] = {
+                "nombre": instancia.get("nombre", "Sin nombre"),
+                "consumos": []
+            }
+
+        # Buscar el recurso asociado al consumo
+        id_recurso = consumo.get("id_recurso")
+        if id_recurso is not None and id_recurso != "":
+            recurso = None
+            for rec in recursos_totales:
+                if str(rec.get("id")) == str(id_recurso):
+                    recurso = rec
+                    break
+
+            if not recurso:
+                continue  # Saltar si no se encuentra el recurso
+
+            precio_hora = float(recurso.get("precio_hora", 0))
+            datos_cargo = {
+                "id_recurso": recurso.get("id"),
+                "nombre_recurso": recurso.get("nombre", ""),
+                "abreviatura": recurso.get("abreviatura", "")
+            }
+        else:
+            # Sin recurso: tarifa de la configuración de la instancia
+            tarifa = None
+            for tar in tarifas:
+                if str(tar.get("id")) == str(instancia.get("id_configuracion")):
+                    tarifa = tar
+                    break
+
+            if not tarifa:
+                continue
+
+            precio_hora = float(tarifa.get("precio_hora", 0))
+            datos_cargo = {
+                "id_configuracion": tarifa.get("id"),
+                "nombre_recurso": f"Configuración {tarifa.get('nombre', '')}",
+                "abreviatura": ""
+            }
+
+        # Calcular el monto del consumo
+        tiempo = float(consumo.get("tiempo", 0))
+        monto = tiempo * precio_hora
+
+        # Agregar consumo detallado
+        consumos_por_cliente[id_cliente]["instancias"][id_instancia]["consumos"].append({
+            **datos_cargo,
+            "tiempo": str(tiempo),
+            "precio_hora": str(precio_hora),
+            "monto": str(round(monto, 2))
+        })
+
+    # Generar facturas por cliente
+    facturas_generadas = []
+
+    for id_cliente, datos_cliente in consumos_por_cliente.items():
+        # Buscar información del cliente
+        cliente = None
+        for cli in clientes_totales:
+            if str(cli.get("id")) == str(id_cliente):
+                cliente = cli
+                break
+
+        if not cliente:
+            continue
+
+        # Crear objeto Factura
+        factura = Factura(
+            id_cliente=id_cliente,
+            fecha_emision=fecha_emision,
+            monto_total=0
+        )
+
+        # Agregar items (instancias con sus consumos)
+        for id_instancia, datos_instancia in datos_cliente["instancias"].items():
+            factura.agregar_item(
+                id_instancia=id_instancia,
+                nombre_instancia=datos_instancia["nombre"],
+                consumos=detalle_por_cargo(datos_instancia["consumos"]),
+                subtotal=sum(float(c["monto"]) for c in datos_instancia["consumos"])
+            )
+
+        facturas_generadas.append((factura, cliente))
+
+    return facturas_generadas
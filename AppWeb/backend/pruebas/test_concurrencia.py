@@ -0,0 +1,90 @@
+import multiprocessing
+from datetime import datetime
+
+import pytest
+
+from utilidades.almacenamiento import crear_manejador
+
+PROCESOS = 4
+OPERACIONES = 30
+
+def _fecha(mes, dia):
+    return f"{dia:02d}/{mes:02d}/2024 10:00"
+
+def _trabajador(numero, inicio):
+    """
+    Un proceso que escribe a la vez que los demás: agrega, actualiza y elimina recursos
+    (un solo XML) y consumos (particionados por mes), alternando una operación de cada uno
+    """
+    # Los módulos se importan en el proceso hijo, con el MODO_XML del entorno
+    from utilidades.almacenamiento import crear_manejador
+
+    recursos = crear_manejador('recursos', 'xml')
+    consumos = crear_manejador('consumos', 'xml')
+    inicio.wait()
+    for k in range(OPERACIONES):
+        recursos.agregar({"id": f"{numero}-{k}", "nombre": f"recurso {k}", "precio_hora": "1"})
+        consumos.agregar_lote([{
+            "id": f"{numero}-{k}-{parte}",
+            "id_instancia": str(numero),
+            "id_recurso": "1",
+            "fecha": _fecha(1 + (k + parte) % 6, 1 + numero),
+            "tiempo": "1.5"
+        } for parte in range(2)])
+        if k % 2 == 0:
+            recursos.actualizar(f"{numero}-{k}", {"nombre": "actualizado"})
+        if k % 5 == 0:
+            recursos.eliminar(f"{numero}-{k}")
+        if k % 4 == 1:
+            # Cambia de mes: se mueve a otra partición
+            consumos.actualizar(f"{numero}-{k}-0", {"fecha": _fecha(7, 1 + numero)})
+        if k % 7 == 0:
+            consumos.eliminar(f"{numero}-{k}-1")
+
+def _esperados():
+    recursos, consumos = {}, {}
+    for numero in range(PROCESOS):
+        for k in range(OPERACIONES):
+            if k % 5:
+                recursos[f"{numero}-{k}"] = "actualizado" if k % 2 == 0 else f"recurso {k}"
+            for parte in range(2):
+                mes = 7 if k % 4 == 1 and parte == 0 else 1 + (k + parte) % 6
+                if not (k % 7 == 0 and parte == 1):
+                    consumos[f"{numero}-{k}-{parte}"] = _fecha(mes, 1 + numero)
+    return recursos, consumos
+
+@pytest.mark.parametrize("modo", ["xml", "journal"])
+def test_escrituras_concurrentes_sin_perdidas(directorio_datos, monkeypatch, modo):
+    monkeypatch.setenv("MODO_XML", modo)
+    # Bitácora chica para que también se compacte mientras otros procesos escriben
+    monkeypatch.setenv("LIMITE_JOURNAL", "2048")
+
+    # spawn: cada proceso arranca de cero y lee la configuración del entorno
+    contexto = multiprocessing.get_context("spawn")
+    inicio = contexto.Event()
+    procesos = [contexto.Process(target=_trabajador, args=(numero, inicio)) for numero in range(PROCESOS)]
+    for proceso in procesos:
+        proceso.start()
+    inicio.set()
+    for proceso in procesos:
+        proceso.join(120)
+        assert proceso.exitcode == 0
+
+    recursos_esperados, consumos_esperados = _esperados()
+
+    recursos = crear_manejador('recursos', 'xml').obtener_todos()
+    assert {item["id"]: item["nombre"] for item in recursos} == recursos_esperados
+    assert len(recursos) == len(recursos_esperados)
+
+    consumos = crear_manejador('consumos', 'xml')
+    todos = consumos.obtener_todos()
+    assert {item["id"]: item["fecha"] for item in todos} == consumos_esperados
+    assert len(todos) == len(consumos_esperados)
+
+    # El índice por fecha llega a todos los consumos y a ninguno que no corresponda
+    periodo = list(consumos.iterar_periodo(datetime(2024, 1, 1), datetime(2024, 12, 31)))
+    assert {item["id"]: item["fecha"] for item in periodo} == consumos_esperados
+    assert len(periodo) == len(consumos_esperados)
+    junio = [item["id"] for item in consumos.iterar_periodo(datetime(2024, 6, 1), datetime(2024, 6, 30))]
+    assert sorted(junio) == sorted(id_consumo for id_consumo, fecha in consumos_esperados.items()
+                                   if fecha[3:5] == "06")
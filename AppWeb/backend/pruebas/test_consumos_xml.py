@@ -0,0 +1,30 @@
+import io
+
+import pytest
+import xmltodict
+
+from utilidades.archivo_configuraciones import leer_listado_consumos
+from utilidades.consumos_xml import iterar_consumos
+
+CONSUMOS = b'''<consumos>
+  <consumo><id_instancia> 10 </id_instancia><id_recurso>1</id_recurso><fecha>05/05/2024</fecha>
+    <tiempo>2.5</tiempo><nota/></consumo>
+  <consumo extra="x"><id_instancia>11</id_instancia><fecha tz="-6">05/05/2024</fecha><tiempo>1</tiempo></consumo>
+  <otro><consumo><id_instancia>12</id_instancia></consumo></otro>
+</consumos>'''
+
+def test_igual_que_xmltodict():
+    esperado = xmltodict.parse(CONSUMOS)["consumos"]["consumo"]
+    assert list(iterar_consumos(io.BytesIO(CONSUMOS))) == [dict(consumo) for consumo in esperado]
+
+def test_listado_de_consumos():
+    listado = b'''<listadoConsumos><consumo nitCliente="123-K" idInstancia="10">
+        <tiempo>2.5</tiempo><fechaHora>05/05/2024 10:00</fechaHora></consumo></listadoConsumos>'''
+    esperado = leer_listado_consumos(xmltodict.parse(listado)["listadoConsumos"])
+    assert list(iterar_consumos(io.BytesIO(listado))) == [dict(consumo) for consumo in esperado]
+
+@pytest.mark.parametrize("documento", [b'', b'<consumos></consumos>', b'<otro><consumo/></otro>',
+                                       b'<consumos><consumo><a>1</a></consumo><consumo>'])
+def test_documentos_invalidos(documento):
+    with pytest.raises(ValueError):
+        list(iterar_consumos(io.BytesIO(documento)))
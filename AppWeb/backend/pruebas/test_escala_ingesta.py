@@ -0,0 +1,7 @@
+import benchmark_ingesta
+
+def test_carga_lineal(directorio_datos):
+    # 18000 consumos en lotes de 300: muchas escrituras con pocos datos, como una carga
+    # grande con el LOTE_CARGA por defecto
+    crecimiento = benchmark_ingesta.crecimiento_por_lote(18000, 300)
+    assert crecimiento <= benchmark_ingesta.CRECIMIENTO_MAXIMO
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from modelos.consumo import ConsumosColumnar
+from utilidades.facturacion import MotorFacturacion, np
+from referencia_facturacion import facturar_referencia
+
+RONDAS = 30
+
+def _datos(semilla):
+    """
+    Datos aleatorios con ids repetidos (gana la primera aparición), ids como número o texto
+    y consumos de instancias, recursos, configuraciones y clientes que no existen
+    """
+    aleatorio = random.Random(semilla)
+    recursos = [{"id": str(i), "nombre": f"r{i}", "abreviatura": "u",
+                 "precio_hora": str(aleatorio.choice([40, 55.5, 0.333, 12.75, 19.99]))}
+                for i in range(aleatorio.randint(0, 8))]
+    recursos += [dict(recurso, precio_hora="1") for recurso in recursos[:2]]
+    tarifas = [{"id": str(i), "nombre": f"t{i}", "precio_hora": str(aleatorio.choice([3.5, 7.125, 0.01]))}
+               for i in range(aleatorio.randint(0, 4))]
+    tarifas += [dict(tarifa, precio_hora="2") for tarifa in tarifas[:1]]
+    clientes = [{"id": str(i), "nit": f"{i}-K", "nombre": f"c{i}"} for i in range(aleatorio.randint(0, 10))]
+    clientes += [dict(cliente, nit="0-0") for cliente in clientes[:1]]
+    instancias = [{"id": str(i), "id_cliente": str(aleatorio.randint(0, 12)), "nombre": f"i{i}",
+                   "id_configuracion": str(aleatorio.randint(0, 5))}
+                  for i in range(aleatorio.randint(0, 30))]
+    instancias += [dict(instancia, id_cliente="0") for instancia in instancias[:3]]
+    consumos = []
+    for _ in range(aleatorio.randint(0, 2000)):
+        id_instancia = aleatorio.randint(0, 35)
+        consumos.append({
+            "id_instancia": id_instancia if aleatorio.random() < 0.1 else str(id_instancia),
+            "id_recurso": aleatorio.choice([None, "", str(aleatorio.randint(0, 10))]),
+            "fecha": "15/05/2024 10:00",
+            "tiempo": str(round(aleatorio.random() * 10, aleatorio.randint(0, 4)))
+        })
+    return consumos, instancias, recursos, clientes, tarifas
+
+def _resumen(facturas, decimales=None):
+    """Clientes, items y totales de las facturas; con decimales los montos se redondean"""
+    redondear = (lambda monto: round(monto, decimales)) if decimales is not None else (lambda monto: monto)
+    return [(factura.id_cliente, cliente, factura.fecha_emision, redondear(factura.monto_total),
+             [(item["id_instancia"], item["nombre_instancia"], item["consumos"], redondear(item["subtotal"]))
+              for item in factura.items])
+            for factura, cliente in facturas]
+
+@pytest.mark.parametrize("procesos", [1, 2])
+def test_motor_igual_a_la_referencia(procesos):
+    for ronda in range(RONDAS if procesos == 1 else 5):
+        consumos, instancias, recursos, clientes, tarifas = _datos(ronda)
+        esperadas = _resumen(facturar_referencia(consumos, instancias, recursos, clientes, "31/05/2024", tarifas))
+
+        motor = MotorFacturacion(instancias, recursos, clientes, tarifas, modo='escalar', procesos=procesos)
+        assert _resumen(motor.facturar(consumos, "31/05/2024")) == esperadas, ronda
+        columnar = ConsumosColumnar.from_items(consumos)
+        assert _resumen(motor.facturar(columnar, "31/05/2024")) == esperadas, ronda
+
+@pytest.mark.skipif(np is None, reason="requiere numpy")
+def test_motor_vectorizado_igual_a_la_referencia():
+    for ronda in range(RONDAS):
+        consumos, instancias, recursos, clientes, tarifas = _datos(ronda)
+        esperadas = facturar_referencia(consumos, instancias, recursos, clientes, "31/05/2024", tarifas)
+
+        motor = MotorFacturacion(instancias, recursos, clientes, tarifas, modo='numpy', procesos=1)
+        for entrada in (consumos, ConsumosColumnar.from_items(consumos)):
+            facturas = motor.facturar(entrada, "31/05/2024")
+            # Los subtotales se suman con bincount: iguales al centavo, no al último bit
+            assert _resumen(facturas, 2) == _resumen(esperadas, 2), ronda
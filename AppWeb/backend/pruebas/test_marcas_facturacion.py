@@ -0,0 +1,79 @@
+import re
+import threading
+
+import pytest
+
+from utilidades.almacenamiento import crear_manejador
+from utilidades.facturacion import MarcasFacturacion
+
+def _cargar(cliente, *fechas):
+    consumos = ''.join(f'<consumo><id_instancia>10</id_instancia><id_recurso>1</id_recurso>'
+                       f'<fecha>{fecha}</fecha><tiempo>1</tiempo></consumo>' for fecha in fechas)
+    cliente.post('/cargarConsumos', data=f'<consumos>{consumos}</consumos>')
+
+def _facturar(cliente, inicio, fin):
+    respuesta = cliente.post('/generarFactura', data=f'<periodo><fecha_inicio>{inicio}</fecha_inicio>'
+                                                     f'<fecha_fin>{fin}</fecha_fin></periodo>')
+    texto = respuesta.get_data(as_text=True)
+    campos = ('facturas_generadas', 'consumos_ya_facturados')
+    return tuple(int(re.search(f'<{campo}>(\\d+)<', texto).group(1)) for campo in campos)
+
+def test_periodo_anterior_a_uno_facturado(cliente):
+    _cargar(cliente, "10/05/2024 10:00", "10/06/2024 10:00")
+    assert _facturar(cliente, "01/06/2024", "30/06/2024") == (1, 0)
+    # Mayo no se había facturado: la marca de junio no lo recorta
+    assert _facturar(cliente, "01/05/2024", "31/05/2024") == (1, 0)
+    assert _facturar(cliente, "01/05/2024", "30/06/2024") == (0, 2)
+
+def test_consumo_cargado_tarde_fuera_de_lo_facturado(cliente):
+    _cargar(cliente, "10/06/2024 10:00")
+    assert _facturar(cliente, "01/06/2024", "30/06/2024") == (1, 0)
+    # Llega después un consumo de abril, anterior a la marca de junio
+    _cargar(cliente, "20/04/2024 08:00")
+    assert _facturar(cliente, "01/04/2024", "30/06/2024") == (1, 1)
+
+def test_intervalos_vigentes(directorio_datos):
+    manejador = crear_manejador('marcas_facturacion', 'xml')
+    manejador.agregar_lote([
+        {"id": "1", "id_cliente": "1", "desde_ts": 100, "fecha_ts": 200},
+        {"id": "2", "id_cliente": "1", "desde_ts": 500, "fecha_ts": 600},
+        {"id": "3", "id_cliente": "1", "desde_ts": 150, "fecha_ts": 300},
+        # Marca sin desde_ts: cubre todo lo anterior
+        {"id": "4", "id_cliente": "2", "fecha_ts": 50},
+    ])
+    marcas = MarcasFacturacion(manejador)
+    vigentes = marcas.vigentes()
+    assert vigentes["1"] == [(100, 300), (500, 600)]
+
+    facturados = [fecha_ts for fecha_ts in (99, 100, 300, 301, 499, 550, 601)
+                  if marcas.facturado(vigentes["1"], fecha_ts)]
+    assert facturados == [100, 300, 550]
+    assert marcas.facturado(vigentes["2"], -10) and not marcas.facturado(vigentes["2"], 51)
+    assert marcas.ultima(vigentes["1"]) == 600
+
+def test_generaciones_simultaneas_no_facturan_dos_veces(cliente, monkeypatch):
+    from utilidades.facturacion import MotorFacturacion
+    _cargar(cliente, "10/05/2024 10:00")
+
+    # Cada generación espera a la otra después de leer las marcas: sin el bloqueo ambas
+    # verían el consumo sin facturar
+    barrera = threading.Barrier(2)
+    facturar = MotorFacturacion.facturar
+    def facturar_a_la_vez(self, *args):
+        try:
+            barrera.wait(timeout=1)
+        except threading.BrokenBarrierError:
+            pass
+        return facturar(self, *args)
+    monkeypatch.setattr(MotorFacturacion, "facturar", facturar_a_la_vez)
+
+    from app import app
+    resultados = []
+    def generar():
+        resultados.append(_facturar(app.test_client(), "01/05/2024", "31/05/2024"))
+    hilos = [threading.Thread(target=generar) for _ in range(2)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert sorted(resultados) == [(0, 1), (1, 0)]
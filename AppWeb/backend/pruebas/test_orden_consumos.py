@@ -0,0 +1,75 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from utilidades.almacenamiento import crear_manejador, como_texto
+
+def _consumos(cantidad, semilla=3):
+    """Consumos de varios meses cargados fuera de orden cronológico, con fechas repetidas"""
+    aleatorio = random.Random(semilla)
+    return [{
+        "id_instancia": str(aleatorio.randint(18, 22)),
+        "id_recurso": "1",
+        "fecha": f"{aleatorio.randint(1, 28):02d}/{aleatorio.choice([3, 5, 4]):02d}/2024 "
+                 f"{aleatorio.randint(0, 3):02d}:00",
+        "tiempo": str(aleatorio.random())
+    } for _ in range(cantidad)]
+
+def _lecturas(backend):
+    manejador = crear_manejador('consumos', backend)
+    consumos = _consumos(300)
+    manejador.agregar_lote([dict(consumo) for consumo in consumos[:150]])
+    manejador.agregar_lote([dict(consumo) for consumo in consumos[150:]])
+
+    def normalizar(items):
+        # El timestamp de guardado difiere entre backends; fecha_ts se compara como texto
+        return [como_texto({k: v for k, v in item.items() if k != "timestamp"}) for item in items]
+
+    return {
+        "iterar": normalizar(manejador.iterar()),
+        "obtener_todos": normalizar(manejador.obtener_todos()),
+        "iterar_periodo": normalizar(manejador.iterar_periodo(datetime(2024, 3, 10), datetime(2024, 5, 5))),
+        "consultar_filtro": normalizar(manejador.consultar({"id_instancia": "20"}, None, 0, 2)),
+        "consultar_pagina": normalizar(manejador.consultar(None, None, 7, 5)),
+    }
+
+def test_consumos_en_el_mismo_orden_en_ambos_backends(directorio_datos):
+    xml = _lecturas('xml')
+    sqlite = _lecturas('sqlite')
+    for lectura in xml:
+        assert xml[lectura] == sqlite[lectura], lectura
+
+@pytest.mark.parametrize("backend", ["xml", "sqlite"])
+def test_consumos_en_orden_cronologico(directorio_datos, backend):
+    items = _lecturas(backend)["iterar"]
+    tiempos = [int(item["fecha_ts"]) for item in items]
+    assert tiempos == sorted(tiempos)
+    # Con la misma fecha se conserva el orden de inserción
+    consumos = _consumos(300)
+    for fecha_ts in set(tiempos):
+        mismos = [item for item in items if int(item["fecha_ts"]) == fecha_ts]
+        cargados = [c for c in consumos if c["tiempo"] in {item["tiempo"] for item in mismos}]
+        assert [item["tiempo"] for item in mismos] == [c["tiempo"] for c in cargados]
+
+@pytest.mark.parametrize("backend", ["xml", "sqlite"])
+def test_lote_rechazado_no_guarda_nada(directorio_datos, backend):
+    manejador = crear_manejador('consumos', backend)
+    manejador.agregar_lote([{"id": "a", "fecha": "10/06/2024 10:00", "tiempo": "1"}])
+    # El id repetido está en junio: mayo no debe quedar guardado
+    with pytest.raises(ValueError):
+        manejador.agregar_lote([{"id": "b", "fecha": "10/05/2024 10:00", "tiempo": "1"},
+                                {"id": "a", "fecha": "11/06/2024 10:00", "tiempo": "1"}])
+    assert [item["id"] for item in manejador.iterar()] == ["a"]
+    assert [item["id"] for item in manejador.iterar_periodo(datetime(2024, 1, 1), datetime(2024, 12, 31))] == ["a"]
+
+@pytest.mark.parametrize("backend", ["xml", "sqlite"])
+def test_id_repetido_en_otro_mes(directorio_datos, backend):
+    manejador = crear_manejador('consumos', backend)
+    with pytest.raises(ValueError):
+        manejador.agregar_lote([{"id": "b", "fecha": "10/05/2024 10:00", "tiempo": "1"},
+                                {"id": "b", "fecha": "10/06/2024 10:00", "tiempo": "1"}])
+    manejador.agregar_lote([{"id": "b", "fecha": "10/05/2024 10:00", "tiempo": "1"}])
+    with pytest.raises(ValueError):
+        manejador.agregar_lote([{"id": "b", "fecha": "10/06/2024 10:00", "tiempo": "1"}])
+    assert [item["id"] for item in manejador.iterar()] == ["b"]
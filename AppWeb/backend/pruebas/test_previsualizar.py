@@ -0,0 +1,49 @@
+import xmltodict
+
+from utilidades.almacenamiento import crear_manejador
+
+PERIODO = '<periodo><fecha_inicio>01/05/2024</fecha_inicio><fecha_fin>31/05/2024</fecha_fin></periodo>'
+
+def _cargar(cliente, *tiempos):
+    consumos = ''.join(f'<consumo><id_instancia>10</id_instancia><id_recurso>1</id_recurso>'
+                       f'<fecha>10/05/2024 10:00</fecha><tiempo>{tiempo}</tiempo></consumo>'
+                       for tiempo in tiempos)
+    cliente.post('/cargarConsumos', data=f'<consumos>{consumos}</consumos>')
+
+def _respuesta(cliente, ruta):
+    (respuesta,) = xmltodict.parse(cliente.post(ruta, data=PERIODO).get_data()).values()
+    return respuesta
+
+def _como_lista(valor):
+    return valor if isinstance(valor, list) else [valor]
+
+def _facturas(respuesta):
+    return _como_lista((respuesta.get("facturas") or {}).get("factura", []))
+
+def test_monto_total_con_dos_decimales(cliente):
+    # 0.1 + 0.2 en float es 0.30000000000000004
+    _cargar(cliente, "0.1", "0.2")
+    assert _respuesta(cliente, '/previsualizarFactura')["monto_total"] == "0.30"
+
+def test_previsualizar_no_guarda_nada(cliente):
+    _cargar(cliente, "1.5")
+    assert _respuesta(cliente, '/previsualizarFactura')["facturas_generadas"] == "1"
+    assert crear_manejador('facturas').obtener_todos() == []
+    assert crear_manejador('marcas_facturacion').obtener_todos() == []
+    # Los consumos siguen sin facturar
+    assert _respuesta(cliente, '/generarFactura')["facturas_generadas"] == "1"
+
+def test_totales_iguales_a_generar_factura(cliente):
+    _cargar(cliente, "0.1", "0.2", "2.345", "7")
+    previsualizacion = _respuesta(cliente, '/previsualizarFactura')
+    generada = _respuesta(cliente, '/generarFactura')
+
+    montos = [factura["monto_total"] for factura in _facturas(generada)]
+    assert [factura["monto_total"] for factura in _facturas(previsualizacion)] == montos
+    assert previsualizacion["monto_total"] == f"{sum(float(monto) for monto in montos):.2f}"
+    # El detalle previsualizado es el mismo que quedó guardado
+    (guardada,) = crear_manejador('facturas').obtener_todos()
+    def detalle(items):
+        return [(item["id_instancia"], item["subtotal"], _como_lista(item["consumos"]))
+                for item in _como_lista(items)]
+    assert detalle(_facturas(previsualizacion)[0]["items"]) == detalle(guardada["items"])
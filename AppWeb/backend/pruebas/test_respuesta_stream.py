@@ -0,0 +1,42 @@
+import json
+
+import pytest
+import xmltodict
+
+from utilidades.formatos import serializar_en_bloques, XML, JSON
+
+def _items(cantidad, falla=True):
+    for i in range(cantidad):
+        yield {"id": str(i), "nombre": "x" * 100}
+    if falla:
+        raise OSError("disco desconectado")
+
+@pytest.mark.parametrize("formato", [XML, JSON])
+def test_error_despues_del_primer_bloque(formato):
+    bloques = list(serializar_en_bloques({"recursos": {"recurso": _items(2000)}, "total": 3}, formato))
+    assert len(bloques) > 1
+    documento = b"".join(b if isinstance(b, bytes) else b.encode() for b in bloques)
+    # El documento enviado queda bien formado y termina con el error
+    if formato == XML:
+        respuesta = xmltodict.parse(documento)["respuesta"]
+        assert list(respuesta) == ["recursos", "error"]
+    else:
+        respuesta = json.loads(documento)
+        assert list(respuesta) == ["respuesta", "error"]
+        respuesta = {"recursos": respuesta["respuesta"]["recursos"], "error": respuesta["error"]}
+    # Los items enviados antes del error se conservan; "total" ya no se envía
+    assert len(respuesta["recursos"]["recurso"]) == 2000
+    assert "disco desconectado" in respuesta["error"]
+
+@pytest.mark.parametrize("formato", [XML, JSON])
+def test_error_antes_del_primer_bloque(formato):
+    with pytest.raises(Exception, match="disco desconectado"):
+        next(serializar_en_bloques({"recursos": {"recurso": _items(3)}}, formato))
+
+def test_consulta_que_falla_al_empezar(directorio_datos, monkeypatch):
+    # Importación diferida: el almacenamiento usa rutas relativas al directorio de la prueba
+    from app import app
+    from utilidades.manejador_xml import XMLManager
+    monkeypatch.setattr(XMLManager, "iterar", lambda self: _items(0))
+    respuesta = app.test_client().get('/consultarDatos?tipo=recursos')
+    assert xmltodict.parse(respuesta.get_data())["respuesta"] == {"error": "disco desconectado"}
@@ -0,0 +1,47 @@
+from datetime import datetime
+
+import pytest
+
+from utilidades.almacenamiento import crear_manejador
+from utilidades.resumen_diario import ResumenDiario
+
+def _consumo(fecha, tiempo="1", id_instancia="10"):
+    return {"id_instancia": id_instancia, "id_recurso": "1", "fecha": fecha, "tiempo": tiempo}
+
+@pytest.mark.parametrize("backend", ["xml", "sqlite"])
+def test_reconstruir_reemplaza_el_resumen(directorio_datos, backend):
+    resumen = ResumenDiario(crear_manejador('consumos_diarios', backend))
+    resumen.acumular([_consumo("05/05/2024 10:00"), _consumo("06/05/2024 10:00")])
+
+    def consumos():
+        # Mientras se recalcula, el resumen anterior sigue completo
+        assert len(list(resumen.manejador.iterar())) == 2
+        yield _consumo("05/05/2024 10:00", "2")
+        yield _consumo("05/05/2024 11:00", "3")
+
+    assert resumen.reconstruir(consumos()) == 1
+    (fila,) = resumen.manejador.iterar()
+    assert (fila["id"], float(fila["tiempo"]), int(fila["cantidad"])) == ("20240505|10|1", 5.0, 2)
+
+def _lecturas(backend):
+    resumen = ResumenDiario(crear_manejador('consumos_diarios', backend))
+    resumen.acumular([_consumo("20/06/2024 10:00"), _consumo("05/05/2024 10:00", "2"),
+                      _consumo("31/05/2024 23:00", id_instancia="11")])
+    resumen.acumular([_consumo("05/05/2024 12:00", "0.5"), _consumo("01/04/2024 10:00")])
+
+    def normalizar(filas):
+        return [(fila["id"], float(fila["tiempo"]), int(fila["cantidad"])) for fila in filas]
+
+    return {
+        "iterar": normalizar(resumen.manejador.iterar()),
+        "periodo": normalizar(resumen.iterar_periodo(datetime(2024, 5, 1), datetime(2024, 5, 31))),
+    }
+
+def test_resumen_igual_en_ambos_backends(directorio_datos):
+    xml = _lecturas('xml')
+    assert xml == _lecturas('sqlite')
+    assert xml["periodo"] == [("20240505|10|1", 2.5, 2), ("20240531|11|1", 1.0, 1)]
+
+def test_resumen_particionado_por_mes(directorio_datos):
+    _lecturas('xml')
+    assert crear_manejador('consumos_diarios', 'xml').particiones() == ["2024-04", "2024-05", "2024-06"]
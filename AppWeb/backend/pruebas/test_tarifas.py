@@ -0,0 +1,40 @@
+import pytest
+
+from utilidades.almacenamiento import crear_manejador
+
+@pytest.mark.parametrize("backend", ["xml", "sqlite"])
+def test_reemplazar_en_una_escritura(directorio_datos, backend):
+    manejador = crear_manejador('tarifas_configuracion', backend)
+    manejador.agregar_lote([{"id": "1", "precio_hora": "1.0"}, {"id": "2", "precio_hora": "2.0"}])
+
+    def tarifas():
+        # Se consume con el bloqueo de escritura tomado: los datos anteriores siguen ahí
+        assert [item["id"] for item in manejador.iterar()] == ["1", "2"]
+        yield {"id": "3", "precio_hora": "3.0"}
+
+    assert manejador.reemplazar(tarifas()) == 1
+    assert [item["id"] for item in manejador.iterar()] == ["3"]
+
+    # Un id repetido no deja la tabla a medias
+    with pytest.raises(ValueError):
+        manejador.reemplazar([{"id": "4"}, {"id": "4"}])
+    assert [item["id"] for item in manejador.iterar()] == ["3"]
+
+def test_actualizar_tarifas(directorio_datos):
+    from utilidades.tarifas import actualizar_tarifas
+
+    crear_manejador('recursos').agregar_lote([{"id": "1", "precio_hora": "2"}])
+    crear_manejador('configuraciones').agregar_lote([{"id": "7", "nombre": "web"}])
+    crear_manejador('recursos_configuracion').agregar_lote(
+        [{"id": "1", "id_configuracion": "7", "id_recurso": "1", "cantidad": "3"}])
+    assert actualizar_tarifas() == 1
+    assert actualizar_tarifas() == 1
+    (tarifa,) = crear_manejador('tarifas_configuracion').obtener_todos()
+    assert (tarifa["id"], tarifa["precio_hora"]) == ("7", "6.0")
+
+def test_consultar_tarifas(directorio_datos):
+    # Importación diferida: el almacenamiento usa rutas relativas al directorio de la prueba
+    from app import app
+    crear_manejador('tarifas_configuracion').agregar_lote([{"id": "7", "precio_hora": "6.0"}])
+    texto = app.test_client().get('/consultarDatos?tipo=tarifas_configuracion').get_data(as_text=True)
+    assert "<tarifas_configuracion><tarifa_configuracion><id>7</id>" in texto.replace("\n", "").replace("\t", "")
@@ -0,0 +1,15 @@
+from utilidades.almacenamiento import crear_manejador
+from utilidades.version import firma_versiones
+from utilidades.vigencia import indice_vigencia
+
+def test_indice_con_instancias_leidas_antes_de_un_cambio(directorio_datos):
+    manejador = crear_manejador('instancias')
+    manejador.agregar({"id": "1", "fecha_inicio": "01/01/2024"})
+    version = firma_versiones('instancias')
+    instancias = manejador.obtener_todos()
+    # Otra petición agrega una instancia entre la lectura y el cálculo del índice
+    manejador.agregar({"id": "2", "fecha_inicio": "01/01/2024"})
+
+    assert sorted(indice_vigencia(instancias, version).ventanas) == ["1"]
+    # El índice armado con la lista anterior no se sirve como si fuera el vigente
+    assert sorted(indice_vigencia().ventanas) == ["1", "2"]
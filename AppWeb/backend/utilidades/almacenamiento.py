@@ -0,0 +1,157 @@
+from itertools import islice
+
+from config import BACKEND_ALMACENAMIENTO, RUTA_SQLITE
+from utilidades.fechas import datetime_a_timestamp, timestamp_de
+
+# Tipos de datos que maneja el sistema; cada uno es un archivo XML o una tabla SQLite.
+# marcas_facturacion guarda los intervalos de consumos facturados a cada cliente y
+# consumos_diarios es el resumen del tiempo consumido por instancia, recurso y día.
+# recursos_configuracion es la cantidad de cada recurso en una configuración y
+# tarifas_configuracion el precio por hora de cada configuración, calculado a partir de ellos
+TIPOS_DATOS = ['recursos', 'categorias', 'clientes', 'instancias', 'consumos', 'facturas',
+               'marcas_facturacion', 'consumos_diarios', 'configuraciones',
+               'recursos_configuracion', 'tarifas_configuracion']
+
+# Nombre del elemento de cada item de un tipo de datos en las respuestas XML
+# (<recursos><recurso>...</recurso></recursos>)
+ELEMENTOS_DATOS = {
+    'recursos': 'recurso',
+    'categorias': 'categoria',
+    'clientes': 'cliente',
+    'instancias': 'instancia',
+    'consumos': 'consumo',
+    'facturas': 'factura',
+    'marcas_facturacion': 'marca_facturacion',
+    'consumos_diarios': 'consumo_diario',
+    'configuraciones': 'configuracion',
+    'recursos_configuracion': 'recurso_configuracion',
+    'tarifas_configuracion': 'tarifa_configuracion',
+}
+
+def como_texto(valor):
+    """Convierte los valores a la misma representación que tendrían al releerse del XML"""
+    if isinstance(valor, dict):
+        return {k: como_texto(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [como_texto(v) for v in valor]
+    if isinstance(valor, bool):
+        return "true" if valor else "false"
+    if valor is None or isinstance(valor, str):
+        return valor
+    return str(valor)
+
+def filtrar_items(items, filtros=None, campos=None, offset=0, limite=None):
+    """
+    Aplica una consulta a una secuencia de items sin materializarla: conserva los que
+    tienen cada campo de filtros igual al valor indicado (comparado como texto), salta
+    offset, se detiene después de limite items y deja solo los campos pedidos.
+    """
+    if filtros:
+        filtros = {campo: como_texto(valor) for campo, valor in filtros.items()}
+        items = (item for item in items
+                 if all(como_texto(item.get(campo)) == valor for campo, valor in filtros.items()))
+    if offset or limite is not None:
+        items = islice(items, offset, None if limite is None else offset + limite)
+    if campos:
+        items = ({campo: item[campo] for campo in campos if campo in item} for item in items)
+    return items
+
+class Almacenamiento:
+    """Interfaz común de los backends de almacenamiento (XML y SQLite)"""
+
+    def obtener_todos(self):
+        """
+        Obtiene todos los items en orden de inserción; los consumos y el resumen diario, en
+        orden cronológico (fecha_ts y luego orden de inserción) en todos los backends
+        """
+        raise NotImplementedError
+
+    def iterar(self):
+        """Produce los items uno a uno, en el orden de obtener_todos, sin cargarlos todos en memoria"""
+        yield from self.obtener_todos()
+
+    def iterar_periodo(self, fecha_inicio, fecha_fin):
+        """Produce los items cuya fecha está entre dos datetime (inclusive), en el orden de iterar"""
+        desde = datetime_a_timestamp(fecha_inicio)
+        hasta = datetime_a_timestamp(fecha_fin)
+        for item in self.iterar():
+            fecha_ts = timestamp_de(item)
+            if fecha_ts is not None and desde <= fecha_ts <= hasta:
+                yield item
+
+    def consultar(self, filtros=None, campos=None, offset=0, limite=None):
+        """
+        Produce una página de items (ver filtrar_items). La lectura se detiene al completar
+        la página; un filtro por id se resuelve con obtener_por_id.
+        """
+        filtros = dict(filtros or {})
+        if "id" in filtros:
+            item = self.obtener_por_id(filtros.pop("id"))
+            return filtrar_items([item] if item else [], filtros, campos, offset, limite)
+        return filtrar_items(self.iterar(), filtros, campos, offset, limite)
+
+    def obtener_por_id(self, id_value):
+        """Obtiene un item por su ID (None si no existe)"""
+        raise NotImplementedError
+
+    def agregar(self, new_item):
+        """Agrega un nuevo item"""
+        return self.agregar_lote([new_item]) == 1
+
+    def agregar_lote(self, new_items):
+        """Agrega varios items y retorna cuántos se guardaron; ValueError si un id ya existe"""
+        raise NotImplementedError
+
+    def reemplazar(self, new_items):
+        """
+        Reemplaza todos los items por new_items en una sola escritura: quien lee ve los
+        items anteriores o los nuevos, nunca una tabla vacía o a medias. new_items se
+        consume ya tomado el bloqueo de escritura, así que puede ser un generador que los
+        calcule a partir de otros datos. Retorna cuántos items quedaron; ValueError, sin
+        cambiar nada, si un id se repite.
+        """
+        raise NotImplementedError
+
+    def actualizar(self, id_value, updated_data):
+        """Actualiza un item existente por su ID"""
+        return self.actualizar_lote({id_value: updated_data}) == 1
+
+    def actualizar_lote(self, cambios):
+        """Actualiza varios items (id -> campos a cambiar) y retorna cuántos existían"""
+        raise NotImplementedError
+
+    def eliminar(self, id_value):
+        """Elimina un item por su ID"""
+        raise NotImplementedError
+
+    def limpiar(self):
+        """Elimina todos los items"""
+        raise NotImplementedError
+
+    def bloqueo(self):
+        """
+        Bloqueo exclusivo entre procesos de estos datos (un context manager), para leerlos,
+        calcular y escribir sin que otro que tome el mismo bloqueo escriba en medio. Las
+        lecturas y escrituras del manejador se pueden hacer dentro del bloqueo.
+        """
+        raise NotImplementedError
+
+def crear_manejador(tipo, backend=None):
+    """Retorna el manejador de un tipo de datos según el backend configurado"""
+    # Importaciones locales: ambos manejadores heredan de Almacenamiento
+    from utilidades.manejador_xml import XMLManager
+    from utilidades.manejador_sqlite import SQLiteManager
+    from utilidades.manejador_particionado import ManejadorParticionado
+
+    if tipo not in TIPOS_DATOS:
+        raise ValueError(f"Tipo de datos '{tipo}' no válido")
+
+    backend = backend if backend else BACKEND_ALMACENAMIENTO
+    if backend == 'sqlite':
+        return SQLiteManager(RUTA_SQLITE, tipo)
+    if tipo in ('consumos', 'consumos_diarios'):
+        # Los consumos y su resumen diario se guardan en un archivo por mes
+        # (datos/<tipo>/yyyy-mm.xml): una consulta por periodo solo lee esos meses.
+        # Un datos/consumos_diarios.xml anterior se reemplaza con flask reconstruir-resumen
+        return ManejadorParticionado(f'datos/{tipo}')
+    return XMLManager(f'datos/{tipo}.xml')
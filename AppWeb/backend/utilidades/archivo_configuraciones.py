@@ -0,0 +1,99 @@
+from utilidades.fechas import buscar_fecha
+
+# Lectura del formato de archivo del enunciado (<archivoConfiguraciones> y <listadoConsumos>),
+# ya parseado con xmltodict, a los registros que guarda el sistema
+
+def _lista(contenedor, clave):
+    """Elementos hijos <clave> de un contenedor, siempre como lista"""
+    if not isinstance(contenedor, dict):
+        return []
+    elementos = contenedor.get(clave)
+    if elementos is None:
+        return []
+    return elementos if isinstance(elementos, list) else [elementos]
+
+def _texto(elemento):
+    """Texto de un elemento que puede traer atributos"""
+    return elemento.get("#text") if isinstance(elemento, dict) else elemento
+
+def leer_archivo_configuraciones(archivo):
+    """
+    Convierte un <archivoConfiguraciones> en los registros de cada tipo de datos:
+    recursos, categorias, configuraciones, recursos_configuracion (la cantidad de cada
+    recurso en una configuración), clientes e instancias. El id de un cliente es su NIT.
+    """
+    registros = {tipo: [] for tipo in ('recursos', 'categorias', 'configuraciones',
+                                        'recursos_configuracion', 'clientes', 'instancias')}
+
+    for recurso in _lista(archivo.get("listaRecursos"), "recurso"):
+        registros["recursos"].append({
+            "id": recurso.get("@id"),
+            "nombre": recurso.get("nombre"),
+            "abreviatura": recurso.get("abreviatura"),
+            "metrica": recurso.get("metrica"),
+            "tipo": recurso.get("tipo"),
+            "precio_hora": recurso.get("valorXhora")
+        })
+
+    for categoria in _lista(archivo.get("listaCategorias"), "categoria"):
+        registros["categorias"].append({
+            "id": categoria.get("@id"),
+            "nombre": categoria.get("nombre"),
+            "descripcion": categoria.get("descripcion"),
+            "carga_trabajo": categoria.get("cargaTrabajo")
+        })
+        for configuracion in _lista(categoria.get("listaConfiguraciones"), "configuracion"):
+            id_configuracion = configuracion.get("@id")
+            registros["configuraciones"].append({
+                "id": id_configuracion,
+                "id_categoria": categoria.get("@id"),
+                "nombre": configuracion.get("nombre"),
+                "descripcion": configuracion.get("descripcion")
+            })
+            for recurso in _lista(configuracion.get("recursosConfiguracion"), "recurso"):
+                registros["recursos_configuracion"].append({
+                    "id": f"{id_configuracion}|{recurso.get('@id')}",
+                    "id_configuracion": id_configuracion,
+                    "id_recurso": recurso.get("@id"),
+                    "cantidad": _texto(recurso)
+                })
+
+    for cliente in _lista(archivo.get("listaClientes"), "cliente"):
+        # La clave del usuario no se guarda: los datos se pueden consultar por la API
+        nit = (cliente.get("@nit") or "").upper()
+        registros["clientes"].append({
+            "id": nit,
+            "nit": nit,
+            "nombre": cliente.get("nombre"),
+            "usuario": cliente.get("usuario"),
+            "direccion": cliente.get("direccion"),
+            "correo": cliente.get("correoElectronico")
+        })
+        for instancia in _lista(cliente.get("listaInstancias"), "instancia"):
+            registros["instancias"].append({
+                "id": instancia.get("@id"),
+                "id_cliente": nit,
+                "id_configuracion": instancia.get("idConfiguracion"),
+                "nombre": instancia.get("nombre"),
+                # La fecha puede venir dentro de un texto descriptivo
+                "fecha_inicio": buscar_fecha(instancia.get("fechaInicio")),
+                "estado": instancia.get("estado"),
+                "fecha_final": buscar_fecha(instancia.get("fechaFinal"))
+            })
+    return registros
+
+def leer_listado_consumos(listado):
+    """
+    Convierte un <listadoConsumos> en consumos del sistema. Estos consumos no indican
+    recurso: se cobran con la tarifa de la configuración de su instancia.
+    """
+    return [leer_consumo_listado(consumo) for consumo in _lista(listado, "consumo")]
+
+def leer_consumo_listado(consumo):
+    """Convierte un <consumo> de un <listadoConsumos> en un consumo del sistema"""
+    return {
+        "id_instancia": consumo.get("@idInstancia"),
+        "nit_cliente": (consumo.get("@nitCliente") or "").upper(),
+        "fecha": consumo.get("fechaHora"),
+        "tiempo": consumo.get("tiempo")
+    }
@@ -0,0 +1,51 @@
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no hay flock; el sistema solo es seguro con un único proceso
+    fcntl = None
+
+# Bloqueos que ya tiene el hilo actual (ruta -> exclusivo), para permitir anidarlos
+_bloqueos_hilo = threading.local()
+
+@contextmanager
+def bloqueo_archivo(ruta, exclusivo=False):
+    """
+    Bloqueo entre procesos (y entre hilos) sobre ruta, usando el archivo ruta + '.lock'.
+    Los bloqueos de lectura (compartidos) no se bloquean entre sí; uno de escritura
+    (exclusivo) espera a que terminen los demás. Dentro de un bloqueo exclusivo se pueden
+    volver a pedir bloqueos sobre la misma ruta sin esperar.
+    """
+    tomados = getattr(_bloqueos_hilo, "tomados", None)
+    if tomados is None:
+        tomados = _bloqueos_hilo.tomados = {}
+
+    if ruta in tomados:
+        if exclusivo and not tomados[ruta]:
+            raise RuntimeError(f"No se puede pasar de lectura a escritura sobre {ruta}")
+        yield
+        return
+
+    if fcntl is None:
+        tomados[ruta] = exclusivo
+        try:
+            yield
+        finally:
+            del tomados[ruta]
+        return
+
+    directory = os.path.dirname(ruta)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(f"{ruta}.lock", 'a') as archivo_lock:
+        fcntl.flock(archivo_lock.fileno(), fcntl.LOCK_EX if exclusivo else fcntl.LOCK_SH)
+        tomados[ruta] = exclusivo
+        try:
+            yield
+        finally:
+            del tomados[ruta]
+            fcntl.flock(archivo_lock.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+from config import LIMITE_CACHE
+
+class CacheDatos:
+    """
+    Cache LRU, compartida por todo el proceso, de las listas de items ya parseadas.
+    Cada entrada se guarda con la firma (generación, inodo, mtime y tamaño) de los
+    archivos de donde salió; si la firma en disco cambia la entrada deja de ser válida.
+    """
+
+    def __init__(self, limite_bytes):
+        self.limite_bytes = limite_bytes
+        self.entradas = OrderedDict()  # ruta -> (firma, valor, costo)
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def obtener(self, ruta, firma):
+        """Retorna el valor cacheado de ruta si sigue correspondiendo a firma"""
+        with self.lock:
+            entrada = self.entradas.get(ruta)
+            if entrada is None or entrada[0] != firma:
+                return None
+            self.entradas.move_to_end(ruta)
+            return entrada[1]
+
+    def guardar(self, ruta, firma, valor, costo):
+        """Guarda el valor cargado de ruta; costo es el tamaño en disco de los archivos leídos"""
+        with self.lock:
+            self._quitar(ruta)
+            if costo > self.limite_bytes:
+                return
+
+            self.entradas[ruta] = (firma, valor, costo)
+            self.total_bytes += costo
+
+            # Desalojar las entradas usadas hace más tiempo hasta respetar el límite
+            while self.total_bytes > self.limite_bytes:
+                antigua = next(iter(self.entradas))
+                self._quitar(antigua)
+
+    def invalidar(self, ruta):
+        with self.lock:
+            self._quitar(ruta)
+
+    def limpiar(self):
+        with self.lock:
+            self.entradas.clear()
+            self.total_bytes = 0
+
+    def _quitar(self, ruta):
+        entrada = self.entradas.pop(ruta, None)
+        if entrada is not None:
+            self.total_bytes -= entrada[2]
+
+# Instancia única usada por todos los XMLManager del proceso
+cache_datos = CacheDatos(LIMITE_CACHE)
+
+# Previsualizaciones de facturación ya calculadas; la "firma" de cada entrada son las
+# versiones de los datos con que se calculó
+cache_previsualizaciones = CacheDatos(LIMITE_CACHE)
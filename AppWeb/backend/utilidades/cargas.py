@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from config import CARGAS_SIMULTANEAS, CARGAS_EN_ESPERA
+
+# Estado de cada carga asíncrona, un archivo JSON por carga: cualquier proceso del
+# servidor puede responder por una carga aunque la procese otro
+RUTA_CARGAS = 'datos/cargas'
+
+# Tamaño de los bloques con que se copia el cuerpo de una petición a disco
+TAMANO_COPIA = 1024 * 1024
+
+# Los estados de cargas terminadas se borran después de un día
+DURACION_ESTADO = 24 * 60 * 60
+
+PATRON_ID = re.compile(r'^[0-9a-f]{32}$')
+
+def _ahora():
+    return datetime.now().strftime("%d/%m/%Y %H:%M:%S")
+
+def _ruta(id_carga):
+    return os.path.join(RUTA_CARGAS, f"{id_carga}.json")
+
+class RegistroCarga:
+    """Progreso de una carga: filas aceptadas y rechazadas, velocidad y resultado final"""
+
+    def __init__(self, tipo):
+        self.id = uuid.uuid4().hex
+        self.inicio = None
+        self.estado = {
+            "id": self.id,
+            "tipo": tipo,
+            "estado": "en_espera",
+            "creada": _ahora(),
+            "filas_total": 0,
+            "filas_procesadas": 0,
+            "aceptadas": 0,
+            "rechazadas": 0,
+            "filas_por_segundo": 0,
+            "bytes_total": 0,
+            "bytes_procesados": 0
+        }
+        self._guardar()
+
+    def iniciar(self, total=0, bytes_total=0):
+        """
+        Empieza a guardar las filas. total es cuántas trae el archivo; si se lee de a poco
+        no se sabe de antemano y el avance se mide en bytes leídos de bytes_total.
+        """
+        self.inicio = time.monotonic()
+        self.estado.update(estado="procesando", iniciada=_ahora(), filas_total=total,
+                           bytes_total=bytes_total)
+        self._guardar()
+
+    def avanzar(self, aceptadas, rechazadas=0, bytes_leidos=None):
+        """Suma un lote de filas procesadas"""
+        self.estado["aceptadas"] += aceptadas
+        self.estado["rechazadas"] += rechazadas
+        self.estado["filas_procesadas"] += aceptadas + rechazadas
+        if bytes_leidos is not None:
+            self.estado["bytes_procesados"] = bytes_leidos
+        self._actualizar_velocidad()
+        self._guardar()
+
+    def terminar(self, resultado):
+        self._actualizar_velocidad()
+        self.estado.update(estado="completada", terminada=_ahora(), resultado=resultado,
+                           filas_total=self.estado["filas_procesadas"],
+                           bytes_procesados=self.estado["bytes_total"])
+        self._guardar()
+
+    def fallar(self, error):
+        self.estado.update(estado="error", terminada=_ahora(), error=error)
+        self._guardar()
+
+    def _actualizar_velocidad(self):
+        if self.inicio is None:
+            return
+        segundos = time.monotonic() - self.inicio
+        self.estado["segundos"] = round(segundos, 3)
+        if segundos > 0:
+            self.estado["filas_por_segundo"] = round(self.estado["filas_procesadas"] / segundos, 1)
+
+    def _guardar(self):
+        os.makedirs(RUTA_CARGAS, exist_ok=True)
+        temporal = f"{_ruta(self.id)}.tmp"
+        with open(temporal, 'w') as archivo:
+            json.dump(self.estado, archivo, ensure_ascii=False)
+        os.replace(temporal, _ruta(self.id))
+
+def estado_carga(id_carga):
+    """Último estado guardado de una carga (None si no existe)"""
+    if not PATRON_ID.match(id_carga or ""):
+        return None
+    try:
+        with open(_ruta(id_carga), 'r') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return None
+
+def guardar_cuerpo(flujo):
+    """
+    Copia por bloques el cuerpo de una petición (request.stream) a un archivo junto a los
+    estados de las cargas y retorna su ruta; la carga lo lee después de a poco
+    """
+    os.makedirs(RUTA_CARGAS, exist_ok=True)
+    descriptor, ruta = tempfile.mkstemp(suffix='.xml', dir=RUTA_CARGAS)
+    try:
+        with os.fdopen(descriptor, 'wb') as archivo:
+            shutil.copyfileobj(flujo, archivo, TAMANO_COPIA)
+    except Exception:
+        os.remove(ruta)
+        raise
+    return ruta
+
+def _borrar_antiguas():
+    limite = time.time() - DURACION_ESTADO
+    try:
+        nombres = os.listdir(RUTA_CARGAS)
+    except OSError:
+        return
+    for nombre in nombres:
+        ruta = os.path.join(RUTA_CARGAS, nombre)
+        try:
+            if os.path.getmtime(ruta) < limite:
+                os.remove(ruta)
+        except OSError:
+            pass
+
+class ColaCargas:
+    """
+    Procesa las cargas en un pool de hilos de tamaño fijo. Se admiten a lo sumo
+    simultaneas + en_espera cargas a la vez; más allá se rechazan en lugar de acumularlas.
+    """
+
+    def __init__(self, simultaneas=None, en_espera=None):
+        simultaneas = simultaneas if simultaneas else CARGAS_SIMULTANEAS
+        en_espera = en_espera if en_espera is not None else CARGAS_EN_ESPERA
+        self.pool = ThreadPoolExecutor(max_workers=simultaneas, thread_name_prefix="carga")
+        self.cupos = threading.BoundedSemaphore(simultaneas + en_espera)
+
+    def enviar(self, tipo, procesar, contenido):
+        """
+        Encola procesar(contenido, registro) y retorna el id de la carga. procesar retorna
+        el resultado de la carga. RuntimeError si no quedan cupos.
+        """
+        if not self.cupos.acquire(blocking=False):
+            raise RuntimeError("Hay demasiadas cargas en curso, intente más tarde")
+        try:
+            _borrar_antiguas()
+            registro = RegistroCarga(tipo)
+            self.pool.submit(self._ejecutar, procesar, contenido, registro)
+        except Exception:
+            self.cupos.release()
+            raise
+        return registro.id
+
+    def _ejecutar(self, procesar, contenido, registro):
+        try:
+            registro.terminar(procesar(contenido, registro))
+        except Exception as e:
+            registro.fallar(str(e))
+        finally:
+            self.cupos.release()
+
+# Cola única del proceso
+cola_cargas = ColaCargas()
@@ -0,0 +1,37 @@
+from xml.etree.ElementTree import ParseError
+
+from utilidades.archivo_configuraciones import leer_consumo_listado
+from utilidades.lector_xml import iterar_dicts
+
+# Lectura incremental de un XML de consumos (<consumos> o <listadoConsumos>) desde un
+# archivo o flujo: los <consumo> se entregan de a uno y se descartan una vez leídos, así
+# la memoria no depende del tamaño del archivo
+
+RAICES_CONSUMOS = ('consumos', 'listadoConsumos')
+
+def iterar_consumos(flujo):
+    """
+    Consumos del sistema contenidos en el XML que se lee de flujo (un archivo abierto en
+    modo binario o request.stream). ValueError si el documento no es un XML de consumos o
+    está mal formado; en ese caso ya se pudieron entregar los consumos anteriores al error.
+    """
+    raiz = []
+
+    def validar_raiz(etiqueta):
+        if etiqueta not in RAICES_CONSUMOS:
+            raise ValueError("Formato XML incorrecto")
+        raiz.append(etiqueta)
+
+    leidos = 0
+    try:
+        for consumo in iterar_dicts(flujo, etiqueta='consumo', validar_raiz=validar_raiz):
+            leidos += 1
+            # Un <consumo/> vacío queda como diccionario vacío: se rechaza al validarlo
+            consumo = consumo if isinstance(consumo, dict) else {}
+            yield leer_consumo_listado(consumo) if raiz[0] == 'listadoConsumos' else consumo
+    except ParseError as e:
+        raise ValueError(f"XML mal formado: {e}")
+
+    # Como con xmltodict, <consumos> sin ningún <consumo> no es un archivo de consumos
+    if raiz[0] == 'consumos' and leidos == 0:
+        raise ValueError("Formato XML incorrecto")
@@ -0,0 +1,433 @@
+import uuid
+import zlib
+import bisect
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import numpy as np
+except ImportError:
+    # numpy es opcional: sin él solo está disponible el cálculo escalar
+    np = None
+
+from config import MODO_FACTURACION, PROCESOS_FACTURACION
+from modelos.consumo import ConsumosColumnar
+from modelos.factura import Factura
+from utilidades.fechas import timestamp_a_datetime
+
+def _por_id(items):
+    """Diccionario id -> item; con ids repetidos gana la primera aparición"""
+    por_id = {}
+    for item in items:
+        por_id.setdefault(str(item.get("id")), item)
+    return por_id
+
+def _filas(consumos):
+    """(id_instancia, id_recurso, tiempo) de cada consumo, de diccionarios o de un ConsumosColumnar"""
+    if isinstance(consumos, ConsumosColumnar):
+        return consumos.filas()
+    return ((consumo.get("id_instancia"), consumo.get("id_recurso"), consumo.get("tiempo", 0))
+            for consumo in consumos)
+
+def _facturar_fragmento(motor, consumos, fecha_emision):
+    """Se ejecuta en un proceso del pool: factura los consumos de un grupo de clientes"""
+    return motor.facturar_serie(consumos, fecha_emision)
+
+# Pool de procesos compartido por todas las facturaciones del proceso del servidor
+_pool = None
+_procesos_pool = 0
+_bloqueo_pool = threading.Lock()
+
+def _pool_facturacion(procesos):
+    """
+    Retorna el pool de procesos de facturación, creándolo la primera vez (o si se piden
+    más procesos que los que tiene). Los procesos se inician con forkserver (spawn si no
+    está disponible): no heredan una copia del servidor con sus hilos y bloqueos tomados.
+    """
+    global _pool, _procesos_pool
+    with _bloqueo_pool:
+        if _pool is None or procesos > _procesos_pool:
+            if _pool is not None:
+                # Las facturaciones que lo estén usando terminan normalmente
+                _pool.shutdown(wait=False)
+            metodo = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context(metodo))
+            _procesos_pool = procesos
+        return _pool
+
+def _descartar_pool(pool):
+    """Descarta un pool que dejó de funcionar (murió uno de sus procesos)"""
+    global _pool
+    with _bloqueo_pool:
+        if _pool is pool:
+            _pool = None
+
+class MotorFacturacion:
+    """
+    Calcula las facturas de un conjunto de consumos. Las instancias, recursos y clientes
+    se indexan por id una sola vez, así cada consumo se resuelve con búsquedas en
+    diccionarios: O(consumos + instancias + recursos) en lugar de recorrer las listas
+    completas por cada consumo.
+    Un consumo con id_recurso se cobra con el precio de ese recurso; uno sin recurso se
+    cobra con la tarifa (precalculada) de la configuración de su instancia.
+    Los consumos pueden ser diccionarios o un ConsumosColumnar.
+    """
+
+    def __init__(self, instancias, recursos, clientes, tarifas=(), modo=None, procesos=None):
+        self.instancias = _por_id(instancias)
+        self.recursos = _por_id(recursos)
+        self.clientes = _por_id(clientes)
+        # Precio por hora y datos del detalle de cada cargo posible, por recurso o por configuración
+        self.cargos = {}
+        for id_recurso, recurso in self.recursos.items():
+            self.cargos[("recurso", id_recurso)] = (float(recurso.get("precio_hora", 0)), {
+                "id_recurso": recurso.get("id"),
+                "nombre_recurso": recurso.get("nombre", ""),
+                "abreviatura": recurso.get("abreviatura", "")
+            })
+        for id_configuracion, tarifa in _por_id(tarifas).items():
+            self.cargos[("configuracion", id_configuracion)] = (float(tarifa.get("precio_hora", 0)), {
+                "id_configuracion": tarifa.get("id"),
+                "nombre_recurso": f"Configuración {tarifa.get('nombre', '')}",
+                "abreviatura": ""
+            })
+        modo = modo if modo else MODO_FACTURACION
+        self.vectorizado = modo == 'numpy' and np is not None
+        self.procesos = procesos if procesos is not None else PROCESOS_FACTURACION
+
+    def cliente_de(self, consumo):
+        """Id (como texto) del cliente dueño de la instancia de un consumo, o None"""
+        instancia = self.instancias.get(str(consumo.get("id_instancia")))
+        return str(instancia.get("id_cliente")) if instancia else None
+
+    @staticmethod
+    def clave_cargo(id_recurso, instancia):
+        """Clave en self.cargos del precio con que se cobra un consumo de id_recurso en instancia"""
+        if id_recurso is not None and id_recurso != "":
+            return ("recurso", str(id_recurso))
+        return ("configuracion", str(instancia.get("id_configuracion")))
+
+    def agrupar(self, consumos):
+        """
+        Agrupa los consumos por cliente e instancia con el detalle por cargo (recurso o
+        configuración), en el orden en que aparece cada cargo en la instancia:
+        {id_cliente: {id_instancia: {"nombre": ..., "consumos": [...], "subtotal": ...}}}.
+        Cada línea del detalle suma la cantidad de consumos, el tiempo y el monto de los
+        consumos de ese cargo; el monto de cada consumo se redondea a centavos antes de sumarlo.
+        Se omiten los consumos de instancias, recursos o configuraciones que no existen.
+        """
+        por_cliente = {}
+        for id_instancia, id_recurso, tiempo in _filas(consumos):
+            instancia = self.instancias.get(str(id_instancia))
+            if not instancia:
+                continue
+
+            instancias_cliente = por_cliente.setdefault(instancia.get("id_cliente"), {})
+            if id_instancia not in instancias_cliente:
+                instancias_cliente[id_instancia] = {
+                    "nombre": instancia.get("nombre", "Sin nombre"),
+                    "cargos": {},
+                    "subtotal": 0
+                }
+
+            clave = self.clave_cargo(id_recurso, instancia)
+            cargo = self.cargos.get(clave)
+            if not cargo:
+                continue
+
+            tiempo = float(tiempo)
+            monto = round(tiempo * cargo[0], 2)
+            datos_instancia = instancias_cliente[id_instancia]
+            totales = datos_instancia["cargos"].setdefault(clave, [0, 0.0, 0.0])
+            totales[0] += 1
+            totales[1] += tiempo
+            totales[2] += monto
+            datos_instancia["subtotal"] += monto
+
+        for instancias_cliente in por_cliente.values():
+            for datos_instancia in instancias_cliente.values():
+                datos_instancia["consumos"] = [self._linea_detalle(clave, *totales)
+                                               for clave, totales in datos_instancia.pop("cargos").items()]
+        return por_cliente
+
+    def _linea_detalle(self, clave, cantidad, tiempo, monto):
+        """Línea del detalle de una instancia con los totales de un cargo"""
+        precio_hora, datos_cargo = self.cargos[clave]
+        return {
+            **datos_cargo,
+            "cantidad": str(cantidad),
+            "tiempo": str(tiempo),
+            "precio_hora": str(precio_hora),
+            "monto": str(round(monto, 2))
+        }
+
+    def agrupar_vectorizado(self, consumos):
+        """
+        Igual que agrupar, pero los montos se calculan con numpy sobre las columnas de un
+        ConsumosColumnar (los diccionarios se convierten primero): los códigos de instancia
+        y recurso del contenedor se traducen a códigos de cargo una vez por código distinto,
+        el precio se toma por código de cargo, tiempo * precio_hora se calcula en una sola
+        operación y los subtotales por instancia y los totales de cada línea del detalle
+        se suman con bincount.
+        """
+        if not isinstance(consumos, ConsumosColumnar):
+            columnar = ConsumosColumnar()
+            for id_instancia, id_recurso, tiempo in _filas(consumos):
+                # La fecha no interviene en el cálculo
+                columnar.agregar(id_instancia, id_recurso, 0, tiempo)
+            consumos = columnar
+
+        codigos_cargo, claves_cargo = {}, []
+
+        def codigo_cargo(clave):
+            codigo = codigos_cargo.get(clave)
+            if codigo is None:
+                # -1 marca los recursos o configuraciones que no existen
+                codigo = -1
+                if clave in self.cargos:
+                    codigo = len(claves_cargo)
+                    claves_cargo.append(clave)
+                codigos_cargo[clave] = codigo
+            return codigo
+
+        # Código de instancia del contenedor -> código propio (-1 si la instancia no existe),
+        # en el orden en que aparece cada instancia; y el cargo de su configuración
+        traduccion_instancia = np.full(len(consumos.ids_instancia), -1, dtype=np.int64)
+        claves_instancia, cargo_configuracion = [], []
+        for codigo, id_instancia in enumerate(consumos.ids_instancia):
+            instancia = self.instancias.get(str(id_instancia))
+            if instancia:
+                traduccion_instancia[codigo] = len(claves_instancia)
+                claves_instancia.append(id_instancia)
+                cargo_configuracion.append(codigo_cargo(self.clave_cargo(None, instancia)))
+        cargo_configuracion = np.array(cargo_configuracion, dtype=np.int64)
+
+        # Cargo de cada recurso del contenedor; SIN_RECURSO marca los consumos que se cobran
+        # por la configuración de su instancia
+        SIN_RECURSO = -2
+        cargo_recurso = np.array([
+            SIN_RECURSO if id_recurso is None or id_recurso == ""
+            else codigo_cargo(self.clave_cargo(id_recurso, None))
+            for id_recurso in consumos.ids_recurso
+        ], dtype=np.int64)
+
+        # Las columnas del contenedor se leen sin copiarlas
+        instancias = traduccion_instancia[np.frombuffer(consumos.instancias, dtype=np.intc)]
+        recursos = np.frombuffer(consumos.recursos, dtype=np.intc)
+        tiempos = np.frombuffer(consumos.tiempos, dtype=np.float64)
+
+        existentes = instancias >= 0
+        instancias, recursos, tiempos = instancias[existentes], recursos[existentes], tiempos[existentes]
+        codigos = cargo_recurso[recursos]
+        codigos = np.where(codigos == SIN_RECURSO, cargo_configuracion[instancias], codigos)
+
+        cargos = [self.cargos[clave] for clave in claves_cargo]
+        precios = np.array([precio_hora for precio_hora, _ in cargos], dtype=np.float64)
+
+        # Los consumos de recursos o configuraciones que no existen no se cobran
+        validos = codigos >= 0
+        instancias, codigos, tiempos = instancias[validos], codigos[validos], tiempos[validos]
+        montos = tiempos * precios[codigos]
+        centavos = montos * 100
+        redondeados = np.round(montos, 2)
+        # np.round redondea x * 100, lo que en los casos de medio centavo puede diferir de
+        # round(); esos pocos montos se redondean con round() para cuadrar con el cálculo escalar
+        for fila in np.flatnonzero(np.abs(centavos - np.floor(centavos) - 0.5) < 1e-6):
+            redondeados[fila] = round(float(montos[fila]), 2)
+        montos = redondeados
+        subtotales = np.bincount(instancias, weights=montos, minlength=len(claves_instancia))
+
+        # Detalle por instancia y cargo: los consumos se agrupan por el par y se suman con
+        # bincount, que acumula en el orden de llegada igual que el cálculo escalar. Solo
+        # se arma un diccionario por línea del detalle, no uno por consumo
+        pares, primeros, grupos = np.unique(instancias * max(len(claves_cargo), 1) + codigos,
+                                            return_index=True, return_inverse=True)
+        cantidades = np.bincount(grupos, minlength=len(pares)).tolist()
+        tiempos_cargo = np.bincount(grupos, weights=tiempos, minlength=len(pares)).tolist()
+        montos_cargo = np.bincount(grupos, weights=montos, minlength=len(pares)).tolist()
+        instancia_par = instancias[primeros]
+        # Cada instancia lista sus cargos en el orden en que aparecen
+        orden = np.lexsort((primeros, instancia_par))
+        detalles = [[] for _ in claves_instancia]
+        for par, codigo_instancia, codigo in zip(orden.tolist(), instancia_par[orden].tolist(),
+                                                 codigos[primeros[orden]].tolist()):
+            detalles[codigo_instancia].append(self._linea_detalle(
+                claves_cargo[codigo], cantidades[par], tiempos_cargo[par], montos_cargo[par]))
+
+        por_cliente = {}
+        for codigo_instancia, id_instancia in enumerate(claves_instancia):
+            detalle = detalles[codigo_instancia]
+            instancia = self.instancias[str(id_instancia)]
+            por_cliente.setdefault(instancia.get("id_cliente"), {})[id_instancia] = {
+                "nombre": instancia.get("nombre", "Sin nombre"),
+                "consumos": detalle,
+                # Una instancia sin consumos cobrables suma 0, como en el cálculo escalar
+                "subtotal": subtotales[codigo_instancia].item() if detalle else 0
+            }
+        return por_cliente
+
+    def facturar(self, consumos, fecha_emision):
+        """
+        Retorna una lista de (Factura, cliente) con una factura por cliente, en el orden
+        en que aparece cada cliente en los consumos. Los clientes que no existen se omiten.
+        Con más de un proceso configurado las facturas se arman en paralelo.
+        """
+        if self.procesos <= 1:
+            return self.facturar_serie(consumos, fecha_emision)
+
+        # Cada cliente se asigna siempre al mismo fragmento (crc32 no depende del proceso,
+        # a diferencia de hash()); se recuerda el orden en que aparece cada cliente. El
+        # fragmento de cada instancia se calcula una sola vez
+        fragmentos = [ConsumosColumnar() for _ in range(self.procesos)]
+        destinos = {}
+        orden_clientes = {}
+        for id_instancia, id_recurso, tiempo in _filas(consumos):
+            fragmento = destinos.get(id_instancia)
+            if fragmento is None:
+                instancia = self.instancias.get(str(id_instancia))
+                if not instancia:
+                    continue
+                id_cliente = str(instancia.get("id_cliente"))
+                orden_clientes.setdefault(id_cliente, len(orden_clientes))
+                numero = zlib.crc32(id_cliente.encode()) % self.procesos
+                fragmento = destinos[id_instancia] = fragmentos[numero]
+            fragmento.agregar(id_instancia, id_recurso, 0, tiempo)
+
+        # A cada proceso se envían solo las instancias, clientes y cargos de su fragmento
+        fragmentos = [(fragmento, self._subconjunto(fragmento)) for fragmento in fragmentos if len(fragmento)]
+        if len(fragmentos) <= 1:
+            return self.facturar_serie(consumos, fecha_emision)
+
+        pool = _pool_facturacion(self.procesos)
+        facturas = []
+        try:
+            futuros = [pool.submit(_facturar_fragmento, motor, fragmento, fecha_emision)
+                       for fragmento, motor in fragmentos]
+            for futuro in futuros:
+                facturas.extend(futuro.result())
+        except BrokenProcessPool:
+            _descartar_pool(pool)
+            raise
+
+        # Mezcla determinista: el mismo orden que tendría la facturación en serie
+        facturas.sort(key=lambda factura: orden_clientes[str(factura[0].id_cliente)])
+        return facturas
+
+    def _subconjunto(self, fragmento):
+        """Motor con solo las instancias, clientes y cargos que usan los consumos de fragmento"""
+        instancias = {str(id_instancia): self.instancias[str(id_instancia)]
+                      for id_instancia in fragmento.ids_instancia}
+        ids_clientes = {str(instancia.get("id_cliente")) for instancia in instancias.values()}
+        claves = {self.clave_cargo(None, instancia) for instancia in instancias.values()}
+        claves.update(self.clave_cargo(id_recurso, None) for id_recurso in fragmento.ids_recurso
+                      if id_recurso is not None and id_recurso != "")
+
+        motor = MotorFacturacion.__new__(MotorFacturacion)
+        motor.instancias = instancias
+        motor.recursos = {}
+        motor.clientes = {id_cliente: self.clientes[id_cliente]
+                          for id_cliente in ids_clientes if id_cliente in self.clientes}
+        motor.cargos = {clave: self.cargos[clave] for clave in claves if clave in self.cargos}
+        motor.vectorizado = self.vectorizado
+        motor.procesos = 1
+        return motor
+
+    def facturar_serie(self, consumos, fecha_emision):
+        """Igual que facturar, en el proceso actual"""
+        agrupados = self.agrupar_vectorizado(consumos) if self.vectorizado else self.agrupar(consumos)
+        facturas = []
+        for id_cliente, instancias_cliente in agrupados.items():
+            cliente = self.clientes.get(str(id_cliente))
+            if not cliente:
+                continue
+
+            factura = Factura(id_cliente=id_cliente, fecha_emision=fecha_emision, monto_total=0)
+            for id_instancia, datos_instancia in instancias_cliente.items():
+                factura.agregar_item(
+                    id_instancia=id_instancia,
+                    nombre_instancia=datos_instancia["nombre"],
+                    consumos=datos_instancia["consumos"],
+                    subtotal=datos_instancia.get("subtotal")
+                )
+            facturas.append((factura, cliente))
+        return facturas
+
+class MarcasFacturacion:
+    """
+    Intervalos de consumos ya facturados a cada cliente. Cada generación de facturas
+    agrega un registro por cliente facturado con el inicio del periodo (desde_ts) y el
+    timestamp del último consumo que se le facturó (fecha_ts); un consumo ya fue facturado
+    si su fecha cae dentro de alguno de los intervalos de su cliente. Así, facturar un
+    periodo anterior a otro ya facturado (o consumos cargados tarde con fecha anterior)
+    no se confunde con volver a facturar. Los registros sin desde_ts, de antes de que se
+    guardara el inicio, cubren todo lo anterior a su fecha_ts.
+    Los intervalos registran qué periodo se facturó, no qué consumos: un consumo cargado
+    después con una fecha dentro de un intervalo ya facturado cuenta como facturado y
+    nunca se cobra (aparece en consumos_ya_facturados). Para cobrarlo hay que anular la
+    marca de ese intervalo.
+    Quien genera facturas debe leer las marcas, calcular y registrar dentro de bloqueo():
+    si no, dos generaciones simultáneas leen las mismas marcas y facturan dos veces lo mismo.
+    """
+
+    def __init__(self, manejador):
+        self.manejador = manejador
+
+    def bloqueo(self):
+        """Bloqueo exclusivo de las marcas (ver Almacenamiento.bloqueo)"""
+        return self.manejador.bloqueo()
+
+    def vigentes(self):
+        """
+        Diccionario id_cliente -> lista de intervalos (desde_ts, hasta_ts) facturados,
+        ordenados y sin traslapes
+        """
+        por_cliente = {}
+        for marca in self.manejador.iterar():
+            desde_ts = marca.get("desde_ts")
+            desde_ts = int(desde_ts) if desde_ts not in (None, "") else float("-inf")
+            intervalo = (desde_ts, int(marca.get("fecha_ts")))
+            por_cliente.setdefault(str(marca.get("id_cliente")), []).append(intervalo)
+
+        marcas = {}
+        for id_cliente, intervalos in por_cliente.items():
+            unidos = []
+            for desde_ts, hasta_ts in sorted(intervalos):
+                if unidos and desde_ts <= unidos[-1][1]:
+                    unidos[-1] = (unidos[-1][0], max(unidos[-1][1], hasta_ts))
+                else:
+                    unidos.append((desde_ts, hasta_ts))
+            marcas[id_cliente] = unidos
+        return marcas
+
+    @staticmethod
+    def facturado(intervalos, fecha_ts):
+        """True si fecha_ts cae dentro de alguno de los intervalos (de vigentes) de un cliente"""
+        posicion = bisect.bisect_right(intervalos, (fecha_ts, float("inf")))
+        return posicion > 0 and fecha_ts <= intervalos[posicion - 1][1]
+
+    @staticmethod
+    def ultima(intervalos):
+        """Timestamp del último consumo facturado en los intervalos de un cliente"""
+        return intervalos[-1][1]
+
+    def registrar(self, desde_ts, ultimos, facturas):
+        """
+        Guarda los intervalos facturados: desde_ts es el inicio del periodo, ultimos es
+        id_cliente -> timestamp del último consumo incluido y facturas es una lista de
+        (Factura, cliente).
+        """
+        marcas = []
+        for factura, _ in facturas:
+            fecha_ts = ultimos[str(factura.id_cliente)]
+            marcas.append({
+                "id": str(uuid.uuid4()),
+                "id_cliente": factura.id_cliente,
+                "id_factura": factura.id,
+                "desde": timestamp_a_datetime(desde_ts).strftime("%d/%m/%Y %H:%M"),
+                "desde_ts": desde_ts,
+                "fecha": timestamp_a_datetime(fecha_ts).strftime("%d/%m/%Y %H:%M"),
+                "fecha_ts": fecha_ts
+            })
+        return self.manejador.agregar_lote(marcas)
@@ -0,0 +1,79 @@
+import re
+import calendar
+from datetime import datetime, timedelta
+
+# Formatos aceptados al cargar datos: dd/mm/yyyy o dd/mm/yyyy hh24:mi (igual que valida_fecha)
+PATRON_FECHA = re.compile(r'^\d{2}/\d{2}/\d{4}( \d{2}:\d{2})?$')
+
+# Una fecha dd/mm/yyyy dentro de un texto libre
+PATRON_FECHA_EN_TEXTO = re.compile(r'\b\d{2}/\d{2}/\d{4}\b')
+
+def parsear_fecha(fecha_str):
+    """Convierte string en formato dd/mm/yyyy o dd/mm/yyyy hh:mm a datetime"""
+    try:
+        # Intentar con hora
+        if len(fecha_str) > 10:
+            return datetime.strptime(fecha_str, "%d/%m/%Y %H:%M")
+        else:
+            return datetime.strptime(fecha_str, "%d/%m/%Y")
+    except (ValueError, TypeError):
+        return None
+
+def datetime_a_timestamp(fecha):
+    """Convierte un datetime (sin zona horaria) a segundos desde epoch"""
+    return calendar.timegm(fecha.timetuple())
+
+def timestamp_a_datetime(timestamp):
+    """Convierte segundos desde epoch a datetime (sin zona horaria)"""
+    return datetime(1970, 1, 1) + timedelta(seconds=timestamp)
+
+def fecha_a_timestamp(fecha_str):
+    """Convierte una fecha dd/mm/yyyy [hh:mm] a segundos desde epoch (None si no es válida)"""
+    fecha = parsear_fecha(fecha_str)
+    return datetime_a_timestamp(fecha) if fecha else None
+
+def normalizar_fecha(fecha_str):
+    """
+    Valida una fecha con el mismo criterio que valida_fecha y la convierte a segundos desde
+    epoch en un solo paso, para guardarla junto al texto al cargar los datos (None si no es válida)
+    """
+    if not isinstance(fecha_str, str) or not PATRON_FECHA.match(fecha_str):
+        return None
+    return fecha_a_timestamp(fecha_str)
+
+def buscar_fecha(texto):
+    """Primera fecha dd/mm/yyyy válida que aparece dentro de un texto (None si no hay)"""
+    for encontrada in PATRON_FECHA_EN_TEXTO.findall(texto or ""):
+        if parsear_fecha(encontrada):
+            return encontrada
+    return None
+
+def timestamp_de(item, campo="fecha"):
+    """
+    Timestamp de la fecha de un item. Usa el campo <campo>_ts que se guarda al cargar los
+    datos; solo los registros anteriores, que no lo tienen, requieren interpretar el texto.
+    """
+    valor = item.get(f"{campo}_ts")
+    if valor is not None:
+        return int(valor)
+    return fecha_a_timestamp(item.get(campo))
+
+def clave_mes(fecha_str):
+    """Retorna la clave yyyy-mm del mes de una fecha dd/mm/yyyy [hh:mm] (None si no es válida)"""
+    fecha = parsear_fecha(fecha_str)
+    return f"{fecha.year:04d}-{fecha.month:02d}" if fecha else None
+
+def parsear_periodo(fecha_inicio_str, fecha_fin_str):
+    """
+    Convierte las fechas de un periodo a datetime; si la fecha final no tiene hora el periodo
+    incluye ese día completo. Retorna (None, None) si alguna fecha no es válida.
+    """
+    fecha_inicio = parsear_fecha(fecha_inicio_str)
+    fecha_fin = parsear_fecha(fecha_fin_str)
+    if not fecha_inicio or not fecha_fin:
+        return None, None
+
+    # Si fecha_fin no tiene hora, establecer al final del día (23:59)
+    if len(fecha_fin_str) <= 10:
+        fecha_fin = fecha_fin.replace(hour=23, minute=59, second=59)
+    return fecha_inicio, fecha_fin
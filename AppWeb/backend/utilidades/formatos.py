@@ -0,0 +1,113 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    # orjson es opcional: sin él se usa json de la biblioteca estándar
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    # msgpack es opcional: sin él solo se responde en XML o JSON
+    msgpack = None
+
+import xmltodict
+
+from utilidades.almacenamiento import como_texto
+from utilidades.respuesta_xml import xml_en_bloques, es_perezoso, RespuestaInterrumpida, TAMANO_BLOQUE
+
+XML = 'application/xml'
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
+
+# Nombres con que los clientes pueden pedir cada formato; XML va primero porque es el
+# formato por omisión (sin Accept o con */*)
+ALIAS = {
+    XML: XML,
+    'text/xml': XML,
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    'application/x-msgpack': MSGPACK,
+}
+
+def formato_respuesta(accept_mimetypes):
+    """Formato de la respuesta según el encabezado Accept (un MIMEAccept de werkzeug)"""
+    ofrecidos = [alias for alias, formato in ALIAS.items() if formato != MSGPACK or msgpack]
+    return ALIAS[accept_mimetypes.best_match(ofrecidos, default=XML)]
+
+def _materializar(valor):
+    """Convierte los iteradores en listas y los valores en texto, como quedarían en el XML"""
+    if isinstance(valor, dict):
+        return {clave: _materializar(v) for clave, v in valor.items()}
+    if isinstance(valor, (list, tuple)) or es_perezoso(valor):
+        return [_materializar(v) for v in valor]
+    return como_texto(valor)
+
+def _json(valor):
+    if orjson is not None:
+        return orjson.dumps(valor)
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def _json_partes(valor):
+    """Fragmentos JSON de un valor; los iteradores se recorren item por item"""
+    if isinstance(valor, dict):
+        yield b'{'
+        try:
+            for posicion, (clave, v) in enumerate(valor.items()):
+                yield (b',' if posicion else b'') + _json(clave) + b':'
+                yield from _json_partes(v)
+        except RespuestaInterrumpida:
+            yield b'}'
+            raise
+        yield b'}'
+    elif es_perezoso(valor):
+        yield b'['
+        try:
+            for posicion, item in enumerate(valor):
+                yield (b',' if posicion else b'') + _json(_materializar(item))
+        except Exception as e:
+            yield b']'
+            raise RespuestaInterrumpida(str(e)) from e
+        yield b']'
+    else:
+        yield _json(_materializar(valor))
+
+def serializar(datos, formato, raiz="respuesta"):
+    """Documento completo {raiz: datos} en el formato pedido, como bytes"""
+    if formato == JSON:
+        return _json({raiz: _materializar(datos)})
+    if formato == MSGPACK:
+        return msgpack.packb({raiz: _materializar(datos)}, use_bin_type=True)
+    return xmltodict.unparse({raiz: datos}, pretty=True).encode('utf-8')
+
+def serializar_en_bloques(datos, formato, raiz="respuesta"):
+    """
+    Igual que serializar, pero produce el documento en bloques. XML y JSON recorren los
+    iteradores mientras se envía la respuesta; MessagePack necesita saber el largo de cada
+    lista de antemano, así que se arma completo. Un error después del primer bloque ya no
+    puede cambiar el estado de la respuesta: el documento se cierra y termina con un error
+    ({raiz: ..., "error": ...} en JSON, ver xml_en_bloques).
+    """
+    if formato == XML:
+        yield from xml_en_bloques(datos, raiz)
+        return
+    if formato == MSGPACK:
+        yield serializar(datos, formato, raiz)
+        return
+
+    bloque, tamano = [b'{' + _json(raiz) + b':'], 0
+    enviado = False
+    try:
+        for parte in _json_partes(datos):
+            bloque.append(parte)
+            tamano += len(parte)
+            if tamano >= TAMANO_BLOQUE:
+                yield b''.join(bloque)
+                bloque, tamano, enviado = [], 0, True
+    except RespuestaInterrumpida as e:
+        if not enviado:
+            raise
+        bloque.append(b',' + _json("error") + b':' + _json(f"Respuesta incompleta: {e}"))
+    bloque.append(b'}')
+    yield b''.join(bloque)
@@ -0,0 +1,138 @@
+import os
+import heapq
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from utilidades.cache import cache_datos
+
+def numero_particion(clave):
+    """'2024-05' -> 202405"""
+    return int(clave[:4]) * 100 + int(clave[5:7])
+
+def clave_particion(numero):
+    """202405 -> '2024-05'"""
+    return f"{numero // 100:04d}-{numero % 100:02d}"
+
+class IndiceFecha:
+    """
+    Índice secundario persistente de los consumos ordenado por fecha.
+    Cada entrada es (timestamp, partición, posición dentro de la partición); en disco se
+    guarda como un arreglo binario de enteros de 64 bits intercalando el timestamp con una
+    referencia (partición << 32 | posición). Un periodo se resuelve con dos búsquedas
+    binarias y un corte contiguo del arreglo.
+    Agregar entradas solo escribe al final del archivo, que queda como una sucesión de
+    tramos ordenados; el arreglo completo se ordena en memoria al consultarlo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def existe(self):
+        return os.path.exists(self.ruta)
+
+    def _firma(self):
+        # El inodo cambia con cada reescritura (os.replace) aunque el tamaño no cambie
+        estado = os.stat(self.ruta)
+        return (estado.st_ino, estado.st_mtime_ns, estado.st_size)
+
+    def _entradas(self):
+        """
+        Retorna (tiempos, referencias, conteos por partición, ordenado) en el orden del
+        archivo; ordenado indica si ya están ordenadas. Compartidos con la cache.
+        """
+        if not self.existe():
+            return array('q'), array('q'), Counter(), True
+
+        firma = self._firma()
+        cargado = cache_datos.obtener(self.ruta, firma)
+        if cargado is not None:
+            return cargado
+
+        datos = array('q')
+        with open(self.ruta, 'rb') as archivo:
+            contenido = archivo.read()
+        # Descartar una entrada incompleta que haya dejado una escritura interrumpida
+        datos.frombytes(contenido[:len(contenido) - len(contenido) % 16])
+        return self._guarda_en_cache(firma, datos[0::2], datos[1::2], ordenado=False)
+
+    def _carga(self):
+        """Retorna (tiempos, referencias, conteos por partición) ordenados; compartidos con la cache"""
+        tiempos, referencias, conteos, ordenado = self._entradas()
+        if not ordenado:
+            pares = sorted(zip(tiempos, referencias))
+            tiempos = array('q', (ts for ts, _ in pares))
+            referencias = array('q', (referencia for _, referencia in pares))
+            self._guarda_en_cache(self._firma(), tiempos, referencias, conteos)
+        return tiempos, referencias, conteos
+
+    def _guarda_en_cache(self, firma, tiempos, referencias, conteos=None, ordenado=True):
+        if conteos is None:
+            conteos = Counter(referencia >> 32 for referencia in referencias)
+        cargado = (tiempos, referencias, conteos, ordenado)
+        cache_datos.guardar(self.ruta, firma, cargado, firma[2])
+        return cargado
+
+    def cantidad(self, clave):
+        """Cantidad de entradas indexadas de una partición (yyyy-mm)"""
+        _, _, conteos, _ = self._entradas()
+        return conteos.get(numero_particion(clave), 0)
+
+    def agregar(self, entradas):
+        """
+        Agrega entradas (timestamp, clave yyyy-mm, posición) al final del archivo como un
+        tramo ordenado, sin reescribir lo anterior: el costo no depende del tamaño del índice.
+        """
+        if not entradas:
+            return
+        nuevas = sorted((ts, numero_particion(clave) << 32 | posicion)
+                        for ts, clave, posicion in entradas)
+        tiempos, referencias, conteos, ordenado = self._entradas()
+
+        intercaladas = array('q', (valor for entrada in nuevas for valor in entrada))
+        with open(self.ruta, 'ab') as archivo:
+            intercaladas.tofile(archivo)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        # Sigue ordenado si todas las nuevas entradas van después de las anteriores
+        ordenado = ordenado and (not tiempos or nuevas[0] >= (tiempos[-1], referencias[-1]))
+        tiempos = tiempos + intercaladas[0::2]
+        referencias = referencias + intercaladas[1::2]
+        conteos = conteos + Counter(referencia >> 32 for _, referencia in nuevas)
+        self._guarda_en_cache(self._firma(), tiempos, referencias, conteos, ordenado)
+
+    def reescribir(self, entradas):
+        """Reemplaza el índice completo con entradas (timestamp, clave yyyy-mm, posición)"""
+        self._escribe(sorted((ts, numero_particion(clave) << 32 | posicion)
+                             for ts, clave, posicion in entradas))
+
+    def reemplazar_particion(self, clave, entradas):
+        """Reemplaza las entradas de una partición (timestamp, clave, posición) por entradas"""
+        numero = numero_particion(clave)
+        tiempos, referencias, _ = self._carga()
+        otras = ((ts, referencia) for ts, referencia in zip(tiempos, referencias)
+                 if referencia >> 32 != numero)
+        nuevas = sorted((ts, numero << 32 | posicion) for ts, _, posicion in entradas)
+        self._escribe(heapq.merge(otras, nuevas))
+
+    def _escribe(self, ordenadas):
+        intercaladas = array('q', (valor for entrada in ordenadas for valor in entrada))
+        temporal = f"{self.ruta}.tmp"
+        with open(temporal, 'wb') as archivo:
+            intercaladas.tofile(archivo)
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, self.ruta)
+        self._guarda_en_cache(self._firma(), intercaladas[0::2], intercaladas[1::2])
+
+    def rango(self, desde, hasta):
+        """Referencias (clave yyyy-mm, posición) con timestamp entre desde y hasta, en orden"""
+        tiempos, referencias, _ = self._carga()
+        inicio = bisect_left(tiempos, desde)
+        fin = bisect_right(tiempos, hasta)
+        return [(clave_particion(referencia >> 32), referencia & 0xFFFFFFFF)
+                for referencia in referencias[inicio:fin]]
+
+    def eliminar(self):
+        if self.existe():
+            os.remove(self.ruta)
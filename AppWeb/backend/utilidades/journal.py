@@ -0,0 +1,77 @@
+import os
+import json
+
+class Journal:
+    """Bitácora de solo-agregar con las escrituras pendientes de compactar en un archivo XML"""
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def existe(self):
+        return os.path.exists(self.file_path)
+
+    def tamano(self):
+        """Tamaño actual de la bitácora en bytes (0 si no existe)"""
+        try:
+            return os.path.getsize(self.file_path)
+        except OSError:
+            return 0
+
+    def lee_generacion(self):
+        """Retorna la generación del XML base sobre la que se escribió la bitácora"""
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                return json.loads(file.readline()).get("generacion")
+        except (OSError, ValueError):
+            return None
+
+    def lee_operaciones(self):
+        """Retorna (generacion, operaciones) registradas en la bitácora"""
+        generacion = None
+        operaciones = []
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as file:
+                for numero, linea in enumerate(file):
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        # Línea incompleta por una escritura interrumpida: la operación no se confirmó
+                        continue
+                    if numero == 0:
+                        generacion = registro.get("generacion")
+                    else:
+                        operaciones.append(registro)
+        except OSError:
+            pass
+        return generacion, operaciones
+
+    def agrega_operaciones(self, generacion, operaciones):
+        """Agrega operaciones al final de la bitácora en O(1) y las sincroniza a disco"""
+        lineas = []
+        if not self.existe():
+            if generacion is None:
+                raise ValueError(f"La bitácora {self.file_path} necesita la generación del XML base")
+            lineas.append(json.dumps({"generacion": generacion}) + "\n")
+        elif not self._termina_en_salto():
+            # Cerrar la línea que dejó incompleta una escritura interrumpida
+            lineas.append("\n")
+
+        for operacion in operaciones:
+            lineas.append(json.dumps(operacion, ensure_ascii=False) + "\n")
+
+        with open(self.file_path, 'a', encoding='utf-8') as file:
+            file.write("".join(lineas))
+            file.flush()
+            os.fsync(file.fileno())
+
+    def eliminar(self):
+        if self.existe():
+            os.remove(self.file_path)
+
+    def _termina_en_salto(self):
+        with open(self.file_path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            if file.tell() == 0:
+                return True
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
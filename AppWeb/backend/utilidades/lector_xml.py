@@ -0,0 +1,57 @@
+import xml.etree.ElementTree as ET
+
+def elemento_a_dict(elemento):
+    """Convierte un elemento XML a la misma estructura que produciría xmltodict.parse"""
+    resultado = {f"@{clave}": valor for clave, valor in elemento.attrib.items()}
+
+    for hijo in elemento:
+        valor = elemento_a_dict(hijo)
+        if hijo.tag in resultado:
+            # Etiquetas repetidas se agrupan en una lista
+            if not isinstance(resultado[hijo.tag], list):
+                resultado[hijo.tag] = [resultado[hijo.tag]]
+            resultado[hijo.tag].append(valor)
+        else:
+            resultado[hijo.tag] = valor
+
+    texto = elemento.text.strip() if elemento.text else ""
+    if texto:
+        if not resultado:
+            return texto
+        resultado["#text"] = texto
+    return resultado if resultado else None
+
+def iterar_elementos(origen, profundidad=1, etiqueta=None, validar_raiz=None):
+    """
+    Recorre un XML de forma incremental y produce, uno a uno, los elementos que están a la
+    profundidad indicada (1 = hijos directos de la raíz). Cada elemento se libera después
+    de producirse, por lo que la memoria usada no depende del tamaño del archivo.
+    origen puede ser una ruta o un objeto tipo archivo. Con etiqueta solo se producen los
+    elementos con esa etiqueta. validar_raiz, si se indica, se llama con la etiqueta de la
+    raíz apenas se lee, antes de producir ningún elemento; puede lanzar una excepción para
+    rechazar el documento sin leer el resto.
+    """
+    nivel = 0
+    raiz = None
+    for evento, elemento in ET.iterparse(origen, events=("start", "end")):
+        if evento == "start":
+            if raiz is None:
+                raiz = elemento
+                if validar_raiz is not None:
+                    validar_raiz(raiz.tag)
+            nivel += 1
+            continue
+
+        nivel -= 1
+        if nivel == profundidad:
+            if etiqueta is None or elemento.tag == etiqueta:
+                yield elemento
+            elemento.clear()
+        if nivel == 1:
+            # Quitar de la raíz las referencias a los elementos ya procesados
+            raiz.clear()
+
+def iterar_dicts(origen, profundidad=1, etiqueta=None, validar_raiz=None):
+    """Igual que iterar_elementos pero produce cada elemento convertido a diccionario"""
+    for elemento in iterar_elementos(origen, profundidad, etiqueta, validar_raiz):
+        yield elemento_a_dict(elemento)
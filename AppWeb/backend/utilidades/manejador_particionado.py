@@ -0,0 +1,294 @@
+import os
+import re
+
+from utilidades.almacenamiento import Almacenamiento, como_texto
+from utilidades.manejador_xml import XMLManager
+from utilidades.fechas import fecha_a_timestamp, datetime_a_timestamp, timestamp_a_datetime, timestamp_de
+from utilidades.indice_fecha import IndiceFecha
+from utilidades.bloqueo import bloqueo_archivo
+from utilidades.version import incrementar_version
+
+class ManejadorParticionado(Almacenamiento):
+    """
+    Guarda los items en un archivo XML por mes según su campo de fecha
+    (directorio/yyyy-mm.xml), así una consulta por periodo solo abre los meses que cubre.
+    Cada partición es un XMLManager con su propia cache, bitácora e índice por id. Además se
+    mantiene un índice ordenado por fecha (IndiceFecha) de todos los items.
+    Las particiones se escriben siempre en modo 'journal', sin importar MODO_XML: una carga
+    por lotes solo agrega cada lote a la bitácora del mes, y ésta se compacta cuando supera
+    al XML base, así el costo de cargar es lineal. Con 'xml' cada lote reescribiría las
+    particiones completas.
+    """
+
+    PATRON_PARTICION = re.compile(r'^(\d{4}-\d{2})\.xml$')
+
+    def __init__(self, directorio, campo_fecha="fecha"):
+        self.directorio = directorio
+        self.campo_fecha = campo_fecha
+        # La raíz de cada partición se llama como el directorio (<consumos>)
+        self.root_name = os.path.basename(os.path.normpath(directorio))
+        os.makedirs(directorio, exist_ok=True)
+
+        self.indice = IndiceFecha(os.path.join(directorio, "indice_fecha.bin"))
+        if not self.indice.existe() and self.particiones():
+            with bloqueo_archivo(self.directorio, exclusivo=True):
+                if not self.indice.existe():
+                    self.reconstruir_indice()
+
+    def particiones(self):
+        """Claves yyyy-mm de las particiones existentes, en orden cronológico"""
+        claves = []
+        for archivo in os.listdir(self.directorio):
+            coincidencia = self.PATRON_PARTICION.match(archivo)
+            if coincidencia:
+                claves.append(coincidencia.group(1))
+        return sorted(claves)
+
+    def particion(self, clave):
+        """XMLManager de la partición de un mes"""
+        return XMLManager(os.path.join(self.directorio, f"{clave}.xml"), modo='journal',
+                          root_name=self.root_name)
+
+    def obtener_todos(self):
+        """Obtiene todos los items en orden cronológico (ver iterar)"""
+        return list(self.iterar())
+
+    def iterar(self):
+        """
+        Produce los items en orden cronológico y, con la misma fecha, en orden de inserción:
+        el mismo orden que iterar_periodo y que el backend SQLite. Se lee un mes a la vez.
+        """
+        for clave in self.particiones():
+            items = self.particion(clave).obtener_todos()
+            # sorted es estable: con la misma fecha se conserva el orden de la partición
+            yield from sorted(items, key=lambda item: timestamp_de(item, self.campo_fecha) or 0)
+
+    def iterar_periodo(self, fecha_inicio, fecha_fin):
+        """
+        Produce, en orden cronológico, los items del periodo usando el índice por fecha.
+        Solo se abren las particiones que tienen items dentro del periodo.
+        """
+        desde = datetime_a_timestamp(fecha_inicio)
+        hasta = datetime_a_timestamp(fecha_fin)
+        # Las posiciones del índice solo son válidas para la versión de las particiones que
+        # se leyó con él, así que ambos se toman bajo el mismo bloqueo de lectura
+        with bloqueo_archivo(self.directorio):
+            referencias = self.indice.rango(desde, hasta)
+            cargadas = {}
+            for clave, _ in referencias:
+                if clave not in cargadas:
+                    cargadas[clave] = self.particion(clave).obtener_todos()
+
+        for clave, posicion in referencias:
+            yield cargadas[clave][posicion]
+
+    def obtener_por_id(self, id_value):
+        with bloqueo_archivo(self.directorio):
+            for clave in self.particiones():
+                item = self.particion(clave).obtener_por_id(id_value)
+                if item is not None:
+                    return item
+            return None
+
+    def _agrupar_por_mes(self, new_items):
+        """
+        Agrupa los items por la partición de su mes: clave yyyy-mm -> [(timestamp, item)].
+        Lanza ValueError si algún item no tiene una fecha válida o si un id se repite en
+        el lote. Retorna también los ids del lote.
+        """
+        por_mes = {}
+        ids_lote = set()
+        for new_item in new_items:
+            # La fecha se guarda también normalizada (<campo>_ts) si no viene ya calculada
+            fecha_ts = timestamp_de(new_item, self.campo_fecha)
+            if fecha_ts is None:
+                raise ValueError(f"El registro no tiene una {self.campo_fecha} válida")
+            if "id" in new_item:
+                id_value = como_texto(new_item["id"])
+                if id_value in ids_lote:
+                    raise ValueError(f"Ya existe un registro con id '{id_value}'")
+                ids_lote.add(id_value)
+            new_item[f"{self.campo_fecha}_ts"] = fecha_ts
+            clave = f"{timestamp_a_datetime(fecha_ts):%Y-%m}"
+            por_mes.setdefault(clave, []).append((fecha_ts, new_item))
+        return por_mes, ids_lote
+
+    def agregar_lote(self, new_items):
+        """
+        Agrega los items a la partición de su mes; cada partición se escribe una sola vez.
+        Lanza ValueError, sin guardar nada, si algún item no tiene una fecha válida o si
+        algún id ya existe en cualquier partición o se repite en el lote (como SQLite).
+        """
+        por_mes, ids_lote = self._agrupar_por_mes(new_items)
+
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            # Todo el lote se valida antes de escribir: un id repetido en otro mes no puede
+            # dejar guardados los meses que ya se escribieron
+            if ids_lote:
+                for clave in self.particiones():
+                    particion = self.particion(clave)
+                    for id_value in ids_lote:
+                        if particion.obtener_por_id(id_value) is not None:
+                            raise ValueError(f"Ya existe un registro con id '{id_value}'")
+
+            agregados = 0
+            for clave in sorted(por_mes):
+                # Los nuevos items quedan al final de la partición
+                particion = self.particion(clave)
+                base = len(particion.obtener_todos())
+                desincronizada = base != self.indice.cantidad(clave)
+                agregados += particion.agregar_lote(item for _, item in por_mes[clave])
+                # Cada partición se indexa apenas se escribe: si falla la escritura de un mes
+                # posterior, lo ya guardado sigue apareciendo en las consultas por periodo
+                if desincronizada:
+                    # El índice perdió entradas (escritura interrumpida): se reindexa la partición
+                    self.reindexar_particion(clave)
+                else:
+                    self.indice.agregar([(ts, clave, base + i) for i, (ts, _) in enumerate(por_mes[clave])])
+            return agregados
+
+    def actualizar(self, id_value, updated_data):
+        """Actualiza un item; si cambia de mes se mueve a la partición que le corresponde"""
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            for clave in self.particiones():
+                particion = self.particion(clave)
+                item = particion.obtener_por_id(id_value)
+                if item is None:
+                    continue
+
+                nueva_clave = clave
+                if self.campo_fecha in updated_data:
+                    fecha_ts = fecha_a_timestamp(updated_data[self.campo_fecha])
+                    if fecha_ts is None:
+                        raise ValueError(f"El registro no tiene una {self.campo_fecha} válida")
+                    updated_data = {**updated_data, f"{self.campo_fecha}_ts": fecha_ts}
+                    nueva_clave = f"{timestamp_a_datetime(fecha_ts):%Y-%m}"
+
+                if nueva_clave == clave:
+                    particion.actualizar(id_value, updated_data)
+                    self.reindexar_particion(clave)
+                    return True
+
+                movido = {k: v for k, v in item.items() if k != "timestamp"}
+                movido.update(updated_data)
+                particion.eliminar(id_value)
+                self.particion(nueva_clave).agregar(movido)
+                self.reindexar_particion(clave)
+                self.reindexar_particion(nueva_clave)
+                return True
+            return False
+
+    def actualizar_lote(self, cambios):
+        """
+        Actualiza varios items con una escritura por partición. Si algún cambio toca la
+        fecha, los items pueden cambiar de mes y se actualizan de a uno (ver actualizar).
+        """
+        campos_fecha = (self.campo_fecha, f"{self.campo_fecha}_ts")
+        if any(campo in datos for datos in cambios.values() for campo in campos_fecha):
+            return sum(1 for id_value, datos in cambios.items() if self.actualizar(id_value, datos))
+
+        pendientes = dict(cambios)
+        actualizados = 0
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            for clave in self.particiones():
+                if not pendientes:
+                    break
+                particion = self.particion(clave)
+                propios = {id_value: pendientes.pop(id_value) for id_value in list(pendientes)
+                           if particion.obtener_por_id(id_value) is not None}
+                # Sin cambios de fecha las posiciones no cambian: el índice sigue siendo válido
+                if propios:
+                    actualizados += particion.actualizar_lote(propios)
+        return actualizados
+
+    def reemplazar(self, new_items):
+        """
+        Reemplaza todos los items: cada partición se reescribe una vez, se eliminan las de
+        los meses que quedan vacíos y se reescribe el índice por fecha, todo bajo el
+        bloqueo exclusivo del directorio que también toman iterar_periodo y obtener_por_id.
+        """
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            por_mes, _ = self._agrupar_por_mes(new_items)
+            for clave in self.particiones():
+                if clave not in por_mes:
+                    self._eliminar_particion(clave)
+
+            entradas = []
+            for clave in sorted(por_mes):
+                self.particion(clave).reemplazar(item for _, item in por_mes[clave])
+                entradas.extend((ts, clave, posicion) for posicion, (ts, _) in enumerate(por_mes[clave]))
+            self.indice.reescribir(entradas)
+            incrementar_version(self.root_name)
+            return len(entradas)
+
+    def eliminar(self, id_value):
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            for clave in self.particiones():
+                if self.particion(clave).eliminar(id_value):
+                    # Las posiciones posteriores de la partición se corren
+                    self.reindexar_particion(clave)
+                    return True
+            return False
+
+    def _entradas_particion(self, clave):
+        """Entradas del índice por fecha (timestamp, clave, posición) de una partición"""
+        entradas = []
+        for posicion, item in enumerate(self.particion(clave).iterar()):
+            ts = timestamp_de(item, self.campo_fecha)
+            if ts is not None:
+                entradas.append((ts, clave, posicion))
+        return entradas
+
+    def reindexar_particion(self, clave):
+        """Vuelve a indexar por fecha una partición después de modificarla"""
+        self.indice.reemplazar_particion(clave, self._entradas_particion(clave))
+
+    def reconstruir_indice(self):
+        """Reconstruye el índice por fecha recorriendo todas las particiones"""
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            entradas = []
+            for clave in self.particiones():
+                entradas.extend(self._entradas_particion(clave))
+            self.indice.reescribir(entradas)
+
+    def normalizar_fechas(self):
+        """
+        Agrega <campo>_ts a los items guardados antes de que se normalizara la fecha al
+        cargarlos. Las posiciones no cambian, así que el índice por fecha sigue siendo válido.
+        Retorna cuántos items se completaron.
+        """
+        campo_ts = f"{self.campo_fecha}_ts"
+        completados = 0
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            for clave in self.particiones():
+                particion = self.particion(clave)
+                items = particion.obtener_todos()
+                faltantes = [i for i, item in enumerate(items) if campo_ts not in item]
+                if not faltantes:
+                    continue
+                for posicion in faltantes:
+                    fecha_ts = fecha_a_timestamp(items[posicion].get(self.campo_fecha))
+                    items[posicion] = {**items[posicion], campo_ts: str(fecha_ts)}
+                particion.escribe_archivo({self.root_name: {"items": items}})
+                completados += len(faltantes)
+        return completados
+
+    def bloqueo(self):
+        """El bloqueo del directorio de las particiones"""
+        return bloqueo_archivo(self.directorio, exclusivo=True)
+
+    def _eliminar_particion(self, clave):
+        """Elimina el archivo de una partición y su bitácora"""
+        particion = self.particion(clave)
+        for ruta in (particion.file_path, particion.journal.file_path):
+            if os.path.exists(ruta):
+                os.remove(ruta)
+
+    def limpiar(self):
+        """Elimina todas las particiones y el índice por fecha"""
+        with bloqueo_archivo(self.directorio, exclusivo=True):
+            for archivo in os.listdir(self.directorio):
+                if self.PATRON_PARTICION.match(archivo) or archivo.endswith(".xml.journal"):
+                    os.remove(os.path.join(self.directorio, archivo))
+            self.indice.eliminar()
+            incrementar_version(self.root_name)
@@ -0,0 +1,294 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime
+
+from utilidades.almacenamiento import Almacenamiento, como_texto, filtrar_items
+from utilidades.fechas import datetime_a_timestamp, timestamp_de
+from utilidades.bloqueo import bloqueo_archivo
+from utilidades.version import incrementar_version
+
+# Columnas propias de cada tabla; cualquier otro campo del item se guarda como JSON en "extra"
+COLUMNAS = {
+    'recursos': ['id', 'nombre', 'abreviatura', 'metrica', 'tipo', 'precio_hora'],
+    'categorias': ['id', 'nombre', 'descripcion', 'carga_trabajo'],
+    'clientes': ['id', 'nit', 'nombre', 'direccion', 'correo', 'telefono'],
+    'instancias': ['id', 'id_cliente', 'id_configuracion', 'nombre', 'fecha_inicio', 'estado'],
+    'consumos': ['id', 'id_instancia', 'id_recurso', 'fecha', 'tiempo'],
+    'facturas': ['id', 'id_cliente', 'fecha_emision', 'monto_total', 'nit_cliente', 'nombre_cliente'],
+    'marcas_facturacion': ['id', 'id_cliente', 'id_factura', 'fecha', 'fecha_ts'],
+    'consumos_diarios': ['id', 'id_instancia', 'id_recurso', 'fecha', 'tiempo', 'cantidad'],
+    'configuraciones': ['id', 'id_categoria', 'nombre', 'descripcion'],
+    'recursos_configuracion': ['id', 'id_configuracion', 'id_recurso', 'cantidad'],
+    'tarifas_configuracion': ['id', 'nombre', 'precio_hora'],
+}
+
+# Tablas con la fecha normalizada a segundos desde epoch (fecha_ts) para consultas por rango
+TABLAS_CON_FECHA = ('consumos', 'consumos_diarios')
+
+# Tablas que se recorren en orden cronológico (fecha_ts y luego orden de inserción), igual
+# que las particiones por mes del backend XML; las demás, en orden de inserción
+TABLAS_POR_FECHA = ('consumos', 'consumos_diarios')
+
+# Índices secundarios además del índice único por id
+INDICES = {
+    'instancias': ['id_cliente'],
+    'consumos': ['id_instancia', 'fecha_ts'],
+    'facturas': ['id_cliente'],
+    'marcas_facturacion': ['id_cliente'],
+    'consumos_diarios': ['fecha_ts'],
+}
+
+_esquemas_creados = set()
+_lock_esquema = threading.Lock()
+
+def _crear_esquema(conexion):
+    """Crea las tablas e índices que no existan"""
+    for tabla, columnas in COLUMNAS.items():
+        definicion = ", ".join(f"{columna} TEXT" for columna in columnas)
+        if tabla in TABLAS_CON_FECHA:
+            definicion += ", fecha_ts INTEGER"
+        conexion.execute(
+            f"CREATE TABLE IF NOT EXISTS {tabla} ("
+            f"orden INTEGER PRIMARY KEY AUTOINCREMENT, {definicion}, timestamp TEXT, extra TEXT)"
+        )
+        conexion.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS idx_{tabla}_id ON {tabla}(id)")
+        for columna in INDICES.get(tabla, []):
+            nombre = columna.replace('_ts', '')
+            conexion.execute(f"CREATE INDEX IF NOT EXISTS idx_{tabla}_{nombre} ON {tabla}({columna})")
+
+class SQLiteManager(Almacenamiento):
+    """Backend de almacenamiento en SQLite con la misma interfaz que XMLManager"""
+
+    def __init__(self, db_path, tipo):
+        if tipo not in COLUMNAS:
+            raise ValueError(f"Tipo de datos '{tipo}' no válido")
+        self.db_path = db_path
+        self.tabla = tipo
+        self.columnas = COLUMNAS[tipo]
+        # fecha_ts tiene índice, que incluye el orden: ORDER BY no necesita ordenar las filas
+        self.orden = "fecha_ts, orden" if tipo in TABLAS_POR_FECHA else "orden"
+        self.base_existe()
+
+    def base_existe(self):
+        """Asegura que la base de datos exista con todas sus tablas"""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            # Otro proceso puede estar creándolo al mismo tiempo
+            os.makedirs(directory, exist_ok=True)
+
+        with _lock_esquema:
+            if self.db_path in _esquemas_creados:
+                return
+            with closing(self._conectar()) as conexion:
+                conexion.execute("PRAGMA journal_mode=WAL")
+                with conexion:
+                    _crear_esquema(conexion)
+            _esquemas_creados.add(self.db_path)
+
+    def _conectar(self):
+        conexion = sqlite3.connect(self.db_path, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        return conexion
+
+    def _a_fila(self, item):
+        """Separa un item en los valores de las columnas de la tabla y el JSON de campos extra"""
+        valores = [como_texto(item.get(columna)) for columna in self.columnas]
+        if self.tabla in TABLAS_CON_FECHA:
+            valores.append(timestamp_de(item))
+        valores.append(item.get("timestamp"))
+
+        propias = set(self.columnas) | {"timestamp", "fecha_ts"}
+        extra = {k: v for k, v in item.items() if k not in propias}
+        valores.append(json.dumps(extra, ensure_ascii=False) if extra else None)
+        return valores
+
+    def _a_item(self, fila):
+        """Reconstruye el item (diccionario) a partir de una fila"""
+        item = {columna: fila[columna] for columna in self.columnas if fila[columna] is not None}
+        if self.tabla in TABLAS_CON_FECHA and fila["fecha_ts"] is not None:
+            item["fecha_ts"] = fila["fecha_ts"]
+        if fila["timestamp"] is not None:
+            item["timestamp"] = fila["timestamp"]
+        if fila["extra"]:
+            item.update(json.loads(fila["extra"]))
+        return item
+
+    def _columnas_fila(self):
+        """Columnas en el mismo orden que los valores de _a_fila"""
+        columnas = list(self.columnas)
+        if self.tabla in TABLAS_CON_FECHA:
+            columnas.append("fecha_ts")
+        return columnas + ["timestamp", "extra"]
+
+    def _insert_sql(self):
+        columnas = self._columnas_fila()
+        marcadores = ", ".join("?" for _ in columnas)
+        return f"INSERT INTO {self.tabla} ({', '.join(columnas)}) VALUES ({marcadores})"
+
+    def _update_sql(self):
+        asignaciones = ", ".join(f"{columna} = ?" for columna in self._columnas_fila())
+        return f"UPDATE {self.tabla} SET {asignaciones} WHERE orden = ?"
+
+    def obtener_todos(self):
+        """Obtiene todos los items de la tabla en orden de inserción (los consumos, por fecha)"""
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(f"SELECT * FROM {self.tabla} ORDER BY {self.orden}").fetchall()
+        return [self._a_item(fila) for fila in filas]
+
+    def iterar(self):
+        """Produce los items de la tabla uno a uno leyendo las filas por bloques"""
+        with closing(self._conectar()) as conexion:
+            cursor = conexion.execute(f"SELECT * FROM {self.tabla} ORDER BY {self.orden}")
+            while True:
+                filas = cursor.fetchmany(1000)
+                if not filas:
+                    break
+                for fila in filas:
+                    yield self._a_item(fila)
+
+    def iterar_periodo(self, fecha_inicio, fecha_fin):
+        """Produce los items entre dos datetime usando el índice sobre fecha_ts"""
+        if self.tabla not in TABLAS_CON_FECHA:
+            yield from super().iterar_periodo(fecha_inicio, fecha_fin)
+            return
+
+        desde = datetime_a_timestamp(fecha_inicio)
+        hasta = datetime_a_timestamp(fecha_fin)
+        with closing(self._conectar()) as conexion:
+            cursor = conexion.execute(
+                f"SELECT * FROM {self.tabla} WHERE fecha_ts BETWEEN ? AND ? ORDER BY {self.orden}",
+                (desde, hasta)
+            )
+            for fila in cursor:
+                yield self._a_item(fila)
+
+    def consultar(self, filtros=None, campos=None, offset=0, limite=None):
+        """
+        Produce una página de items: los filtros sobre columnas de la tabla van al WHERE y,
+        si no queda ninguno sobre campos extra, el offset y el límite van al LIMIT/OFFSET
+        """
+        filtros = dict(filtros or {})
+        columnas = {campo: como_texto(filtros.pop(campo)) for campo in list(filtros)
+                    if campo in self.columnas}
+        sql = f"SELECT * FROM {self.tabla}"
+        if columnas:
+            sql += " WHERE " + " AND ".join(f"{campo} = ?" for campo in columnas)
+        sql += f" ORDER BY {self.orden}"
+        parametros = list(columnas.values())
+        if not filtros and (offset or limite is not None):
+            sql += " LIMIT ? OFFSET ?"
+            parametros += [-1 if limite is None else limite, offset]
+            offset, limite = 0, None
+
+        with closing(self._conectar()) as conexion:
+            filas = conexion.execute(sql, parametros)
+            items = (self._a_item(fila) for fila in filas)
+            yield from filtrar_items(items, filtros, campos, offset, limite)
+
+    def obtener_por_id(self, id_value):
+        """Obtiene un item por su ID usando el índice de la tabla"""
+        with closing(self._conectar()) as conexion:
+            fila = conexion.execute(
+                f"SELECT * FROM {self.tabla} WHERE id = ?", (como_texto(id_value),)
+            ).fetchone()
+        return self._a_item(fila) if fila else None
+
+    def agregar_lote(self, new_items):
+        """Agrega varios items en una sola transacción; ValueError si algún id ya existe"""
+        new_items = list(new_items)
+        if not new_items:
+            return 0
+
+        # Agregar timestamp si no tiene uno
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        for new_item in new_items:
+            if "timestamp" not in new_item:
+                new_item["timestamp"] = timestamp
+        new_items = [como_texto(new_item) for new_item in new_items]
+
+        try:
+            with closing(self._conectar()) as conexion:
+                with conexion:
+                    conexion.executemany(self._insert_sql(), [self._a_fila(i) for i in new_items])
+        except sqlite3.IntegrityError:
+            raise ValueError("Ya existe un registro con alguno de los id del lote")
+        incrementar_version(self.tabla)
+        return len(new_items)
+
+    def reemplazar(self, new_items):
+        """Reemplaza todos los items en una sola transacción"""
+        try:
+            with closing(self._conectar()) as conexion:
+                with conexion:
+                    # BEGIN IMMEDIATE toma el bloqueo de escritura antes de consumir new_items
+                    conexion.execute("BEGIN IMMEDIATE")
+                    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                    new_items = [como_texto(new_item) for new_item in new_items]
+                    for new_item in new_items:
+                        if "timestamp" not in new_item:
+                            new_item["timestamp"] = timestamp
+                    conexion.execute(f"DELETE FROM {self.tabla}")
+                    conexion.executemany(self._insert_sql(), [self._a_fila(i) for i in new_items])
+        except sqlite3.IntegrityError:
+            raise ValueError("Hay registros con el mismo id")
+        incrementar_version(self.tabla)
+        return len(new_items)
+
+    def actualizar_lote(self, cambios):
+        """Actualiza varios items (id -> campos a cambiar) en una sola transacción"""
+        actualizados = 0
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with closing(self._conectar()) as conexion:
+            with conexion:
+                for id_value, updated_data in cambios.items():
+                    fila = conexion.execute(
+                        f"SELECT * FROM {self.tabla} WHERE id = ?", (como_texto(id_value),)
+                    ).fetchone()
+                    if not fila:
+                        continue
+
+                    item = self._a_item(fila)
+                    if "fecha" in updated_data and "fecha_ts" not in updated_data:
+                        # La fecha normalizada se vuelve a calcular desde la nueva fecha
+                        item.pop("fecha_ts", None)
+                    item.update(como_texto(dict(updated_data)))
+                    item["timestamp"] = timestamp
+
+                    conexion.execute(self._update_sql(), self._a_fila(item) + [fila["orden"]])
+                    actualizados += 1
+        if actualizados:
+            incrementar_version(self.tabla)
+        return actualizados
+
+    def eliminar(self, id_value):
+        """Elimina un item por su ID"""
+        with closing(self._conectar()) as conexion:
+            with conexion:
+                cursor = conexion.execute(
+                    f"DELETE FROM {self.tabla} WHERE id = ?", (como_texto(id_value),)
+                )
+        if cursor.rowcount > 0:
+            incrementar_version(self.tabla)
+        return cursor.rowcount > 0
+
+    def esta_vacio(self):
+        """Indica si la tabla no tiene registros"""
+        with closing(self._conectar()) as conexion:
+            return conexion.execute(f"SELECT 1 FROM {self.tabla} LIMIT 1").fetchone() is None
+
+    def bloqueo(self):
+        """
+        Bloqueo de la tabla sobre un archivo junto a la base: SQLite no tiene bloqueos por
+        tabla que duren más que una transacción
+        """
+        return bloqueo_archivo(f"{self.db_path}.{self.tabla}", exclusivo=True)
+
+    def limpiar(self):
+        """Elimina todos los items de la tabla"""
+        with closing(self._conectar()) as conexion:
+            with conexion:
+                conexion.execute(f"DELETE FROM {self.tabla}")
+        incrementar_version(self.tabla)
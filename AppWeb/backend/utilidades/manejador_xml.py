@@ -1,25 +1,75 @@
 import os
+import re
+import uuid
 import xmltodict
 from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
 
-class XMLManager:
-    def __init__(self, file_path):
+from config import MODO_XML, LIMITE_JOURNAL, LIMITE_CACHE
+from utilidades.journal import Journal
+from utilidades.bloqueo import bloqueo_archivo
+from utilidades.version import incrementar_version
+from utilidades.cache import cache_datos
+from utilidades.lector_xml import iterar_dicts
+from utilidades.almacenamiento import Almacenamiento, como_texto
+
+# Nombres de etiqueta que se pueden escribir tal cual
+PATRON_ETIQUETA = re.compile(r'^[A-Za-z_][\w.-]*$')
+
+def _xml_items(root_name, generacion, items):
+    """
+    El mismo texto que xmltodict.unparse(..., pretty=True) de {root_name: {"@generacion":
+    generacion, "items": items}}, armado directamente cuando todos los items son planos
+    (valores texto o None): unparse pasa cada valor por SAX y es lo más lento de
+    reescribir un archivo grande. Retorna None si algún item no es plano.
+    """
+    partes = [f'<?xml version="1.0" encoding="utf-8"?>\n<{root_name} generacion={quoteattr(generacion)}>']
+    etiquetas = set()
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        if not item:
+            partes.append('\n\t<items></items>')
+            continue
+        partes.append('\n\t<items>')
+        for clave, valor in item.items():
+            if clave not in etiquetas:
+                if not isinstance(clave, str) or not PATRON_ETIQUETA.match(clave):
+                    return None
+                etiquetas.add(clave)
+            if valor is None:
+                valor = ""
+            elif not isinstance(valor, str):
+                return None
+            partes.append(f'\n\t\t<{clave}>{escape(valor)}</{clave}>')
+        partes.append('\n\t</items>')
+    partes.append(f'\n</{root_name}>' if items else f'</{root_name}>')
+    return "".join(partes)
+
+class XMLManager(Almacenamiento):
+    def __init__(self, file_path, modo=None, root_name=None):
         self.file_path = file_path
+        # Por defecto la raíz del XML se llama como el archivo (recursos.xml -> <recursos>)
+        self.root_name = root_name if root_name else os.path.basename(file_path).split('.')[0]
+        self.modo = modo if modo else MODO_XML
+        self.journal = Journal(f"{file_path}.journal")
         self.archivo_existe()
 
     def archivo_existe(self):
         """Asegura que el archivo XML exista con una estructura básica"""
         directory = os.path.dirname(self.file_path)
-        if directory and not os.path.exists(directory):
-            os.makedirs(directory)
-        
+        if directory:
+            # Otro proceso puede estar creándolo al mismo tiempo
+            os.makedirs(directory, exist_ok=True)
+
         if not os.path.exists(self.file_path):
-            # Crear un XML básico
-            root_name = os.path.basename(self.file_path).split('.')[0]
-            data = {root_name: {"items": []}}
-            with open(self.file_path, 'w') as file:
-                file.write(xmltodict.unparse(data, pretty=True))
-    
+            with bloqueo_archivo(self.file_path, exclusivo=True):
+                # Otro proceso pudo crearlo mientras se esperaba el bloqueo
+                if not os.path.exists(self.file_path):
+                    # Crear un XML básico; una bitácora que haya quedado no corresponde a este archivo
+                    data = {self.root_name: {"items": []}}
+                    self.escribe_archivo(data, nueva_version=False)
+
     def lee_archivo(self):
         """Lee el archivo XML y retorna su contenido como diccionario"""
         try:
@@ -30,91 +80,380 @@ class XMLManager:
             print(f"Error al leer {self.file_path}: {str(e)}")
             return {}
 
-    def escribe_archivo(self, data):
-        """Escribe el diccionario data en el archivo XML"""
-        with open(self.file_path, 'w') as file:
-            file.write(xmltodict.unparse(data, pretty=True))
-    
+    def escribe_archivo(self, data, nueva_version=True):
+        """
+        Escribe el diccionario data en el archivo XML.
+        Se escribe en un archivo temporal que luego reemplaza al original, así una escritura
+        interrumpida nunca deja el XML truncado. El XML recibe una nueva generación, lo que
+        invalida la bitácora anterior (sus operaciones ya están incluidas en data).
+        Con nueva_version=False no se incrementa la versión de los datos (crear el archivo
+        vacío no cambia lo que se lee de él).
+        """
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            if isinstance(data.get(self.root_name), dict):
+                data[self.root_name]["@generacion"] = uuid.uuid4().hex
+
+            contenido = None
+            raiz = data.get(self.root_name)
+            if (isinstance(raiz, dict) and set(raiz) == {"@generacion", "items"}
+                    and isinstance(raiz["items"], list)):
+                contenido = _xml_items(self.root_name, raiz["@generacion"], raiz["items"])
+            if contenido is None:
+                contenido = xmltodict.unparse(data, pretty=True)
+
+            temporal = f"{self.file_path}.tmp"
+            with open(temporal, 'w') as file:
+                file.write(contenido)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temporal, self.file_path)
+            self.journal.eliminar()
+            if nueva_version:
+                incrementar_version(self.root_name)
+
+            items = list(self._lista_items(data))
+            self._guarda_en_cache(self._firma(), items, self._indexa(items))
+
+    def _escribe_items(self, items):
+        self.escribe_archivo({self.root_name: {"items": items}})
+
+    def _generacion(self, data=None):
+        """Generación del XML base; sin data solo se leen los primeros bytes del archivo"""
+        if data is not None:
+            raiz = data.get(self.root_name)
+            return raiz.get("@generacion") if isinstance(raiz, dict) else None
+
+        try:
+            with open(self.file_path, 'r') as file:
+                encabezado = file.read(512)
+        except OSError:
+            return None
+        coincidencia = re.search(r'generacion="([^"]+)"', encabezado)
+        return coincidencia.group(1) if coincidencia else None
+
+    def _lista_items(self, data):
+        """Normaliza el contenido del XML a {root: {"items": [...]}} y retorna la lista de items"""
+
+        # Un XML vacío se parsea como None y un solo item como dict
+        if not isinstance(data.get(self.root_name), dict):
+            data[self.root_name] = {}
+
+        items = data[self.root_name].get("items")
+        if items is None:
+            items = []
+        elif not isinstance(items, list):
+            items = [items]
+
+        data[self.root_name]["items"] = items
+        return items
+
+    def _indexa(self, items):
+        """Construye el índice id -> posición; con ids repetidos gana la primera aparición"""
+        indice = {}
+        for posicion, item in enumerate(items):
+            if "id" in item and item["id"] not in indice:
+                indice[item["id"]] = posicion
+        return indice
+
+    def _firma(self):
+        """
+        Identifica la versión en disco del XML base y de su bitácora: la generación del XML
+        (nueva en cada reescritura) más inodo, mtime y tamaño de cada archivo. mtime y
+        tamaño solos no bastan: dos escrituras dentro del mismo tick del reloj del sistema
+        de archivos pueden dejar un XML del mismo largo, y el inodo se puede reutilizar.
+        """
+        firma = (self._generacion(),)
+        for ruta in (self.file_path, self.journal.file_path):
+            try:
+                estado = os.stat(ruta)
+            except OSError:
+                # Solo la bitácora puede no existir
+                if ruta == self.file_path:
+                    raise
+                continue
+            firma += ((estado.st_ino, estado.st_mtime_ns, estado.st_size),)
+        return firma
+
+    @staticmethod
+    def _tamano(firma):
+        """Tamaño en disco del XML base más el de la bitácora"""
+        return sum(estado[2] for estado in firma[1:])
+
+    def _guarda_en_cache(self, firma, items, indice):
+        # El costo de la entrada es el tamaño en disco de los archivos
+        cache_datos.guardar(self.file_path, firma, (items, indice), self._tamano(firma))
+
+    def _carga(self):
+        """
+        Retorna (items, indice) vigentes: el XML base con la bitácora aplicada y su índice por id.
+        Se toman de la cache mientras los archivos no cambien; ambos están compartidos
+        con la cache, por lo que no deben modificarse.
+        """
+        with bloqueo_archivo(self.file_path):
+            firma = self._firma()
+            cargado = cache_datos.obtener(self.file_path, firma)
+            if cargado is not None:
+                return cargado
+
+            data = self.lee_archivo()
+            items = self._lista_items(data)
+            indice = self._indexa(items)
+
+            if self.journal.existe():
+                generacion, operaciones = self.journal.lee_operaciones()
+                # Una bitácora de otra generación ya fue compactada en el XML
+                if generacion is not None and generacion == self._generacion(data):
+                    self._aplica_operaciones(items, indice, operaciones)
+
+            self._guarda_en_cache(firma, items, indice)
+            return items, indice
+
+    def _aplica_operaciones(self, items, indice, operaciones):
+        """Reproduce sobre items (y su índice) las operaciones registradas en la bitácora"""
+        for operacion in operaciones:
+            tipo = operacion.get("op")
+            if tipo == "agregar":
+                for item in operacion["items"]:
+                    if "id" in item and item["id"] not in indice:
+                        indice[item["id"]] = len(items)
+                    items.append(item)
+            elif tipo == "actualizar":
+                posicion = indice.get(operacion["id"])
+                if posicion is not None:
+                    # Copia: el item original puede estar compartido con la cache
+                    items[posicion] = {**items[posicion], **operacion["datos"]}
+            elif tipo == "eliminar":
+                posicion = indice.get(operacion["id"])
+                if posicion is not None:
+                    items.pop(posicion)
+                    # Las posiciones posteriores se corren; se reconstruye el índice
+                    indice.clear()
+                    indice.update(self._indexa(items))
+
+    def _registra(self, operaciones, items, indice):
+        """
+        Agrega operaciones a la bitácora y compacta cuando ésta supera al XML base.
+        items e indice son los datos vigentes antes de las operaciones.
+        """
+        generacion = self._generacion()
+        if generacion is None:
+            # XML sin generación (creado antes de que existiera la bitácora): se reescribe
+            # para asignarle una, porque una bitácora sin generación se ignora al leer
+            self._escribe_items(list(items))
+            generacion = self._generacion()
+        if self.journal.existe() and self.journal.lee_generacion() != generacion:
+            self.journal.eliminar()
+
+        operaciones = como_texto(operaciones)
+        self.journal.agrega_operaciones(generacion, operaciones)
+        incrementar_version(self.root_name)
+
+        # Mantener la cache al día sin volver a leer los archivos
+        items, indice = list(items), dict(indice)
+        self._aplica_operaciones(items, indice, operaciones)
+        self._guarda_en_cache(self._firma(), items, indice)
+
+        if self.journal.tamano() > max(LIMITE_JOURNAL, os.path.getsize(self.file_path)):
+            self.compactar()
+
+    def compactar(self):
+        """Incorpora la bitácora al XML base y la elimina"""
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            if self.journal.existe():
+                items, _ = self._carga()
+                self._escribe_items(list(items))
+
     def obtener_todos(self):
-        """Obtiene todos los items del archivo XML"""
-        data = self.lee_archivo()
-        root_name = os.path.basename(self.file_path).split('.')[0]
-        
-        if not data or root_name not in data or "items" not in data[root_name]:
-            return []
-        
-        items = data[root_name]["items"]
-        return items if items else []
+        """Obtiene todos los items del archivo XML (desde la cache si el archivo no cambió)"""
+        items, _ = self._carga()
+        # Copia de la lista: quien la modifique no debe alterar la cache
+        return list(items)
+
+    def iterar(self):
+        """
+        Produce los items uno a uno. Si el archivo cabe en la cache se sirve desde ella;
+        si no, se recorre el XML con un parser incremental en memoria constante.
+        """
+        # El bloqueo de lectura solo se mantiene mientras se toma una versión consistente
+        # del XML y su bitácora; los items se producen fuera de él para no detener a los
+        # escritores mientras el consumidor procesa cada item.
+        with bloqueo_archivo(self.file_path):
+            firma = self._firma()
+            cargado = cache_datos.obtener(self.file_path, firma)
+            if cargado is None and self._tamano(firma) <= LIMITE_CACHE:
+                cargado = self._carga()
+
+            archivo = None
+            cambios, agregados = {}, []
+            if cargado is None:
+                # Una escritura reemplaza el XML con os.replace, así que el archivo abierto
+                # conserva la versión leída aunque se modifique después
+                archivo = open(self.file_path, 'rb')
+                if self.journal.existe():
+                    generacion, operaciones = self.journal.lee_operaciones()
+                    if generacion is not None and generacion == self._generacion():
+                        cambios, agregados = self._resume_operaciones(operaciones)
+
+        if cargado is not None:
+            yield from cargado[0]
+            return
+
+        with archivo:
+            for item in iterar_dicts(archivo):
+                if item is None:
+                    continue
+                if item.get("id") in cambios:
+                    if cambios[item["id"]] is None:
+                        continue
+                    item.update(cambios[item["id"]])
+                yield item
+        yield from agregados
+
+    def _resume_operaciones(self, operaciones):
+        """
+        Reduce la bitácora a (cambios, agregados): cambios indica, por id de un item del XML
+        base, los campos a actualizar o None si fue eliminado; agregados son los items nuevos
+        que siguen vigentes. Los ids son únicos, así que cada id está en uno solo de los dos.
+        """
+        cambios, agregados = {}, []
+        for operacion in operaciones:
+            tipo = operacion.get("op")
+            if tipo == "agregar":
+                agregados.extend(operacion["items"])
+                continue
+
+            posicion = next((i for i, item in enumerate(agregados)
+                             if item.get("id") == operacion["id"]), None)
+            if tipo == "actualizar":
+                if posicion is not None:
+                    agregados[posicion] = {**agregados[posicion], **operacion["datos"]}
+                elif cambios.get(operacion["id"], {}) is not None:
+                    anteriores = cambios.get(operacion["id"], {})
+                    cambios[operacion["id"]] = {**anteriores, **operacion["datos"]}
+            elif tipo == "eliminar":
+                if posicion is not None:
+                    agregados.pop(posicion)
+                else:
+                    cambios[operacion["id"]] = None
+        return cambios, agregados
 
     def obtener_por_id(self, id_value):
-        """Obtiene un item por su ID"""
-        items = self.obtener_todos()
-        for item in items:
-            if "id" in item and item["id"] == id_value:
-                return item
-        return None
-
-    def agregar(self, new_item):
-        """Agrega un nuevo item al archivo XML"""
-        data = self.lee_archivo()
-        root_name = os.path.basename(self.file_path).split('.')[0]
-        
-        if root_name not in data:
-            data[root_name] = {"items": []}
-        
-        if "items" not in data[root_name]:
-            data[root_name]["items"] = []
-        
-        # Si es el primer elemento, convertirlo en lista
-        if data[root_name]["items"] is None:
-            data[root_name]["items"] = []
-        
-        # Agregar timestamp si no tiene uno
-        if "timestamp" not in new_item:
-            new_item["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Agregar el nuevo item
-        data[root_name]["items"].append(new_item)
-        
-        self.escribe_archivo(data)
-        return True
-    
-    def actualizar(self, id_value, updated_data):
-        """Actualiza un item existente por su ID"""
-        data = self.lee_archivo()
-        root_name = os.path.basename(self.file_path).split('.')[0]
-        
-        if root_name not in data or "items" not in data[root_name]:
-            return False
-        
-        items = data[root_name]["items"]
-        for i, item in enumerate(items):
-            if "id" in item and item["id"] == id_value:
-                # Actualizar solo los campos proporcionados
-                for key, value in updated_data.items():
-                    items[i][key] = value
-                
-                # Actualizar timestamp
-                items[i]["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                self.escribe_archivo(data)
-                return True
-        
-        return False
-    
+        """Obtiene un item por su ID en O(1) usando el índice"""
+        items, indice = self._carga()
+        posicion = indice.get(id_value)
+        return items[posicion] if posicion is not None else None
+
+    def agregar_lote(self, new_items):
+        """
+        Agrega varios items con una sola lectura y una sola escritura del archivo XML.
+        Lanza ValueError, sin guardar nada, si algún id ya existe o se repite en el lote.
+        """
+        new_items = list(new_items)
+        if not new_items:
+            return 0
+
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            items, indice = self._carga()
+            ids_lote = set()
+            for new_item in new_items:
+                if "id" not in new_item:
+                    continue
+                id_value = como_texto(new_item["id"])
+                if id_value in indice or id_value in ids_lote:
+                    raise ValueError(f"Ya existe un registro con id '{id_value}'")
+                ids_lote.add(id_value)
+
+            # Agregar timestamp si no tiene uno
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for new_item in new_items:
+                if "timestamp" not in new_item:
+                    new_item["timestamp"] = timestamp
+            new_items = [como_texto(new_item) for new_item in new_items]
+
+            if self.modo == 'journal':
+                self._registra([{"op": "agregar", "items": new_items}], items, indice)
+            else:
+                self._escribe_items(list(items) + new_items)
+            return len(new_items)
+
+    def reemplazar(self, new_items):
+        """
+        Reemplaza todos los items con una sola escritura del XML (archivo temporal y
+        os.replace), bajo el bloqueo del archivo que también toman las lecturas
+        """
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            new_items = list(new_items)
+            ids_lote = set()
+            for new_item in new_items:
+                if "id" not in new_item:
+                    continue
+                id_value = como_texto(new_item["id"])
+                if id_value in ids_lote:
+                    raise ValueError(f"Ya existe un registro con id '{id_value}'")
+                ids_lote.add(id_value)
+
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            for new_item in new_items:
+                if "timestamp" not in new_item:
+                    new_item["timestamp"] = timestamp
+            self._escribe_items([como_texto(new_item) for new_item in new_items])
+            return len(new_items)
+
+    def actualizar_lote(self, cambios):
+        """
+        Actualiza varios items (id -> campos a cambiar) con una sola lectura y una sola
+        escritura del archivo XML. Los ids que no existen se ignoran; retorna cuántos se
+        actualizaron.
+        """
+        if not cambios:
+            return 0
+
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            items, indice = self._carga()
+
+            # Actualizar solo los campos proporcionados y el timestamp
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            operaciones = []
+            for id_value, updated_data in cambios.items():
+                if id_value not in indice:
+                    continue
+                datos = como_texto(dict(updated_data))
+                datos["timestamp"] = timestamp
+                operaciones.append({"op": "actualizar", "id": id_value, "datos": datos})
+            if not operaciones:
+                return 0
+
+            if self.modo == 'journal':
+                self._registra(operaciones, items, indice)
+            else:
+                items = list(items)
+                for operacion in operaciones:
+                    posicion = indice[operacion["id"]]
+                    items[posicion] = {**items[posicion], **operacion["datos"]}
+                self._escribe_items(items)
+            return len(operaciones)
+
     def eliminar(self, id_value):
         """Elimina un item por su ID"""
-        data = self.lee_archivo()
-        root_name = os.path.basename(self.file_path).split('.')[0]
-        
-        if root_name not in data or "items" not in data[root_name]:
-            return False
-        
-        items = data[root_name]["items"]
-        for i, item in enumerate(items):
-            if "id" in item and item["id"] == id_value:
-                items.pop(i)
-                self.escribe_archivo(data)
-                return True
-        
-        return False
\ No newline at end of file
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            items, indice = self._carga()
+            posicion = indice.get(id_value)
+            if posicion is None:
+                return False
+
+            if self.modo == 'journal':
+                self._registra([{"op": "eliminar", "id": id_value}], items, indice)
+            else:
+                items = list(items)
+                items.pop(posicion)
+                self._escribe_items(items)
+            return True
+
+    def bloqueo(self):
+        """El bloqueo del archivo XML, el mismo que toman sus lecturas y escrituras"""
+        return bloqueo_archivo(self.file_path, exclusivo=True)
+
+    def limpiar(self):
+        """Elimina todos los items del archivo XML"""
+        with bloqueo_archivo(self.file_path, exclusivo=True):
+            self._escribe_items([])
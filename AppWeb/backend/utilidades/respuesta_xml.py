@@ -0,0 +1,77 @@
+import xmltodict
+
+# Tamaño aproximado de cada bloque enviado al cliente
+TAMANO_BLOQUE = 64 * 1024
+
+class RespuestaInterrumpida(Exception):
+    """
+    Falló la lectura de un iterador mientras se serializaba la respuesta. Los niveles que
+    ya abrieron un elemento lo cierran antes de dejarla pasar, así el documento enviado
+    queda bien formado y termina con un elemento de error.
+    """
+
+def es_perezoso(valor):
+    """Los iteradores y generadores se serializan item por item, sin materializarlos"""
+    return not isinstance(valor, (dict, list, tuple, str, bytes)) and hasattr(valor, '__iter__')
+
+def _contiene_perezoso(valor):
+    if es_perezoso(valor):
+        return True
+    return isinstance(valor, dict) and any(_contiene_perezoso(v) for v in valor.values())
+
+def _fragmento(clave, valor, nivel):
+    return xmltodict.unparse({clave: valor}, full_document=False, pretty=True, depth=nivel)
+
+def _partes(datos, nivel):
+    """Fragmentos XML de los pares de un diccionario, con la indentación de unparse"""
+    sangria = '\t' * nivel
+    for clave, valor in datos.items():
+        if es_perezoso(valor):
+            # Lista que se genera al vuelo: un elemento <clave> por item
+            try:
+                for item in valor:
+                    yield _fragmento(clave, item, nivel)
+            except Exception as e:
+                raise RespuestaInterrumpida(str(e)) from e
+        elif _contiene_perezoso(valor):
+            partes = _partes(valor, nivel + 1)
+            primera = next(partes, None)
+            if primera is None:
+                yield f"{sangria}<{clave}></{clave}>\n"
+                continue
+            yield f"{sangria}<{clave}>\n"
+            yield primera
+            try:
+                yield from partes
+            except RespuestaInterrumpida:
+                yield f"{sangria}</{clave}>\n"
+                raise
+            yield f"{sangria}</{clave}>\n"
+        else:
+            yield _fragmento(clave, valor, nivel)
+
+def xml_en_bloques(datos, raiz="respuesta"):
+    """
+    Serializa {raiz: datos} con el mismo formato que xmltodict.unparse(pretty=True), pero
+    de a poco: los valores que son iteradores (por ejemplo manejador.iterar()) se recorren
+    mientras se envía la respuesta, así nunca se arma el documento completo en memoria.
+    Produce bloques de unos TAMANO_BLOQUE bytes.
+    Si un iterador falla antes del primer bloque, el error se propaga (la respuesta todavía
+    puede ser un error); si falla después, el documento se cierra con un <error> al final.
+    """
+    bloque = ['<?xml version="1.0" encoding="utf-8"?>\n', f"<{raiz}>\n"]
+    tamano = 0
+    enviado = False
+    try:
+        for parte in _partes(datos, 1):
+            bloque.append(parte)
+            tamano += len(parte)
+            if tamano >= TAMANO_BLOQUE:
+                yield ''.join(bloque)
+                bloque, tamano, enviado = [], 0, True
+    except RespuestaInterrumpida as e:
+        if not enviado:
+            raise
+        bloque.append(_fragmento("error", f"Respuesta incompleta: {e}", 1))
+    bloque.append(f"</{raiz}>")
+    yield ''.join(bloque)
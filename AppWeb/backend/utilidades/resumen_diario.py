@@ -0,0 +1,96 @@
+from utilidades.almacenamiento import crear_manejador
+from utilidades.bloqueo import bloqueo_archivo
+from utilidades.fechas import timestamp_de, timestamp_a_datetime
+
+SEGUNDOS_DIA = 24 * 60 * 60
+
+class ResumenDiario:
+    """
+    Resumen de los consumos por (instancia, recurso, día) con el tiempo total y la cantidad
+    de consumos. Se actualiza al cargar consumos, así la facturación y los reportes de un
+    mes leen a lo sumo 30 filas por instancia y recurso en lugar de cada consumo.
+    Cada fila tiene la forma de un consumo (id_instancia, id_recurso, fecha, tiempo), con
+    la fecha del día sin hora. Como los consumos, el resumen se guarda por mes con un
+    índice por fecha (ManejadorParticionado) en XML y con fecha_ts indexada en SQLite.
+    """
+
+    def __init__(self, manejador=None):
+        self.manejador = manejador if manejador else crear_manejador('consumos_diarios')
+        # Un solo bloqueo para el resumen en cualquier backend: acumular lee y luego escribe.
+        # En XML es el mismo bloqueo del directorio de las particiones
+        self.ruta_bloqueo = 'datos/consumos_diarios'
+
+    def agrupar(self, consumos, filas=None):
+        """
+        Suma los consumos por día: id de la fila -> fila del resumen. Con filas se suman
+        sobre un agrupamiento anterior (por ejemplo, el de los lotes ya leídos de un archivo)
+        """
+        filas = {} if filas is None else filas
+        dias = {}
+        for consumo in consumos:
+            fecha_ts = timestamp_de(consumo)
+            if fecha_ts is None:
+                continue
+            dia_ts = fecha_ts - fecha_ts % SEGUNDOS_DIA
+            if dia_ts not in dias:
+                dia = timestamp_a_datetime(dia_ts)
+                dias[dia_ts] = (f"{dia:%Y%m%d}", f"{dia:%d/%m/%Y}")
+            clave_dia, fecha_dia = dias[dia_ts]
+            id_instancia = consumo.get("id_instancia")
+            id_recurso = consumo.get("id_recurso")
+            # Los consumos cobrados por configuración no tienen recurso
+            id_fila = f"{clave_dia}|{id_instancia}|{'' if id_recurso is None else id_recurso}"
+
+            fila = filas.get(id_fila)
+            if fila is None:
+                fila = filas[id_fila] = {
+                    "id": id_fila,
+                    "id_instancia": id_instancia,
+                    "id_recurso": id_recurso,
+                    "fecha": fecha_dia,
+                    "fecha_ts": dia_ts,
+                    "tiempo": 0.0,
+                    "cantidad": 0
+                }
+            fila["tiempo"] += float(consumo.get("tiempo", 0))
+            fila["cantidad"] += 1
+        return filas
+
+    def acumular(self, consumos):
+        """Suma consumos recién cargados al resumen; retorna cuántas filas se modificaron"""
+        return self.acumular_filas(self.agrupar(consumos))
+
+    def acumular_filas(self, filas):
+        """Suma al resumen filas ya agrupadas (ver agrupar); retorna cuántas se modificaron"""
+        if not filas:
+            return 0
+
+        with bloqueo_archivo(self.ruta_bloqueo, exclusivo=True):
+            cambios, nuevas = {}, []
+            for id_fila, fila in filas.items():
+                existente = self.manejador.obtener_por_id(id_fila)
+                if existente is None:
+                    nuevas.append(fila)
+                    continue
+                cambios[id_fila] = {
+                    "tiempo": float(existente.get("tiempo", 0)) + fila["tiempo"],
+                    "cantidad": int(existente.get("cantidad", 0)) + fila["cantidad"]
+                }
+            return self.manejador.actualizar_lote(cambios) + self.manejador.agregar_lote(nuevas)
+
+    def reconstruir(self, consumos):
+        """
+        Vuelve a generar el resumen completo a partir de los consumos; retorna las filas.
+        El resumen anterior se reemplaza en una sola escritura: un reporte o una factura
+        que lo lea a la vez ve el resumen anterior o el nuevo, nunca uno vacío.
+        """
+        filas = self.agrupar(consumos)
+        with bloqueo_archivo(self.ruta_bloqueo, exclusivo=True):
+            return self.manejador.reemplazar(filas.values())
+
+    def iterar_periodo(self, fecha_inicio, fecha_fin):
+        """
+        Produce las filas de los días que empiezan dentro del periodo; en ambos backends se
+        leen solo las filas del periodo (índice por fecha), no el resumen completo
+        """
+        yield from self.manejador.iterar_periodo(fecha_inicio, fecha_fin)
@@ -0,0 +1,40 @@
+from utilidades.almacenamiento import crear_manejador
+
+def calcular_tarifas(configuraciones, recursos_configuracion, recursos):
+    """
+    Precio por hora de cada configuración: la suma de cantidad * precio_hora de sus
+    recursos. Los recursos que no existen no suman. Retorna las filas de la tabla de tarifas.
+    """
+    precios = {str(recurso.get("id")): float(recurso.get("precio_hora") or 0) for recurso in recursos}
+
+    totales = {}
+    for fila in recursos_configuracion:
+        precio = precios.get(str(fila.get("id_recurso")))
+        if precio is None:
+            continue
+        id_configuracion = str(fila.get("id_configuracion"))
+        totales[id_configuracion] = totales.get(id_configuracion, 0.0) + float(fila.get("cantidad") or 0) * precio
+
+    tarifas = []
+    for configuracion in configuraciones:
+        id_configuracion = str(configuracion.get("id"))
+        tarifas.append({
+            "id": id_configuracion,
+            "nombre": configuracion.get("nombre"),
+            "precio_hora": str(totales.get(id_configuracion, 0.0))
+        })
+    return tarifas
+
+def actualizar_tarifas():
+    """
+    Vuelve a calcular la tabla de tarifas por configuración; se llama cada vez que cambian
+    los recursos o las configuraciones. La tabla se reemplaza en una sola escritura y las
+    tarifas se calculan ya tomado su bloqueo: dos recálculos simultáneos no se mezclan y
+    el último lee los datos más recientes. Retorna cuántas tarifas quedaron.
+    """
+    def tarifas():
+        yield from calcular_tarifas(crear_manejador('configuraciones').iterar(),
+                                    crear_manejador('recursos_configuracion').iterar(),
+                                    crear_manejador('recursos').iterar())
+
+    return crear_manejador('tarifas_configuracion').reemplazar(tarifas())
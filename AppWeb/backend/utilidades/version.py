@@ -0,0 +1,45 @@
+import os
+import json
+import uuid
+
+from utilidades.bloqueo import bloqueo_archivo
+
+# Contador de versión por tipo de datos, compartido por todos los procesos
+RUTA_VERSIONES = 'datos/versiones.json'
+
+def _lee_versiones():
+    try:
+        with open(RUTA_VERSIONES, 'r') as archivo:
+            return json.load(archivo)
+    except (OSError, ValueError):
+        return {}
+
+def versiones(*tipos):
+    """Versión actual de cada tipo de datos, en el mismo orden (0 si nunca se modificó)"""
+    with bloqueo_archivo(RUTA_VERSIONES):
+        actuales = _lee_versiones()
+    return tuple(actuales.get(tipo, 0) for tipo in tipos)
+
+def firma_versiones(*tipos):
+    """
+    Texto que identifica el estado de los datos de esos tipos: cambia con cualquier
+    escritura. Incluye la generación del archivo de versiones, así los contadores que
+    vuelven a empezar (por ejemplo al borrar datos/) no repiten una firma anterior.
+    """
+    with bloqueo_archivo(RUTA_VERSIONES):
+        actuales = _lee_versiones()
+    partes = [actuales.get("generacion", "")]
+    partes.extend(f"{tipo}={actuales.get(tipo, 0)}" for tipo in tipos)
+    return ",".join(partes)
+
+def incrementar_version(tipo):
+    """Indica que los datos de un tipo cambiaron; invalida lo que se haya calculado con ellos"""
+    with bloqueo_archivo(RUTA_VERSIONES, exclusivo=True):
+        actuales = _lee_versiones()
+        actuales.setdefault("generacion", uuid.uuid4().hex)
+        actuales[tipo] = actuales.get(tipo, 0) + 1
+
+        temporal = f"{RUTA_VERSIONES}.tmp"
+        with open(temporal, 'w') as archivo:
+            json.dump(actuales, archivo)
+        os.replace(temporal, RUTA_VERSIONES)
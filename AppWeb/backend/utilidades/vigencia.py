@@ -0,0 +1,138 @@
+from bisect import bisect_right
+
+from utilidades.almacenamiento import crear_manejador
+from utilidades.cache import cache_datos
+from utilidades.fechas import fecha_a_timestamp
+from utilidades.version import firma_versiones
+
+# Extremos de las ventanas sin fecha de inicio o sin fecha de fin
+INFINITO = 2 ** 62
+
+# Estados con los que una instancia deja de estar activa en su fecha final
+ESTADOS_CANCELADA = ('CANCELADA', 'CANCELADO')
+
+def ventana_instancia(instancia):
+    """
+    Periodo (inicio_ts, fin_ts) en que una instancia está activa, ambos inclusive. Empieza
+    en fecha_inicio; solo una instancia cancelada termina, al final del día de fecha_final.
+    """
+    inicio = fecha_a_timestamp(instancia.get("fecha_inicio"))
+    fin = None
+    if str(instancia.get("estado") or "").upper() in ESTADOS_CANCELADA:
+        fecha_final = instancia.get("fecha_final")
+        fin = fecha_a_timestamp(fecha_final)
+        if fin is not None and len(fecha_final) <= 10:
+            fin += 24 * 60 * 60 - 1
+    return (-INFINITO if inicio is None else inicio, INFINITO if fin is None else fin)
+
+class IndiceVigencia:
+    """
+    Árbol de intervalos (centrado) sobre los periodos de actividad de las instancias.
+    Cada nodo guarda un punto central y los intervalos que lo contienen, ordenados por
+    inicio y por fin; los que terminan antes van al subárbol izquierdo y los que empiezan
+    después al derecho. Las instancias activas en un instante se obtienen en O(log n + k).
+    """
+
+    def __init__(self, ventanas):
+        # ventanas: id_instancia -> (inicio_ts, fin_ts)
+        self.ventanas = dict(ventanas)
+        intervalos = [(inicio, fin, id_instancia) for id_instancia, (inicio, fin) in self.ventanas.items()]
+        self.raiz = self._construir(intervalos)
+        # Inicios ordenados, para los intervalos que empiezan dentro de un periodo
+        ordenados = sorted(intervalos)
+        self.inicios = [inicio for inicio, _, _ in ordenados]
+        self.ids_por_inicio = [id_instancia for _, _, id_instancia in ordenados]
+
+    @staticmethod
+    def _construir(intervalos):
+        """Nodo (centro, por_inicio, por_fin, izquierdo, derecho) o None"""
+        if not intervalos:
+            return None
+        extremos = sorted(extremo for inicio, fin, _ in intervalos for extremo in (inicio, fin))
+        centro = extremos[len(extremos) // 2]
+
+        izquierda, derecha, contienen = [], [], []
+        for intervalo in intervalos:
+            if intervalo[1] < centro:
+                izquierda.append(intervalo)
+            elif intervalo[0] > centro:
+                derecha.append(intervalo)
+            else:
+                contienen.append(intervalo)
+
+        por_inicio = sorted(contienen, key=lambda intervalo: intervalo[0])
+        por_fin = sorted(contienen, key=lambda intervalo: -intervalo[1])
+        return (centro, por_inicio, por_fin,
+                IndiceVigencia._construir(izquierda), IndiceVigencia._construir(derecha))
+
+    def activas_en(self, instante):
+        """Ids de las instancias activas en un instante (timestamp)"""
+        activas = []
+        nodo = self.raiz
+        while nodo is not None:
+            centro, por_inicio, por_fin, izquierdo, derecho = nodo
+            if instante < centro:
+                # Todos terminan en el centro o después: basta con que hayan empezado
+                for inicio, _, id_instancia in por_inicio:
+                    if inicio > instante:
+                        break
+                    activas.append(id_instancia)
+                nodo = izquierdo
+            elif instante > centro:
+                for _, fin, id_instancia in por_fin:
+                    if fin < instante:
+                        break
+                    activas.append(id_instancia)
+                nodo = derecho
+            else:
+                activas.extend(id_instancia for _, _, id_instancia in por_inicio)
+                nodo = None
+        return activas
+
+    def activas_durante(self, desde, hasta):
+        """
+        Ids de las instancias activas en algún momento del periodo [desde, hasta]: las
+        activas en desde más las que empiezan después de desde y hasta hasta.
+        """
+        activas = self.activas_en(desde)
+        primero = bisect_right(self.inicios, desde)
+        ultimo = bisect_right(self.inicios, hasta)
+        activas.extend(self.ids_por_inicio[primero:ultimo])
+        return activas
+
+    def activa(self, id_instancia, desde, hasta=None):
+        """Indica si una instancia estaba activa en un instante o en algún momento de [desde, hasta]"""
+        ventana = self.ventanas.get(id_instancia)
+        hasta = desde if hasta is None else hasta
+        return ventana is not None and ventana[0] <= hasta and desde <= ventana[1]
+
+def indice_vigencia(instancias=None, version=None):
+    """
+    Índice de vigencia de las instancias guardadas. Se reutiliza mientras las instancias
+    no cambien. Si ya se leyeron, se pasan en instancias junto con la firma de versiones
+    (firma_versiones('instancias')) leída antes de leerlas: si cambian entre una lectura
+    y otra, el índice queda guardado con una firma que ya no es la vigente y no con la
+    nueva. Sin la firma el índice se arma pero no se guarda.
+    """
+    if instancias is None:
+        # La firma se lee antes que los datos, por la misma razón
+        version = firma_versiones('instancias')
+        instancias = crear_manejador('instancias').iterar()
+    elif version is None:
+        return _construir_indice(instancias)
+
+    indice = cache_datos.obtener('indice:vigencia', version)
+    if indice is not None:
+        return indice
+
+    indice = _construir_indice(instancias)
+    # Costo aproximado en memoria: unas pocas tuplas por instancia
+    cache_datos.guardar('indice:vigencia', version, indice, 200 * len(indice.ventanas))
+    return indice
+
+def _construir_indice(instancias):
+    ventanas = {}
+    for instancia in instancias:
+        # Con ids repetidos gana la primera aparición, como en la facturación
+        ventanas.setdefault(str(instancia.get("id")), ventana_instancia(instancia))
+    return IndiceVigencia(ventanas)
@@ -6,6 +6,7 @@ app_name = 'sistema_web'
 urlpatterns = [
     path('', views.inicio, name='inicio'),
     path('cargar-xml/', views.cargar_xml, name='cargar_xml'),
+    path('estado-carga/<str:id_carga>/', views.estado_carga, name='estado_carga'),
     path('ver-datos/', views.ver_datos, name='ver_datos'),
     path('crear-datos/', views.crear_datos, name='crear_datos'),
     path('generar-facturas/', views.generar_facturas, name='generar_facturas'),
@@ -1,13 +1,77 @@
+import json
+import threading
+from collections import OrderedDict
+
 import requests
 import xmltodict
 from django.shortcuts import render, redirect
 from django.contrib import messages
 
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
 from .generador_pdf import GeneradorPDF
 
+try:
+    import msgpack
+except ImportError:
+    # msgpack es opcional: sin él las respuestas de la API se piden en JSON
+    msgpack = None
+
 API_URL = "http://127.0.0.1:5000"
 
+# Formato en que se piden las respuestas de la API; se evita generar y volver a
+# interpretar el XML en cada página
+ACCEPT_API = 'application/msgpack, application/json;q=0.9' if msgpack else 'application/json'
+
+def decodificar(content_type, contenido):
+    """Decodifica el cuerpo de una respuesta de la API (MessagePack, JSON o XML)"""
+    tipo = content_type.split(';')[0].strip()
+    if tipo == 'application/msgpack':
+        return msgpack.unpackb(contenido)
+    if tipo == 'application/json':
+        return json.loads(contenido)
+    return xmltodict.parse(contenido)
+
+def leer_respuesta(respuesta):
+    """Decodifica una respuesta de la API según su Content-Type"""
+    return decodificar(respuesta.headers.get('Content-Type', ''), respuesta.content)
+
+# Últimas respuestas de las consultas GET a la API con su ETag:
+# (ruta, parámetros) -> (etag, content_type, contenido)
+RESPUESTAS_GUARDADAS = 128
+_respuestas = OrderedDict()
+_lock_respuestas = threading.Lock()
+
+def consultar_api(ruta, params=None):
+    """
+    GET condicional a la API: si ya se tiene la respuesta de esa consulta se envía su
+    ETag y, cuando la API contesta 304, se reutiliza sin volver a descargarla.
+    Retorna (código de estado, respuesta decodificada o None).
+    """
+    clave = (ruta, tuple(sorted((params or {}).items())))
+    headers = {'Accept': ACCEPT_API}
+    with _lock_respuestas:
+        guardada = _respuestas.get(clave)
+    if guardada:
+        headers['If-None-Match'] = guardada[0]
+    
+    respuesta = requests.get(f"{API_URL}{ruta}", params=params, headers=headers)
+    if respuesta.status_code == 304 and guardada:
+        with _lock_respuestas:
+            if clave in _respuestas:
+                _respuestas.move_to_end(clave)
+        return 200, decodificar(guardada[1], guardada[2])
+    
+    etag = respuesta.headers.get('ETag')
+    if respuesta.status_code == 200 and etag:
+        with _lock_respuestas:
+            _respuestas[clave] = (etag, respuesta.headers.get('Content-Type', ''), respuesta.content)
+            _respuestas.move_to_end(clave)
+            while len(_respuestas) > RESPUESTAS_GUARDADAS:
+                _respuestas.popitem(last=False)
+    if respuesta.status_code != 200:
+        return respuesta.status_code, None
+    return respuesta.status_code, leer_respuesta(respuesta)
+
 
 def inicio(request):
 
@@ -20,8 +84,6 @@ def cargar_xml(request):
         archivo = request.FILES.get('archivo')
         
         if archivo:
-            contenido_xml = archivo.read().decode('utf-8')
-            
             # Determinar endpoint según el tipo
             if tipo == 'configuracion':
                 endpoint = f"{API_URL}/crearConfiguracion"
@@ -31,17 +93,26 @@ def cargar_xml(request):
                 messages.error(request, "Tipo de archivo no válido")
                 return render(request, 'sistema_web/cargar_xml.html')
             
-            # Enviar XML a la API
-            headers = {'Content-Type': 'application/xml'}
-            respuesta = requests.post(endpoint, data=contenido_xml, headers=headers)
+            # Enviar XML a la API como carga asíncrona: la API responde enseguida con el
+            # id de la carga y la página consulta su avance (ver estado_carga). El archivo
+            # se reenvía por bloques tal como se subió, sin leerlo completo en memoria
+            headers = {'Content-Type': 'application/xml', 'Accept': ACCEPT_API}
+            respuesta = requests.post(endpoint, data=archivo, headers=headers,
+                                      params={'asincrono': 1})
             
-            if respuesta.status_code == 200:
+            if respuesta.status_code == 202:
+                resultado = leer_respuesta(respuesta)
+                return render(request, 'sistema_web/cargar_xml.html', {
+                    'id_carga': resultado['respuesta']['id_carga'],
+                    'nombre_archivo': archivo.name
+                })
+            elif respuesta.status_code == 200:
                 # Parsear respuesta XML
-                resultado = xmltodict.parse(respuesta.content)
+                resultado = leer_respuesta(respuesta)
                 messages.success(request, f"Archivo cargado exitosamente: {resultado}")
                 return redirect('sistema_web:ver_datos')
             else:
-                resultado = xmltodict.parse(respuesta.content)
+                resultado = leer_respuesta(respuesta)
                 messages.error(request, f"Error al cargar archivo: {resultado}")
         else:
             messages.error(request, "Debe seleccionar un archivo")
@@ -49,27 +120,76 @@ def cargar_xml(request):
     return render(request, 'sistema_web/cargar_xml.html')
 
 
-def ver_datos(request):
-    """Página para ver datos del sistema (recursos, categorías, etc.)"""
-    tipo = request.GET.get('tipo', 'recursos')  # Por defecto muestra recursos
+def estado_carga(request, id_carga):
+    """Avance de una carga asíncrona, en JSON para la página de carga"""
+    try:
+        respuesta = requests.get(f"{API_URL}/estadoCarga/{id_carga}", headers={'Accept': ACCEPT_API})
+        resultado = leer_respuesta(respuesta)['respuesta']
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=502)
     
-    # Consultar datos de la API
-    respuesta = requests.get(f"{API_URL}/consultarDatos", params={'tipo': tipo})
+    if 'carga' not in resultado:
+        return JsonResponse({'error': resultado.get('error', 'Respuesta inválida')}, status=404)
+    return JsonResponse(resultado['carga'])
+
+
+# Registros por página en ver_datos y ver_facturas
+REGISTROS_POR_PAGINA = 50
+
+def numero_pagina(request):
+    """Número de página pedido (?pagina=), desde 1"""
+    try:
+        return max(int(request.GET.get('pagina', 1)), 1)
+    except ValueError:
+        return 1
+
+def consultar_pagina(tipo, pagina, **params):
+    """
+    Consulta a la API solo una página de REGISTROS_POR_PAGINA items de un tipo; params
+    son filtros o campos de /consultarDatos. Retorna (items, hay_mas).
+    """
+    estado, resultado = consultar_api("/consultarDatos", {
+        'tipo': tipo,
+        'offset': (pagina - 1) * REGISTROS_POR_PAGINA,
+        'limit': REGISTROS_POR_PAGINA,
+        **params
+    })
     
     datos = []
-    if respuesta.status_code == 200:
-        # Parsear respuesta XML
-        resultado = xmltodict.parse(respuesta.content)
+    hay_mas = False
+    if estado == 200:
         # Extraer datos según el tipo
         if 'respuesta' in resultado and tipo in resultado['respuesta']:
-            tipo_singular = tipo[:-1]  # 'recursos' -> 'recurso'
-            datos_raw = resultado['respuesta'][tipo].get(tipo_singular, [])
+            # Un solo elemento por item, con el nombre en singular ('recursos' -> 'recurso')
+            datos_raw = next(iter((resultado['respuesta'][tipo] or {}).values()), [])
             # Asegurar que sea una lista
             datos = datos_raw if isinstance(datos_raw, list) else [datos_raw] if datos_raw else []
+            paginacion = resultado['respuesta'].get('paginacion') or {}
+            hay_mas = paginacion.get('hay_mas') == 'true'
+    return datos, hay_mas
+
+def contexto_paginacion(pagina, datos, hay_mas):
+    """Variables de la plantilla para los enlaces de página y el rango mostrado"""
+    return {
+        'pagina': pagina,
+        'pagina_anterior': pagina - 1 if pagina > 1 else None,
+        'pagina_siguiente': pagina + 1 if hay_mas else None,
+        'primer_registro': (pagina - 1) * REGISTROS_POR_PAGINA + 1,
+        'ultimo_registro': (pagina - 1) * REGISTROS_POR_PAGINA + len(datos),
+    }
+
+def ver_datos(request):
+    """Página para ver datos del sistema (recursos, categorías, etc.), de a una página"""
+    tipo = request.GET.get('tipo', 'recursos')  # Por defecto muestra recursos
+    pagina = numero_pagina(request)
+    
+    # Consultar solo la página pedida a la API
+    datos, hay_mas = consultar_pagina(tipo, pagina)
     
     context = {
         'tipo': tipo,
         'datos': datos,
+        **contexto_paginacion(pagina, datos, hay_mas),
         'tipos_disponibles': ['recursos', 'categorias', 'clientes', 'instancias', 'consumos', 'facturas']
     }
     
@@ -131,15 +251,15 @@ def crear_datos(request):
             return render(request, 'sistema_web/crear_datos.html', {'errores': errores})
         
         # Enviar a la API
-        headers = {'Content-Type': 'application/xml'}
+        headers = {'Content-Type': 'application/xml', 'Accept': ACCEPT_API}
         respuesta = requests.post(endpoint, data=xml_data, headers=headers)
         
         if respuesta.status_code == 200:
-            resultado = xmltodict.parse(respuesta.content)
+            resultado = leer_respuesta(respuesta)
             messages.success(request, "Dato creado exitosamente")
             return redirect('sistema_web:ver_datos')
         else:
-            resultado = xmltodict.parse(respuesta.content)
+            resultado = leer_respuesta(respuesta)
             errores = resultado.get('respuesta', {}).get('error', 'Error desconocido')
             messages.error(request, f"Error: {errores}")
     
@@ -159,32 +279,29 @@ def generar_facturas(request):
         </periodo>"""
         
         # Enviar a la API
-        headers = {'Content-Type': 'application/xml'}
+        headers = {'Content-Type': 'application/xml', 'Accept': ACCEPT_API}
         respuesta = requests.post(f"{API_URL}/generarFactura", data=xml_data, headers=headers)
         
         if respuesta.status_code == 200:
-            resultado = xmltodict.parse(respuesta.content)
+            resultado = leer_respuesta(respuesta)
             messages.success(request, f"Facturas generadas: {resultado}")
             return redirect('sistema_web:ver_facturas')
         else:
-            resultado = xmltodict.parse(respuesta.content)
+            resultado = leer_respuesta(respuesta)
             messages.error(request, f"Error: {resultado}")
     
     return render(request, 'sistema_web/generar_facturas.html')
 
 
 def ver_facturas(request):
-    """Página para ver todas las facturas generadas"""
-    respuesta = requests.get(f"{API_URL}/consultarDatos", params={'tipo': 'facturas'})
+    """Página para ver las facturas generadas, de a una página"""
+    pagina = numero_pagina(request)
+    # Sin el detalle de consumos: la lista solo muestra los datos de cada factura
+    facturas, hay_mas = consultar_pagina('facturas', pagina,
+                                         campos='id,nit_cliente,nombre_cliente,fecha_emision,monto_total')
     
-    facturas = []
-    if respuesta.status_code == 200:
-        resultado = xmltodict.parse(respuesta.content)
-        if 'respuesta' in resultado and 'facturas' in resultado['respuesta']:
-            facturas_raw = resultado['respuesta']['facturas'].get('factura', [])
-            facturas = facturas_raw if isinstance(facturas_raw, list) else [facturas_raw] if facturas_raw else []
-    
-    return render(request, 'sistema_web/ver_facturas.html', {'facturas': facturas})
+    context = {'facturas': facturas, **contexto_paginacion(pagina, facturas, hay_mas)}
+    return render(request, 'sistema_web/ver_facturas.html', context)
 
 
 def reportes(request):
@@ -221,22 +338,16 @@ def reportes(request):
             # Generar PDF de factura específica
             id_factura = request.POST.get('id_factura')
             
-            # Consultar la factura desde la API
-            respuesta = requests.get(f"{API_URL}/consultarDatos", params={'tipo': 'facturas'})
+            # Consultar solo esa factura a la API (el filtro por id usa el índice)
+            estado, resultado = consultar_api("/consultarDatos", {'tipo': 'facturas', 'id': id_factura})
             
-            if respuesta.status_code == 200:
-                resultado = xmltodict.parse(respuesta.content)
-                facturas = resultado.get('respuesta', {}).get('facturas', {}).get('factura', [])
+            if estado == 200:
+                facturas = (resultado.get('respuesta', {}).get('facturas') or {}).get('factura', [])
                 
                 if not isinstance(facturas, list):
                     facturas = [facturas] if facturas else []
                 
-                # Buscar la factura específica
-                factura = None
-                for f in facturas:
-                    if str(f.get('id')) == str(id_factura):
-                        factura = f
-                        break
+                factura = facturas[0] if facturas else None
                 
                 if factura:
                     # Generar PDF
@@ -257,24 +368,28 @@ def reportes(request):
             fecha_inicio = request.POST.get('fecha_inicio')
             fecha_fin = request.POST.get('fecha_fin')
             
-            # Construir datos para el reporte de ventas
+            # Consultar el reporte de ventas del periodo a la API
+            estado, resultado = consultar_api("/reporteVentas",
+                                              {'fecha_inicio': fecha_inicio, 'fecha_fin': fecha_fin})
+            
+            if estado != 200:
+                messages.error(request, "Error al consultar el reporte de ventas")
+                return render(request, 'sistema_web/reportes.html')
+            
+            resultado = resultado.get('respuesta') or {}
+            if 'error' in resultado:
+                messages.error(request, resultado['error'])
+                return render(request, 'sistema_web/reportes.html')
+            
+            top_recursos = (resultado.get('top_recursos') or {}).get('recurso', [])
+            if not isinstance(top_recursos, list):
+                top_recursos = [top_recursos] if top_recursos else []
+            
             datos_ventas = {
-                'periodo': {
-                    'fecha_inicio': fecha_inicio,
-                    'fecha_fin': fecha_fin
-                },
-                'resumen': {
-                    'total_facturas': '5',
-                    'ingresos_totales': '1500.00'
-                },
-                'top_recursos': [
-                    {'nombre': 'CPU', 'abreviatura': 'CPU', 'total_tiempo': '100', 'ingresos': '500.00'},
-                    {'nombre': 'RAM', 'abreviatura': 'RAM', 'total_tiempo': '200', 'ingresos': '800.00'},
-                ],
-                'top_categorias': [
-                    {'nombre': 'Servidor Web', 'total_instancias': '3', 'ingresos': '900.00'},
-                    {'nombre': 'Base de Datos', 'total_instancias': '2', 'ingresos': '600.00'},
-                ]
+                'periodo': resultado.get('periodo', {}),
+                'resumen': resultado.get('resumen', {}),
+                'top_recursos': top_recursos,
+                'top_categorias': []
             }
             
             # Generar PDF